@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+from cache import LRUCache, MISSING
+from metrics import metrics
+
+# คัดคำสั่งออกตั้งแต่หน้าประตู (ก่อนแตะฐานข้อมูล) กันสแปมรายคนและกันคนล้นทั้งบอทตอนคนเข้าพร้อมกัน
+
+# token bucket ต่อ (คน, คำสั่ง): (เติมกี่ token ต่อวินาที, เก็บได้สูงสุดกี่ token)
+DEFAULT_RATE = (0.5, 5)
+COMMAND_RATES = {
+    # snatch หนึ่งรอบกินเวลาได้ถึง ~9 วินาที (รอปุ่มโผล่ + รอกด) ให้มีรอบค้างได้ทีละอันต่อคน
+    "snowflake snatch": (0.1, 1),
+    "iceberg export": (1 / 60, 1),
+    "iceberg history": (0.2, 3),
+    "iceberg dashboard": (1 / 30, 1),
+    "iceberg season reset": (1 / 30, 1),
+}
+BUCKET_CACHE_SIZE = 65536  # bucket ที่หลุดจาก cache ก็แค่กลับมาเต็มถัง
+
+# ประตูรวมของทั้งบอท
+GATE_LIMIT = 64        # handler ที่ทำงานพร้อมกันได้สูงสุด
+GATE_QUEUE = 256       # รอคิวได้สูงสุดกี่คำสั่ง เกินนี้ตีกลับทันที
+GATE_TIMEOUT = 1.0     # วินาที รอคิวนานกว่านี้ตีกลับ (ยังต้องมีเวลาเหลือตอบภายใน 3 วินาที)
+
+REJECT_RATE = "rate"
+REJECT_BUSY = "busy"
+
+
+class RateLimiter:
+    """token bucket ในหน่วยความจำ เก็บแค่ [token ที่เหลือ, เวลาที่คำนวณล่าสุด] ต่อ key"""
+
+    def __init__(self, rates=COMMAND_RATES, default=DEFAULT_RATE, maxsize=BUCKET_CACHE_SIZE):
+        self.rates = rates
+        self.default = default
+        self._buckets = LRUCache(maxsize)
+
+    def take(self, user_id, command):
+        """หัก 1 token คืน 0 ถ้าผ่าน ไม่งั้นคืนจำนวนวินาทีที่ต้องรอ"""
+        rate, burst = self.rates.get(command, self.default)
+        now = time.monotonic()
+        key = (user_id, command)
+        bucket = self._buckets.get(key)
+        if bucket is MISSING:
+            self._buckets.put(key, [burst - 1, now])
+            return 0.0
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return (1 - tokens) / rate
+        bucket[0] = tokens - 1
+        return 0.0
+
+    def refund(self, user_id, command):
+        """คืน token ที่เพิ่งหักไป (ผ่านด่านนี้แต่ไปติดด่านถัดไป)"""
+        bucket = self._buckets.get((user_id, command))
+        if bucket is not MISSING:
+            bucket[0] = min(self.rates.get(command, self.default)[1], bucket[0] + 1)
+
+
+class ConcurrencyGate:
+    """จำกัดจำนวน handler ที่ทำงานพร้อมกัน คิวเต็มหรือรอนานเกินไปก็ตีกลับ แทนที่จะช้าลงทั้งบอท"""
+
+    def __init__(self, limit=GATE_LIMIT, max_queue=GATE_QUEUE, timeout=GATE_TIMEOUT):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+
+    async def acquire(self):
+        """True = ได้ที่แล้ว (ต้อง release ตอนจบ), False = ตีกลับ"""
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+            metrics.observe_queue(self.waiting)
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+                metrics.queue_wait.observe(time.perf_counter() - started)
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        metrics.inflight = self.active
+        return True
+
+    def release(self):
+        self.active -= 1
+        metrics.inflight = self.active
+        self._semaphore.release()
+
+
+class Admission:
+    """rate limit รายคนก่อน (ถูกที่สุด) แล้วค่อยขอที่จากประตูรวม"""
+
+    def __init__(self, limiter=None, gate=None, exempt=()):
+        self.limiter = limiter or RateLimiter()
+        self.gate = gate or ConcurrencyGate()
+        self.exempt = set(exempt)  # user id ที่ไม่โดน rate limit (เจ้าของบอท)
+        metrics.gate = self.gate
+
+    async def admit(self, user_id, command):
+        """คืน (None, 0) ถ้าผ่าน ไม่งั้นคืน (เหตุผล, วินาทีที่ควรรอ)"""
+        if user_id not in self.exempt:
+            retry = self.limiter.take(user_id, command)
+            if retry:
+                metrics.observe_rejected(command, REJECT_RATE)
+                return REJECT_RATE, retry
+        if not await self.gate.acquire():
+            metrics.observe_rejected(command, REJECT_BUSY)
+            return REJECT_BUSY, self.gate.timeout
+        return None, 0
+
+    def release(self):
+        self.gate.release()
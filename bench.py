@@ -0,0 +1,313 @@
+"""วัดความเร็ว handler ของบอทแบบ offline (ไม่ต้องมี token) ด้วย Interaction ปลอมกับฐานข้อมูลชั่วคราว
+
+    python bench.py --users 200 --rounds 5
+    python bench.py --users 200 --rounds 5 --write-behind
+    python bench.py --users 200 --rounds 5 --link-check --forum-delay 0.05
+    python bench.py --users 500 --rounds 5 --admission --snatch-delay 2
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+
+from aiohttp import web
+
+import main
+from linkcheck import LinkChecker
+from metrics import metrics
+from storage import Storage
+
+
+# --- FAKE DISCORD LAYER ---
+class FakeUser:
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.bot = bot
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+
+class FakeClient:
+    shard_count = 1
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    def get_shard(self, shard_id):
+        return None
+
+
+class FakeResponse:
+    def __init__(self):
+        self.done = False
+        self.sent = []
+
+    def is_done(self):
+        return self.done
+
+    async def send_message(self, content=None, *, embed=None, view=None, ephemeral=False):
+        self.done = True
+        self.sent.append((content, embed, ephemeral))
+
+    async def defer(self, *, ephemeral=False, thinking=False):
+        self.done = True
+
+    async def edit_message(self, *, content=None, embed=None, view=None):
+        self.done = True
+
+
+class FakeFollowup:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content=None, *, embed=None, view=None, ephemeral=False, wait=True):
+        self.sent.append((content, embed, ephemeral))
+        return None
+
+
+class FakeInteraction:
+    """มีแค่ส่วนที่ handler ใช้จริง ปุ่มคว้าหิมะจะถูก "กด" หลังเวลาตอบสนองที่สุ่มไว้"""
+    ids = itertools.count(1)
+
+    def __init__(self, bench, guild_id, user, command=None):
+        self.id = next(self.ids)
+        self.bench = bench
+        self.guild_id = guild_id
+        self.channel_id = guild_id  # ห้องเดียวต่อ guild (digest แจ้ง Admin รวมตามห้อง)
+        self.user = user
+        self.command = command
+        self.client = bench.client
+        self.response = FakeResponse()
+        self.followup = FakeFollowup()
+        self.extras = {}
+
+    async def delete_original_response(self):
+        pass
+
+    async def edit_original_response(self, *, content=None, embed=None, view=None):
+        for item in view.children if view is not None else ():
+            if isinstance(item, main.SnatchButton):
+                self.bench.tasks.append(asyncio.create_task(self.click(item)))
+
+    async def click(self, button):
+        await asyncio.sleep(random.uniform(0, self.bench.reaction))
+        await button.callback(FakeInteraction(self.bench, self.guild_id, self.user))
+
+
+# --- STAND-IN FORUM ---
+async def start_forum(delay):
+    """HTTP server จำลองฟอรัม: ทุก tid มีกระทู้อยู่จริง ตอบช้าตาม delay"""
+    async def showthread(request):
+        await asyncio.sleep(delay)
+        return web.Response(text=f"<html><title>thread {request.query.get('tid')}</title></html>", content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/showthread.php", showthread)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/showthread.php?tid="
+
+
+# --- SCENARIOS ---
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.reaction = args.reaction
+        self.client = FakeClient(args.latency)
+        self.latencies = {}   # ชื่อคำสั่ง -> [วินาที]
+        self.rejected = {}    # (ชื่อคำสั่ง, เหตุผล) -> จำนวน
+        self.peak_tasks = 0   # จำนวน asyncio task สูงสุดระหว่างรัน (รวม task จำลองการกดปุ่มของผู้เล่น)
+        self.peak_timers = 0  # deadline ที่ค้างใน timers สูงสุด
+        self.peak_outbox = 0  # ข้อความที่ค้างใน outbox สูงสุด
+        self.tasks = []
+        self.next_tid = 0
+
+    def link(self):
+        self.next_tid += 1
+        return f"{main.TARGET_URL}{self.next_tid}"
+
+    async def call(self, name, command, guild_id, user, *args):
+        interaction = FakeInteraction(self, guild_id, user, command)
+        started = interaction.extras["started_at"] = time.perf_counter()
+        # ผ่านด่านเดียวกับ MetricsTree.interaction_check
+        if self.args.admission:
+            reason, _ = await main.admission.admit(user.id, name)
+            if reason is not None:
+                self.rejected[name, reason] = self.rejected.get((name, reason), 0) + 1
+                return interaction
+        main.schedule_auto_defer(interaction)
+        try:
+            await command.callback(interaction, *args)
+        finally:
+            main.cancel_auto_defer(interaction)
+            if self.args.admission:
+                main.admission.release()
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        return interaction
+
+    async def iceberg_player(self, guild_id, user):
+        await self.call("iceberg start", main.start, guild_id, user, self.link())
+        for _ in range(self.args.rounds):
+            await self.call("iceberg submit", main.submit, guild_id, user, self.link())
+
+    async def snow_player(self, guild_id, user):
+        await self.call("snowflake start", main.snow_start, guild_id, user, self.link())
+        for _ in range(self.args.rounds):
+            await self.call("snowflake snatch", main.snow_snatch, guild_id, user, self.link())
+            # ผู้เล่นจริงรอให้รอบจบก่อนค่อยส่งลิงก์ใหม่
+            while (guild_id, user.id) in main.snatching:
+                await asyncio.sleep(0.01)
+
+    async def vault_pair(self, guild_id, user1, user2):
+        # ทั้งคู่กดสร้างทีมพร้อมกัน ต้องได้ทีมเดียว
+        await asyncio.gather(
+            self.call("vault create", main.vault_create, guild_id, user1, user2),
+            self.call("vault create", main.vault_create, guild_id, user2, user1),
+        )
+        for _ in range(self.args.rounds):
+            await asyncio.gather(
+                self.call("vault submit", main.vault_submit, guild_id, user1, self.link()),
+                self.call("vault submit", main.vault_submit, guild_id, user2, self.link()),
+            )
+
+    def guild_of(self, index):
+        # คู่ vault (ผู้เล่นลำดับ 2k กับ 2k+1) อยู่ guild เดียวกันเสมอ
+        return 1 + (index // 2) % self.args.guilds
+
+    async def run(self):
+        users = [FakeUser(1000 + i) for i in range(self.args.users)]
+        jobs = []
+        for index, user in enumerate(users):
+            jobs.append(self.iceberg_player(self.guild_of(index), user))
+            jobs.append(self.snow_player(self.guild_of(index), user))
+        for index in range(0, len(users) - 1, 2):
+            jobs.append(self.vault_pair(self.guild_of(index), users[index], users[index + 1]))
+
+        started = time.perf_counter()
+        sampler = asyncio.create_task(self.sample_tasks())
+        await asyncio.gather(*jobs)
+        # snatch ตอบกลับก่อนรอบจบ รอให้ timers ปล่อยปุ่ม/หมดเวลาให้ครบทุกรอบ แล้วรอ outbox ส่งผลรอบให้หมด
+        while (main.pending_snatches or main.timers.running or not main.outbox.idle
+               or not all(task.done() for task in self.tasks)):
+            await asyncio.sleep(0.01)
+        await main.digest.flush()
+        while not main.outbox.idle:
+            await asyncio.sleep(0.01)
+        sampler.cancel()
+        return time.perf_counter() - started
+
+    async def sample_tasks(self):
+        while True:
+            self.peak_tasks = max(self.peak_tasks, len(asyncio.all_tasks()))
+            self.peak_timers = max(self.peak_timers, len(main.timers))
+            self.peak_outbox = max(self.peak_outbox, len(main.outbox))
+            await asyncio.sleep(0.01)
+
+    async def check(self):
+        """ทีม vault ที่ยังไม่จบต้องนับรอบครบทุกรอบ (ไม่หาย ไม่นับซ้ำ)
+        ถ้ามีคำสั่งถูกตีกลับ ทีมอาจไม่ได้สร้างหรือนับไม่ครบ ก็เช็คได้แค่ว่าไม่นับเกิน"""
+        shed = bool(self.rejected)
+        problems = []
+        for index in range(0, self.args.users - 1, 2):
+            user1 = 1000 + index
+            team = await main.db.get_vault_team(self.guild_of(index), user1)
+            if team is None:
+                if not shed:
+                    problems.append(f"team of {user1} missing")
+            elif not team[7] and (team[5] > self.args.rounds if shed else team[5] != self.args.rounds):
+                problems.append(f"team {team[0]}: attempts {team[5]} != {self.args.rounds}")
+        return problems
+
+
+# --- REPORT ---
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def report(bench, elapsed, problems):
+    total = sum(len(v) for v in bench.latencies.values())
+    print(f"{total} commands in {elapsed:.2f}s = {total / elapsed:.0f} cmd/s "
+          f"(users={bench.args.users} guilds={bench.args.guilds} rounds={bench.args.rounds} "
+          f"write_behind={bench.args.write_behind})")
+    print()
+    print(f"{'command':<20}{'n':>7}{'p50':>10}{'p99':>10}{'max':>10}")
+    for name, values in sorted(bench.latencies.items()):
+        print(f"{name:<20}{len(values):>7}{percentile(values, 0.5) * 1000:>8.2f}ms"
+              f"{percentile(values, 0.99) * 1000:>8.2f}ms{max(values) * 1000:>8.2f}ms")
+    print()
+    # เวลารอคิว worker = DB contention (มี connection เดียว ทุกอย่างต่อแถวกัน)
+    print(f"{'db helper':<24}{'n':>7}{'run avg':>10}{'wait avg':>10}{'wait p99':>10}")
+    for name, hist in sorted(metrics.db.items(), key=lambda item: -item[1].sum):
+        wait = metrics.db_wait[name]
+        print(f"{name:<24}{hist.count:>7}{hist.sum / hist.count * 1000:>8.2f}ms"
+              f"{wait.sum / wait.count * 1000:>8.2f}ms{wait.quantile(0.99) * 1000:>8.0f}ms")
+    print()
+    if bench.args.admission:
+        rejected = ", ".join(f"{name} {reason}={n}" for (name, reason), n in sorted(bench.rejected.items()))
+        print(f"admission: rejected {rejected or '-'}; queue peak {metrics.queue_peak}, "
+              f"queue wait p99 <= {metrics.queue_wait.quantile(0.99) * 1000:.0f}ms")
+    print(f"peak asyncio tasks {bench.peak_tasks}, peak pending timers {bench.peak_timers}")
+    print(f"outbox: sent {main.outbox.sent}, dropped {main.outbox.dropped}, peak queued {bench.peak_outbox}")
+    if metrics.deferred:
+        print("auto-deferred: " + ", ".join(f"{name}={n}" for name, n in sorted(metrics.deferred.items())))
+    if metrics.link_check.count:
+        hist = metrics.link_check
+        print(f"link check: {hist.count} requests, avg {hist.sum / hist.count * 1000:.1f}ms, "
+              f"p99 <= {hist.quantile(0.99) * 1000:.0f}ms")
+    print("consistency: " + ("ok" if not problems else "; ".join(problems[:10])))
+
+
+async def amain(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        main.db = Storage(os.path.join(tmp, "bench.db"), write_behind=args.write_behind)
+        main.SNATCH_DELAY = (0, args.snatch_delay)
+        await main.db.open()
+        main.outbox.start()
+        forum = None
+        if args.link_check:
+            forum, base_url = await start_forum(args.forum_delay)
+            main.link_checker = LinkChecker(base_url)
+            await main.link_checker.start()
+        bench = Bench(args)
+        try:
+            elapsed = await bench.run()
+            problems = await bench.check()
+        finally:
+            await main.outbox.close()
+            await main.db.close()
+            if forum is not None:
+                await main.link_checker.close()
+                await forum.cleanup()
+        report(bench, elapsed, problems)
+        return 1 if problems else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="offline benchmark ของ handler ทั้งหมด")
+    parser.add_argument("--users", type=int, default=100, help="จำนวนผู้เล่นพร้อมกัน (จับคู่ vault ทีละ 2 คน)")
+    parser.add_argument("--guilds", type=int, default=1, help="จำนวน guild ที่แบ่งผู้เล่นไป")
+    parser.add_argument("--rounds", type=int, default=3, help="จำนวนครั้งที่แต่ละคน submit/snatch")
+    parser.add_argument("--write-behind", action="store_true", help="เปิดโหมด write-behind ของ Storage")
+    parser.add_argument("--reaction", type=float, default=0.05, help="เวลากดปุ่มคว้าหิมะสูงสุด (วินาที)")
+    parser.add_argument("--snatch-delay", type=float, default=0.0, help="เวลารอก่อนปุ่มโผล่สูงสุด (วินาที)")
+    parser.add_argument("--latency", type=float, default=0.05, help="gateway latency ปลอม (วินาที)")
+    parser.add_argument("--link-check", action="store_true", help="เปิดการเช็คลิงก์กับฟอรัมจำลองในเครื่อง")
+    parser.add_argument("--forum-delay", type=float, default=0.02, help="เวลาตอบของฟอรัมจำลอง (วินาที)")
+    parser.add_argument("--admission", action="store_true", help="ผ่าน rate limit และประตูรวมก่อนเรียก handler")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    random.seed(args.seed)
+    raise SystemExit(asyncio.run(amain(args)))
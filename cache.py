@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+
+# ค่าที่บอกว่า "ไม่มีใน cache" (แยกจาก None ที่แปลว่า "ไม่มีแถวนี้ในฐานข้อมูล")
+MISSING = object()
+
+
+class LRUCache:
+    """cache แบบ LRU จำกัดจำนวน พร้อมตัวนับ hit/miss (ใช้จาก event loop thread เท่านั้น)"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class TTLCache(LRUCache):
+    """LRUCache ที่ค่าหมดอายุเองหลัง ttl วินาที (ไว้เก็บผลที่ประกอบจากหลายตาราง อายุสั้นๆ ก็พอ)"""
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key):
+        entry = super().get(key)
+        if entry is MISSING:
+            return MISSING
+        expires, value = entry
+        if expires < time.monotonic():
+            self._data.pop(key, None)
+            self.hits -= 1
+            self.misses += 1
+            return MISSING
+        return value
+
+    def put(self, key, value):
+        super().put(key, (time.monotonic() + self.ttl, value))
@@ -0,0 +1,62 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import tempfile
+
+from storage import GAME_ICEBERG, GAME_SNOWFLAKE, GAME_VAULT
+
+# ส่งออกความคืบหน้าทุกเกมของ guild เป็นไฟล์ .gz ทีละก้อน (ไม่โหลดทั้งตารางเข้าหน่วยความจำ)
+EXPORT_FORMATS = ("csv", "jsonl")
+CSV_HEADER = ("game", "owner", "user_ids", "progress", "target", "completed", "links")
+
+
+def export_record(game, row, links):
+    """แปลงแถวรายงานของแต่ละเกมให้เป็นรูปแบบเดียวกัน"""
+    if game == GAME_VAULT:
+        team_id, user1_id, user2_id, attempts, target, completed = row
+        return {"game": game, "owner": team_id, "user_ids": [user1_id, user2_id], "progress": attempts,
+                "target": target, "completed": completed, "links": links}
+    if game == GAME_ICEBERG:
+        user_id, attempts, target, completed = row
+    else:
+        (user_id, attempts, completed), target = row, None
+    return {"game": game, "owner": str(user_id), "user_ids": [user_id], "progress": attempts,
+            "target": target, "completed": completed, "links": links}
+
+
+def write_records(text, writer, records):
+    if writer is None:
+        for record in records:
+            text.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return
+    for record in records:
+        writer.writerow((
+            record["game"], record["owner"], " ".join(map(str, record["user_ids"])), record["progress"],
+            "" if record["target"] is None else record["target"], record["completed"], " ".join(record["links"]),
+        ))
+
+
+async def export_progress(db, guild_id, fmt):
+    """เขียนความคืบหน้าของ guild ลงไฟล์ชั่วคราวแบบ gzip คืน (ไฟล์ที่ย้อนกลับไปต้นไฟล์แล้ว, จำนวนแถว)"""
+    out = tempfile.TemporaryFile()
+    text = io.TextIOWrapper(gzip.GzipFile(fileobj=out, mode="wb"), encoding="utf-8", newline="")
+    writer = csv.writer(text) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(CSV_HEADER)
+
+    count = 0
+    try:
+        for game in (GAME_ICEBERG, GAME_SNOWFLAKE, GAME_VAULT):
+            async for chunk in db.iter_progress(guild_id, game):
+                records = [export_record(game, row, links) for row, links in chunk]
+                # บีบอัดนอก event loop
+                await asyncio.to_thread(write_records, text, writer, records)
+                count += len(records)
+        text.close()  # ปิด gzip (เขียน trailer) แต่ไฟล์ชั่วคราวยังเปิดอยู่
+    except BaseException:
+        out.close()
+        raise
+    out.seek(0)
+    return out, count
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import aiohttp
+
+from cache import LRUCache, MISSING
+from metrics import metrics
+
+# เช็คว่ากระทู้ (tid) มีอยู่จริงบนฟอรัม ใช้ session เดียวทั้งบอท (connection pool) และ cache ผลตาม tid
+LINK_CHECK_TIMEOUT = 1.5       # วินาที ต้องจบก่อนงบ 3 วินาทีของ interaction
+LINK_CHECK_CONNECTIONS = 8     # connection พร้อมกันสูงสุดไปที่ฟอรัม
+LINK_CHECK_READ_BYTES = 65536  # อ่าน body แค่ส่วนหัวพอหาข้อความ error
+LINK_CACHE_SIZE = 8192
+LINK_TTL = 3600                # วินาที กระทู้ที่เจอแล้ว
+LINK_NEGATIVE_TTL = 60         # วินาที กระทู้ที่ไม่เจอ (เผื่อเพิ่งโพสต์)
+
+# MyBB ตอบ 200 พร้อมหน้า error เมื่อไม่มีกระทู้ ข้อความขึ้นกับภาษาของฟอรัม
+DEFAULT_MISSING_MARKERS = ("The specified thread does not exist.",)
+
+
+class LinkChecker:
+    def __init__(self, base_url, missing_markers=DEFAULT_MISSING_MARKERS, timeout=LINK_CHECK_TIMEOUT):
+        self.base_url = base_url
+        self.missing_markers = tuple(missing_markers)
+        self.timeout = timeout
+        self._session = None
+        self._cache = LRUCache(LINK_CACHE_SIZE)  # tid -> (หมดอายุเมื่อ, ผล)
+        self._inflight = {}                      # tid -> future ที่กำลังเช็คอยู่ (คนส่ง tid เดียวกันรอผลเดียวกัน)
+        metrics.caches["link_check"] = self._cache
+
+    async def start(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.timeout / 2),
+                connector=aiohttp.TCPConnector(limit=LINK_CHECK_CONNECTIONS, ttl_dns_cache=300),
+                headers={"User-Agent": "IcebergBot (+discord)"},
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def exists(self, tid):
+        """True = มีกระทู้, False = ไม่มี, None = เช็คไม่ได้ (timeout/ฟอรัมล่ม) ให้ถือว่าผ่านไปก่อน"""
+        cached = self._cache.get(tid)
+        if cached is not MISSING and cached[0] > time.monotonic():
+            return cached[1]
+        future = self._inflight.get(tid)
+        if future is None:
+            future = self._inflight[tid] = asyncio.ensure_future(self._fetch(tid))
+            future.add_done_callback(lambda _: self._inflight.pop(tid, None))
+        # คนที่รอถูกยกเลิกไป ไม่ต้องยกเลิกการเช็คที่คนอื่นรออยู่ด้วย
+        return await asyncio.shield(future)
+
+    async def _fetch(self, tid):
+        started = time.perf_counter()
+        try:
+            async with self._session.get(f"{self.base_url}{tid}") as resp:
+                if resp.status == 404:
+                    result = False
+                elif resp.status != 200:
+                    return None
+                else:
+                    body = (await resp.content.read(LINK_CHECK_READ_BYTES)).decode(resp.charset or "utf-8", errors="ignore")
+                    result = not any(marker in body for marker in self.missing_markers)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+        finally:
+            metrics.link_check.observe(time.perf_counter() - started)
+        ttl = LINK_TTL if result else LINK_NEGATIVE_TTL
+        self._cache.put(tid, (time.monotonic() + ttl, result))
+        return result
@@ -2,474 +2,915 @@ import discord
 from discord import app_commands
 import random
 import os
-import sqlite3
 import json
+import hashlib
+import io
+import math
+import time
 import asyncio
 
+from admission import Admission, REJECT_RATE
+from export import export_progress
+from linkcheck import LinkChecker, DEFAULT_MISSING_MARKERS
+from maintenance import Maintenance
+from metrics import metrics
+from outbox import Outbox, Digest, PRIORITY_DIGEST, DIGEST_MAX_LINES
+from responses import catalog
+from timers import TimerHeap
+from storage import (
+    Storage, GAME_ICEBERG, GAME_SNOWFLAKE, GAME_VAULT, parse_tid,
+    VAULT_NO_TEAM, VAULT_COMPLETED, VAULT_DUPLICATE, VAULT_PARTNER_DUPLICATE, VAULT_ALREADY_SENT, VAULT_ROUND,
+)
+
 # --- CONFIGURATION ---
 TOKEN = os.getenv('DISCORD_TOKEN') 
 TARGET_URL = "https://roleplayth.com/showthread.php?tid="
-ADMIN_ID = 432415629245415426  # ID ของ Matthew (Admin)
+ADMIN_ID = 432415629245415426  # ID ของ Matthew (เจ้าของบอท: เป็น Admin ทุก guild และตั้ง Admin ของแต่ละ guild ได้)
 DB_NAME = "iceberg_data.db"    # ชื่อไฟล์ฐานข้อมูล
-
-# --- DATABASE FUNCTIONS ---
-def init_db():
-    """สร้างตารางในฐานข้อมูลถ้ายังไม่มี"""
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        
-        # 1. ตาราง Iceberg
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS players (
-                user_id INTEGER PRIMARY KEY,
-                attempts INTEGER DEFAULT 0,
-                target_attempts INTEGER DEFAULT 10,
-                completed INTEGER DEFAULT 0,
-                links TEXT DEFAULT '[]'
-            )
-        ''')
-        
-        # 2. ตาราง Snowflakes
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS snowflakes (
-                user_id INTEGER PRIMARY KEY,
-                count INTEGER DEFAULT 0,
-                completed INTEGER DEFAULT 0,
-                links TEXT DEFAULT '[]'
-            )
-        ''')
-
-        # 3. ตาราง Vault
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vaults (
-                team_id TEXT PRIMARY KEY,
-                user1_id INTEGER,
-                user2_id INTEGER,
-                role_warmer INTEGER,
-                role_turner INTEGER,
-                attempts INTEGER DEFAULT 0,
-                target_attempts INTEGER DEFAULT 10,
-                completed INTEGER DEFAULT 0,
-                links TEXT DEFAULT '[]',
-                round_link_u1 TEXT,
-                round_link_u2 TEXT
-            )
-        ''')
-        conn.commit()
-
-# --- ICEBERG DB FUNCTIONS ---
-def get_player(user_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT attempts, target_attempts, completed, links FROM players WHERE user_id = ?", (user_id,))
-        return cursor.fetchone()
-
-def create_player(user_id, link, target):
-    with sqlite3.connect(DB_NAME) as conn:
-        links_json = json.dumps([link])
-        conn.execute("INSERT INTO players (user_id, attempts, target_attempts, completed, links) VALUES (?, 0, ?, 0, ?)", 
-                     (user_id, target, links_json))
-
-def update_player_progress(user_id, attempts, completed, links_list):
-    with sqlite3.connect(DB_NAME) as conn:
-        links_json = json.dumps(links_list)
-        conn.execute("UPDATE players SET attempts = ?, completed = ?, links = ? WHERE user_id = ?", 
-                     (attempts, 1 if completed else 0, links_json, user_id))
-
-def delete_player(user_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.execute("DELETE FROM players WHERE user_id = ?", (user_id,))
-
-def get_all_players():
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, attempts, target_attempts, completed FROM players")
-        return cursor.fetchall()
-
-# --- SNOWFLAKE DB FUNCTIONS ---
-def get_snow_player(user_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT count, completed, links FROM snowflakes WHERE user_id = ?", (user_id,))
-        return cursor.fetchone()
-
-def create_snow_player(user_id, link):
-    with sqlite3.connect(DB_NAME) as conn:
-        links_json = json.dumps([link])
-        conn.execute("INSERT INTO snowflakes (user_id, count, completed, links) VALUES (?, 0, 0, ?)", (user_id, links_json))
-
-def update_snow_progress(user_id, count, completed, links_list):
-    with sqlite3.connect(DB_NAME) as conn:
-        links_json = json.dumps(links_list)
-        conn.execute("UPDATE snowflakes SET count = ?, completed = ?, links = ? WHERE user_id = ?", 
-                     (count, 1 if completed else 0, links_json, user_id))
-
-def delete_snow_player(user_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.execute("DELETE FROM snowflakes WHERE user_id = ?", (user_id,))
-
-# --- VAULT DB FUNCTIONS ---
-def get_vault_team(user_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT team_id, user1_id, user2_id, role_warmer, role_turner, 
-                   attempts, target_attempts, completed, links, 
-                   round_link_u1, round_link_u2
-            FROM vaults WHERE user1_id = ? OR user2_id = ?
-        """, (user_id, user_id))
-        return cursor.fetchone()
-
-def create_vault_team(user1_id, user2_id, target):
-    team_id = f"{user1_id}_{user2_id}"
-    roles_config = random.choice([0, 1]) 
-    warmer_id = user1_id if roles_config == 0 else user2_id
-    turner_id = user2_id if roles_config == 0 else user1_id
-    
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.execute("""
-            INSERT INTO vaults (team_id, user1_id, user2_id, role_warmer, role_turner, 
-                                attempts, target_attempts, completed, links, round_link_u1, round_link_u2) 
-            VALUES (?, ?, ?, ?, ?, 0, ?, 0, '[]', NULL, NULL)
-        """, (team_id, user1_id, user2_id, warmer_id, turner_id, target))
-    return warmer_id, turner_id
-
-def update_vault_round_link(team_id, is_user1, link):
-    with sqlite3.connect(DB_NAME) as conn:
-        if is_user1:
-            conn.execute("UPDATE vaults SET round_link_u1 = ? WHERE team_id = ?", (link, team_id))
-        else:
-            conn.execute("UPDATE vaults SET round_link_u2 = ? WHERE team_id = ?", (link, team_id))
-
-def complete_vault_round(team_id, attempts, completed, links_list):
-    with sqlite3.connect(DB_NAME) as conn:
-        links_json = json.dumps(links_list)
-        conn.execute("""
-            UPDATE vaults SET attempts = ?, completed = ?, links = ?, 
-                              round_link_u1 = NULL, round_link_u2 = NULL 
-            WHERE team_id = ?
-        """, (attempts, 1 if completed else 0, links_json, team_id))
-
-def delete_vault_team(team_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        conn.execute("DELETE FROM vaults WHERE team_id = ?", (team_id,))
-
-def get_all_vaults():
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT user1_id, user2_id, attempts, target_attempts, completed FROM vaults")
-        return cursor.fetchall()
-
+WRITE_BEHIND = os.getenv('ICEBERG_WRITE_BEHIND') == '1'  # เขียนความคืบหน้าแบบรวม batch (ลด fsync ช่วงคนเยอะ)
+SYNC_GUILD_ID = os.getenv('SYNC_GUILD_ID')  # ตั้งไว้ = sync คำสั่งเข้า guild นี้ (อัปเดตทันที ไม่ต้องรอ global)
+METRICS_PORT = os.getenv('ICEBERG_METRICS_PORT')  # ตั้งไว้ = เปิด /metrics (Prometheus) ที่ 127.0.0.1:<port>
+SHARD_COUNT = os.getenv('SHARD_COUNT')  # ไม่ตั้ง = ให้ Discord บอกจำนวน shard ที่แนะนำ
+LINK_CHECK = os.getenv('LINK_CHECK') == '1'  # เช็คว่ากระทู้ที่ส่งมามีอยู่จริงบนฟอรัม
+LINK_CHECK_BASE_URL = os.getenv('LINK_CHECK_BASE_URL', TARGET_URL)  # เปลี่ยนไปชี้ server จำลองตอนทดสอบได้
+LINK_CHECK_MARKERS = os.getenv('LINK_CHECK_MARKERS')  # ข้อความในหน้าที่แปลว่า "ไม่มีกระทู้" คั่นด้วย |
+LEGACY_GUILD_ID = int(os.getenv('LEGACY_GUILD_ID') or 0) or None  # guild ที่รับข้อมูลจากไฟล์ฐานข้อมูลรุ่นก่อนมีหลาย guild (ต้องตั้งถ้ามีข้อมูลเก่า)
+BACKUP_DIR = os.getenv('ICEBERG_BACKUP_DIR', 'backups')  # โฟลเดอร์เก็บ backup อัตโนมัติ (ตั้งเป็นค่าว่าง = ปิด)
+MEMBERS_INTENT = os.getenv('MEMBERS_INTENT') == '1'  # privileged intent (ต้องเปิดใน Developer Portal ด้วย) ใช้กับคำสั่งแบบเลือกตาม role
+
+MESSAGE_LIMIT = 2000  # ตัวอักษรสูงสุดต่อข้อความของ Discord
+
+# --- DATABASE ---
+db = Storage(DB_NAME, write_behind=WRITE_BEHIND, legacy_guild_id=LEGACY_GUILD_ID)
+maintenance = Maintenance(db, BACKUP_DIR or None)
+
+def is_valid_link(link):
+    """ลิงก์ต้องเป็นกระทู้ของ TARGET_URL และมีเลข tid"""
+    return link.startswith(TARGET_URL) and parse_tid(link) is not None
+
+# --- LINK CHECK ---
+link_checker = LinkChecker(
+    LINK_CHECK_BASE_URL,
+    LINK_CHECK_MARKERS.split("|") if LINK_CHECK_MARKERS else DEFAULT_MISSING_MARKERS,
+) if LINK_CHECK else None
+
+async def link_exists(link):
+    """เช็คกระทู้กับฟอรัม เรียกหลังเช็คอย่างอื่นผ่านหมดแล้ว คำสั่งที่ถูกตีกลับจะได้ไม่ยิง request ทิ้งเปล่า
+    ปิดไว้หรือเช็คไม่ได้ (None) ให้ผ่าน ฟอรัมล่มไม่ควรทำให้เล่นเกมไม่ได้"""
+    if link_checker is None:
+        return True
+    return await link_checker.exists(parse_tid(link)) is not False
+
+# --- GUILD ADMINS ---
+# แต่ละ guild มี Admin ของตัวเอง (ตาราง guild_admins) ส่วน ADMIN_ID เป็น Admin ได้ทุก guild
+async def is_admin(interaction):
+    if interaction.user.id == ADMIN_ID:
+        return True
+    return interaction.guild_id is not None and interaction.user.id in await db.get_admins(interaction.guild_id)
+
+async def admin_mentions(guild_id):
+    """mention Admin ของ guild สำหรับแท็กตอนมีคนทำภารกิจสำเร็จ (ยังไม่ตั้งใคร = แท็กเจ้าของบอท)"""
+    admins = await db.get_admins(guild_id)
+    return " ".join(f"<@{user_id}>" for user_id in sorted(admins)) if admins else f"<@{ADMIN_ID}>"
+
+# --- ADMISSION ---
+# rate limit รายคน/คำสั่ง + ประตูรวมจำกัด handler พร้อมกัน (ตีกลับก่อนแตะฐานข้อมูล) เจ้าของบอทไม่โดน rate limit
+admission = Admission(exempt=(ADMIN_ID,))
+
+# --- TIMERS ---
+timers = TimerHeap()  # deadline ของทั้งบอท (ปุ่มคว้าหิมะโผล่ / หมดเวลา)
+
+# --- OUTBOX ---
+# ข้อความที่ handler ไม่ต้องรอ: ผลรอบคว้าหิมะ (ถึงผู้เล่น ส่งก่อน) กับ digest แจ้ง Admin (รวมทุก DIGEST_INTERVAL)
+# คำตอบของคำสั่งเองยังส่งตรงผ่าน reply เพราะต้องตอบภายใน 3 วินาที
+outbox = Outbox()
+
+async def deliver_digest(key, interaction, lines):
+    """ส่ง digest ของห้องนี้ทาง followup ของ interaction ล่าสุด (ไม่ต้องมีสิทธิ์ส่งข้อความในห้อง) แท็ก Admin ครั้งเดียว"""
+    shown = lines[:DIGEST_MAX_LINES]
+    if len(lines) > len(shown):
+        shown.append(catalog.text("digest.more", more=len(lines) - len(shown)))
+    embed = catalog.embed("digest", count=len(lines), lines="\n".join(shown))
+    outbox.send(interaction.id, interaction.followup.send, content=await admin_mentions(key[0]), embed=embed,
+                priority=PRIORITY_DIGEST)
+
+digest = Digest(deliver_digest)
+
+def notify_admins(interaction, line):
+    """ฝากบรรทัดแจ้ง Admin ไว้ใน digest รอบถัดไปของห้องนี้ (ไม่ต้อง await)"""
+    digest.add((interaction.guild_id, interaction.channel_id), interaction, line)
+
+# --- RESPONSE PIPELINE ---
+# Discord ให้เวลาตอบ interaction 3 วินาทีนับจากตอนกดคำสั่ง ถ้า handler ยังไม่ตอบใกล้หมดเวลา (ดิสก์ช้า/รอคิว DB)
+# จะ defer ให้เองแล้วคำตอบจริงไปทาง followup ข้อมูลที่เขียนลง DB แล้วจะไม่จบที่ "interaction failed"
+RESPONSE_DEADLINE = 3.0  # วินาที
+DEFER_MARGIN = 0.8       # วินาที เผื่อให้คำขอ defer เองวิ่งไปถึง Discord ทัน
+# คำสั่งที่คำตอบสุดท้ายปกติเห็นทั้งห้อง (ที่เหลือเป็นคำตอบเฉพาะคนกด) ใช้เลือกว่าจะ defer แบบไหน
+PUBLIC_REPLIES = {
+    "iceberg start", "iceberg submit", "iceberg dashboard",
+    "snowflake start", "snowflake snatch",
+    "vault create", "vault submit",
+}
+
+def schedule_auto_defer(interaction):
+    latency = shard_latency(interaction)
+    latency = min(latency, MAX_LATENCY_BONUS) if math.isfinite(latency) else 0.0
+    elapsed = time.perf_counter() - interaction.extras["started_at"]
+    delay = max(RESPONSE_DEADLINE - DEFER_MARGIN - latency - elapsed, 0.0)
+    interaction.extras["defer_timer"] = asyncio.get_running_loop().call_later(delay, auto_defer, interaction)
+
+def auto_defer(interaction):
+    interaction.extras.pop("defer_timer", None)
+    if interaction.response.is_done():
+        return
+    ephemeral = interaction.command.qualified_name not in PUBLIC_REPLIES
+    interaction.extras["deferring"] = asyncio.ensure_future(defer(interaction, ephemeral=ephemeral, automatic=True))
+
+def cancel_auto_defer(interaction):
+    timer = interaction.extras.pop("defer_timer", None)
+    if timer is not None:
+        timer.cancel()
+
+async def defer(interaction, ephemeral=False, automatic=False):
+    """ตอบรับไว้ก่อน (ขึ้น "กำลังคิด...") ถ้ายังไม่ได้ตอบ เรียกซ้ำหรือเรียกหลัง auto-defer ได้"""
+    if not automatic:
+        cancel_auto_defer(interaction)
+        pending = interaction.extras.pop("deferring", None)
+        if pending is not None:
+            await pending
+    if interaction.response.is_done():
+        return
+    try:
+        await interaction.response.defer(ephemeral=ephemeral, thinking=True)
+    except (discord.HTTPException, discord.InteractionResponded):
+        return
+    interaction.extras["deferred_ephemeral"] = ephemeral
+    if automatic:
+        metrics.observe_deferred(interaction.command.qualified_name)
+
+async def reply(interaction, content=None, *, ephemeral=False, **kwargs):
+    """ส่งคำตอบของคำสั่ง: ยังไม่ได้ตอบ = ตอบตรง, defer ไปแล้ว = ส่งทาง followup (ข้อความแรกจะแทนที่ "กำลังคิด...")"""
+    cancel_auto_defer(interaction)
+    pending = interaction.extras.pop("deferring", None)
+    if pending is not None:
+        await pending
+    if not interaction.response.is_done():
+        await interaction.response.send_message(content, ephemeral=ephemeral, **kwargs)
+        return
+    deferred = interaction.extras.pop("deferred_ephemeral", None)
+    if deferred is not None and deferred != ephemeral:
+        # defer ผิดแบบ (เช่น defer แบบเห็นทั้งห้องแต่คำตอบเป็น error เฉพาะคน) ลบ "กำลังคิด..." ทิ้งแล้วส่งแบบที่ถูก
+        try:
+            await interaction.delete_original_response()
+        except discord.HTTPException:
+            pass
+    await interaction.followup.send(content, ephemeral=ephemeral, **kwargs)
 
 # --- BOT SETUP ---
-class MyClient(discord.Client):
+class MetricsTree(app_commands.CommandTree):
+    """command tree ที่จับเวลาทุกคำสั่ง (เริ่มนับตอน interaction มาถึง จนถึงตอน handler จบ) และคัดคำสั่งที่เกินโควตาออก"""
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        interaction.extras["started_at"] = time.perf_counter()
+        # autocomplete ไม่มี completion event ให้คืนที่ ส่วนคำสั่งที่หาไม่เจอปล่อยให้ tree จัดการเอง
+        if interaction.type is not discord.InteractionType.application_command or interaction.command is None:
+            return True
+        reason, retry = await admission.admit(interaction.user.id, interaction.command.qualified_name)
+        if reason is None:
+            interaction.extras["admitted"] = True
+            schedule_auto_defer(interaction)
+            return True
+        key = "common.rate_limited" if reason == REJECT_RATE else "common.busy"
+        try:
+            await interaction.response.send_message(catalog.text(key, retry=math.ceil(retry)), ephemeral=True)
+        except discord.HTTPException:
+            pass
+        return False
+
+    async def on_error(self, interaction: discord.Interaction, error):
+        record_command(interaction, failed=True)
+        await super().on_error(interaction, error)
+
+def record_command(interaction, failed=False):
+    cancel_auto_defer(interaction)
+    if interaction.extras.pop("admitted", False):
+        admission.release()
+    started_at = interaction.extras.get("started_at")
+    if started_at is not None and interaction.command is not None:
+        metrics.observe_command(interaction.command.qualified_name, time.perf_counter() - started_at, failed)
+
+class MyClient(discord.AutoShardedClient):
     def __init__(self):
-        super().__init__(intents=discord.Intents.default())
-        self.tree = app_commands.CommandTree(self)
+        intents = discord.Intents.default()
+        intents.members = MEMBERS_INTENT
+        # ตั้ง presence ไว้ตั้งแต่ identify จะได้ไม่ต้องส่งใหม่ทุกครั้งที่ reconnect
+        super().__init__(
+            shard_count=int(SHARD_COUNT) if SHARD_COUNT else None,
+            intents=intents,
+            activity=discord.Activity(type=discord.ActivityType.watching, name="เห่า! เห่า!!"),
+        )
+        self.tree = MetricsTree(self)
+        self.metrics_tasks = []
+        self.metrics_runner = None
+
+    async def setup_hook(self):
+        # ทำครั้งเดียวตอนบอทเริ่ม (on_ready จะถูกเรียกซ้ำทุกครั้งที่ gateway reconnect)
+        await db.open()
+        maintenance.start()
+        outbox.start()
+        digest.start()
+        self.add_dynamic_items(SnatchButton)
+        if link_checker is not None:
+            await link_checker.start()
+        await self.sync_commands()
+        self.metrics_tasks.append(asyncio.create_task(metrics.watch_loop(self)))
+        if METRICS_PORT:
+            self.metrics_runner = await metrics.serve("127.0.0.1", int(METRICS_PORT))
+
+    async def sync_commands(self):
+        """sync command tree เฉพาะตอนที่นิยามคำสั่งเปลี่ยนไปจากครั้งที่แล้ว"""
+        guild = discord.Object(id=int(SYNC_GUILD_ID)) if SYNC_GUILD_ID else None
+        if guild is not None:
+            # โหมด dev: คำสั่งทั้งหมดอยู่ที่ guild นี้ ต้องลบชุด global ที่เคย sync ไว้ด้วย ไม่งั้นใน guild นี้จะเห็นคำสั่งซ้ำสองชุด
+            # (สลับกลับไปโหมด global ต้องลบชุดของ guild เองด้วย tree.clear_commands(guild=...) + sync)
+            self.tree.copy_global_to(guild=guild)
+            await self._sync_if_changed(guild)
+            self.tree.clear_commands(guild=None)
+        await self._sync_if_changed(None)
+
+    async def _sync_if_changed(self, guild):
+        payload = [command.to_dict(self.tree) for command in self.tree.get_commands(guild=guild)]
+        digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+        key = f"command_hash:guild:{guild.id}" if guild else "command_hash:global"
+        if await db.get_meta(key) == digest:
+            return
+        await self.tree.sync(guild=guild)
+        await db.set_meta(key, digest)
+        print(f'Synced {len(payload)} command groups ({key})')
+
+    async def close(self):
+        for task in (*self.metrics_tasks, *dashboards.values()):
+            task.cancel()
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        timers.close()
+        # ส่งที่ค้าง (รวม digest รอบสุดท้าย) ก่อน session HTTP ปิด
+        await digest.close()
+        await outbox.close()
+        await super().close()
+        if link_checker is not None:
+            await link_checker.close()
+        await maintenance.close()
+        await db.close()
 
     async def on_ready(self):
-        init_db()
-        await self.tree.sync()
-        await self.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name="เห่า! เห่า!!"))
         print(f'Logged in as {self.user} (Iceberg Systems Online!)')
 
+    async def on_app_command_completion(self, interaction: discord.Interaction, command):
+        record_command(interaction)
+
 client = MyClient()
 
+# --- ADMIN REPORTS ---
+# รายงานแบ่งหน้า: ยอดรวมมาจาก SQL aggregate ส่วนรายชื่อดึงทีละหน้าตาม key (ไม่ดึงทั้งตาราง)
+def format_iceberg_row(row):
+    uid, att, target, comp = row
+    if comp:
+        return catalog.text("iceberg.report_done", user_id=uid)
+    return catalog.text("iceberg.report_progress", user_id=uid, attempts=att, target=target)
+
+def format_snow_row(row):
+    uid, cnt, comp = row
+    if comp:
+        return catalog.text("snowflake.report_done", user_id=uid)
+    return catalog.text("snowflake.report_progress", user_id=uid, count=cnt)
+
+def format_vault_row(row):
+    team_id, u1, u2, att, target, comp = row
+    if comp:
+        return catalog.text("vault.report_done", user1_id=u1, user2_id=u2)
+    return catalog.text("vault.report_progress", user1_id=u1, user2_id=u2, attempts=att, target=target)
+
+class ReportView(discord.ui.View):
+    def __init__(self, guild_id, game, title, format_row):
+        super().__init__(timeout=300)
+        self.guild_id = guild_id
+        self.game = game
+        self.title = title
+        self.format_row = format_row
+        self.totals = (0, 0)
+        self.rows = []
+        self.page = 1
+        self.prev_button.label = catalog.text("report.prev_label")
+        self.next_button.label = catalog.text("report.next_label")
+
+    async def open(self):
+        """โหลดยอดรวมกับหน้าแรก คืน False ถ้ายังไม่มีข้อมูลเลย"""
+        self.totals = await db.get_report_totals(self.guild_id, self.game)
+        if not self.totals[0]:
+            return False
+        await self.load()
+        return True
+
+    async def load(self, after=None, before=None):
+        rows, more = await db.get_report_page(self.guild_id, self.game, after=after, before=before)
+        if before is not None:
+            self.page = self.page - 1 if more else 1
+            has_prev, has_next = more, True
+        elif after is not None:
+            self.page += 1
+            has_prev, has_next = True, more
+        else:
+            self.page = 1
+            has_prev, has_next = False, more
+        if rows:
+            self.rows = rows
+        self.prev_button.disabled = not has_prev
+        self.next_button.disabled = not has_next
+
+    def render(self):
+        total, done = self.totals
+        lines = [catalog.text("report.page", title=self.title, page=self.page)]
+        lines.extend(self.format_row(row) for row in self.rows)
+        lines.append(catalog.text("report.totals", total=total, done=done))
+        return "\n".join(lines)
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        return await is_admin(interaction)
+
+    @discord.ui.button(style=discord.ButtonStyle.secondary)
+    async def prev_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.load(before=self.rows[0][0])
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+    @discord.ui.button(style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.load(after=self.rows[-1][0])
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+# --- LIVE DASHBOARD ---
+# อ่านจากตารางยอดสรุป (game_counters / attempt_buckets) อย่างเดียว อัปเดตถี่ได้โดยไม่ต้องไล่ทั้งตาราง
+DASHBOARD_REFRESH = 5          # วินาที
+DASHBOARD_LIFETIME = 14 * 60   # token ของ interaction แก้ข้อความได้ 15 นาที
+DASHBOARD_GAMES = (GAME_ICEBERG, GAME_SNOWFLAKE, GAME_VAULT)
+SPARK = "▁▂▃▄▅▆▇█"
+dashboards = {}  # guild_id -> task ที่อัปเดต dashboard อยู่ (เปิดอันใหม่ = ปิดอันเก่าของ guild นั้น)
+
+def sparkline(counts):
+    peak = max(counts) or 1
+    return "".join(SPARK[round(n / peak * (len(SPARK) - 1))] if n else " " for n in counts)
+
+def render_dashboard(counters):
+    """ข้อความของ dashboard จาก get_dashboard (เป้าละบรรทัด: histogram จำนวนครั้ง 0..เป้า)"""
+    sections = []
+    for game in DASHBOARD_GAMES:
+        name = catalog.text(f"dashboard.{game}")
+        if game not in counters or not counters[game][0]:
+            sections.append(catalog.text("dashboard.empty", name=name))
+            continue
+        players, completed, attempts_sum, buckets = counters[game]
+        lines = [catalog.text("dashboard.summary", name=name, players=players, completed=completed,
+                              average=attempts_sum / players)]
+        by_target = {}
+        for target, attempts, n in buckets:
+            by_target.setdefault(target, {})[attempts] = n
+        for target, hist in by_target.items():
+            counts = [hist.get(attempts, 0) for attempts in range(max(target, *hist) + 1)]
+            lines.append(catalog.text("dashboard.target", target=target, bar=sparkline(counts),
+                                      done=sum(n for attempts, n in hist.items() if attempts >= target),
+                                      players=sum(hist.values())))
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+async def run_dashboard(interaction, body):
+    """แก้ข้อความ dashboard ทุก DASHBOARD_REFRESH วินาที (เฉพาะตอนตัวเลขเปลี่ยน) จนหมดอายุ token"""
+    ends = time.monotonic() + DASHBOARD_LIFETIME
+    try:
+        while time.monotonic() < ends:
+            await asyncio.sleep(DASHBOARD_REFRESH)
+            latest = render_dashboard(await db.get_dashboard(interaction.guild_id))
+            if latest == body:
+                continue
+            body = latest
+            await interaction.edit_original_response(embed=catalog.embed("dashboard", body=body, updated=int(time.time())))
+    except discord.HTTPException:
+        pass  # ข้อความถูกลบ / token หมดอายุ
+    finally:
+        if dashboards.get(interaction.guild_id) is asyncio.current_task():
+            del dashboards[interaction.guild_id]
+
 # ==================================================================
 # 🧊 GROUP 1: ICEBERG (ทุบน้ำแข็ง - Solo)
 # ==================================================================
-iceberg_group = app_commands.Group(name="iceberg", description="มาทุบน้ำแข็งกับข้า! Iceberg")
+iceberg_group = app_commands.Group(name="iceberg", description="มาทุบน้ำแข็งกับข้า! Iceberg", guild_only=True)
 
 @iceberg_group.command(name="start", description="ส่งลิงก์รับภารกิจเพื่อเริ่มทุบน้ำแข็ง")
 @app_commands.describe(link="วางลิงก์โพสต์ที่โรลเพลย์รับภารกิจ")
 async def start(interaction: discord.Interaction, link: str):
     user_id = interaction.user.id
-    player = get_player(user_id)
+    player = await db.get_player(interaction.guild_id, user_id)
     
     if player:
-        await interaction.response.send_message("⛄ **ไอซ์เบิร์ก:** โอ๊ยย! เอ็งลงชื่อไปแล้วนี่หว่า ไปใช้คำสั่ง `/iceberg submit` เพื่อทุบน้ำแข็งนู่น!", ephemeral=True)
+        await reply(interaction, catalog.text("iceberg.already_started"), ephemeral=True)
+        return
+    if not is_valid_link(link):
+        await reply(interaction, catalog.text("iceberg.bad_start_link", target_url=TARGET_URL), ephemeral=True)
         return
-    if not link.startswith(TARGET_URL):
-        await interaction.response.send_message(f"⛄ **ไอซ์เบิร์ก:** ลิงก์อะไรเนี่ย? ข้าไม่รับ! เอาลิงก์ `{TARGET_URL}` มา", ephemeral=True)
+    if not await link_exists(link):
+        await reply(interaction, catalog.text("common.link_not_found", tid=parse_tid(link)), ephemeral=True)
         return
 
     # ICEBERG TARGET: 4-19 ครั้ง
     target_attempts = random.randint(4, 19)
-    create_player(user_id, link, target_attempts)
+    await db.create_player(interaction.guild_id, user_id, link, target_attempts)
     
-    embed = discord.Embed(
-        title="⛄ ไอซ์เบิร์ก: \"หึ! คิดว่าจะแน่สักแค่ไหนเชียว!\"",
-        description=(
-            f"เห็นก้อนน้ำแข็งตรงหน้าไหม? ไม่มีอะไรยากเลย แค่หาทางทำลายมัน\n"
-            "บอกไว้ก่อนว่าก้อนนี้แข็งเป็นพิเศษ พนันเลยว่าเจ้าต้องทุบจนมือหักแน่!\n\n"
-            "**วิธีเล่น:**\n"
-            "1. โรลเพลย์หาทางทุบน้ำแข็งยังไงก็ได้ (หมายเหตุ: ทุบน้ำแข็ง [จำนวน])\n"
-            "2. ส่งลิงก์ด้วย `/iceberg submit` พร้อมแนบลิงก์โรลเพลย์มา\n"
-            "3. ทุบไปเรื่อย ๆ จนกว่ามันจะแตก (จะทุบได้เร็วมากแค่ไหนขึ้นอยู่กับแรงของเจ้า)"
-        ),
-        color=0xa5f3fc 
-    )
-    embed.set_thumbnail(url="https://media.tenor.com/t2akJIhYv6QAAAAM/skibidi-snowmen.gif")
-    await interaction.response.send_message(embed=embed)
+    await reply(interaction, embed=catalog.embed("iceberg.start"))
 
 @iceberg_group.command(name="submit", description="ส่งลิงก์โรลเพลย์เพื่อทุบน้ำแข็ง")
 @app_commands.describe(link="วางลิงก์โพสต์ที่นี่")
 async def submit(interaction: discord.Interaction, link: str):
     user_id = interaction.user.id
-    player = get_player(user_id)
+    player = await db.get_player(interaction.guild_id, user_id)
     
     if not player:
-        await interaction.response.send_message("⛄ **ไอซ์เบิร์ก:** ยังไม่ได้เริ่มภารกิจเลย! พิมพ์ `/iceberg start` ก่อนเส้!", ephemeral=True)
+        await reply(interaction, catalog.text("iceberg.not_started"), ephemeral=True)
         return
     
-    attempts, target, completed, links_str = player
-    links_list = json.loads(links_str)
+    attempts, target, completed = player
     
     if completed:
-        await interaction.response.send_message("⛄ **ไอซ์เบิร์ก:** มันแตกไปแล้ว! จะมาทุบซ้ำทำไม?", ephemeral=True)
+        await reply(interaction, catalog.text("iceberg.already_broken"), ephemeral=True)
         return
-    if not link.startswith(TARGET_URL):
-        await interaction.response.send_message(f"⛄ **ไอซ์เบิร์ก:** ลิงก์ผิด! ไปเอาลิงก์โพสต์ที่ถูกมา", ephemeral=True)
+    if not is_valid_link(link):
+        await reply(interaction, catalog.text("iceberg.bad_link"), ephemeral=True)
         return
-    if link in links_list:
-        await interaction.response.send_message("⛄ **ไอซ์เบิร์ก:** ลิงก์นี้ใช้ไปแล้ว! อย่าลักไก่ ไปโรลมาใหม่!", ephemeral=True)
+    if await db.has_submission(interaction.guild_id, GAME_ICEBERG, user_id, parse_tid(link)):
+        await reply(interaction, catalog.text("iceberg.duplicate"), ephemeral=True)
+        return
+    if not await link_exists(link):
+        await reply(interaction, catalog.text("common.link_not_found", tid=parse_tid(link)), ephemeral=True)
         return
 
     # Process
-    links_list.append(link)
     new_attempts = attempts + 1
     
     # Check Success
     is_success = new_attempts >= target
 
     if is_success: 
-        update_player_progress(user_id, new_attempts, True, links_list)
+        await db.update_player_progress(interaction.guild_id, user_id, new_attempts, True, link)
         
-        success_msg = (
-            f"🎉 **อะๆ เก่งมาก แปะแปะแปะ**\n"
-            f"ทุบไปตั้ง {new_attempts} ครั้ง... ยอมใจความถึกจริงๆ\n"
-            f"อย่าลืมไปทำภารกิจหาชิ้นส่วนอื่นให้ครบด้วยล่ะ บ๊ายบาย!\n\n"
-            f"📢 <@{ADMIN_ID}> เจ้านายมาดูผลงานหน่อยครับ!"
-        )
-        embed = discord.Embed(
-            title="🧊 เพล้งงงง! น้ำแข็งแตกกระจาย!",
-            description=success_msg,
-            color=0x4ade80
-        )
-        embed.set_image(url="https://iili.io/fxKE729.png")
-        await interaction.response.send_message(content=f"<@{user_id}> <@{ADMIN_ID}>", embed=embed)
+        embed = catalog.embed("iceberg.success", attempts=new_attempts)
+        await reply(interaction, content=f"<@{user_id}>", embed=embed)
+        notify_admins(interaction, catalog.text("digest.iceberg", user_id=user_id, attempts=new_attempts))
 
     else:
-        update_player_progress(user_id, new_attempts, False, links_list)
+        await db.update_player_progress(interaction.guild_id, user_id, new_attempts, False, link)
         
-        taunts = [
-            "🥱 **ไอซ์เบิร์ก:** ยัง... ยังไม่แตกอีก แรงมีแค่นี้เหรอ?",
-            "🤣 **ไอซ์เบิร์ก:** สะกิดแรงกว่านี้หน่อยสิ!",
-            "🧊 **ไอซ์เบิร์ก:** ร้าวไปนิดนึง... นิดเดียวจริง ๆ",
-            "🥶 **ไอซ์เบิร์ก:** หนาวล่ะสิ มือสั่นทุบไม่โดนหรือไง?",
-            "🔨 **ไอซ์เบิร์ก:** เสียงดังฟังชัด แต่ดาเมจเป็นศูนย์!",
-            f"👀 **ไอซ์เบิร์ก:** (ทุบไป {new_attempts} ทีแล้วนะ ยังไม่เหนื่อยอีกเหรอ?)"
-        ]
-        chosen_taunt = random.choice(taunts)
-
-        embed = discord.Embed(
-            title=f"💥 โป๊ก! (ครั้งที่ {new_attempts})",
-            description=chosen_taunt + "\n\n*อย่าเพิ่งท้อนะไอ้หนู ออกแรงกว่านี้อีกเส้!*",
-            color=0xef4444
-        )
-        await interaction.response.send_message(embed=embed)
+        chosen_taunt = catalog.choice("iceberg.taunts", attempts=new_attempts)
+        embed = catalog.embed("iceberg.hit", attempts=new_attempts, taunt=chosen_taunt)
+        await reply(interaction, embed=embed)
 
 @iceberg_group.command(name="check", description="[Admin] เช็คสถานะ Iceberg")
 async def check_status(interaction: discord.Interaction):
-    if interaction.user.id != ADMIN_ID:
-        await interaction.response.send_message("⛄ **ไอซ์เบิร์ก:** ยุ่งน่า! เฉพาะเจ้านายแมทธิวเท่านั้น!", ephemeral=True)
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("iceberg.admin_only"), ephemeral=True)
         return
 
-    players = get_all_players()
-    if not players:
-        await interaction.response.send_message("📂 เงียบกริบ... ยังไม่มีใครเล่นเลยครับเจ้านาย", ephemeral=True)
+    view = ReportView(interaction.guild_id, GAME_ICEBERG, catalog.text("iceberg.report_title"), format_iceberg_row)
+    if not await view.open():
+        await reply(interaction, catalog.text("iceberg.report_empty"), ephemeral=True)
         return
-
-    report = "**📊 รายงาน Iceberg (Target 4-19)**\n"
-    count_success = 0
-    for row in players:
-        uid, att, target, comp = row
-        status = "✅ แตกแล้ว" if comp else f"🔨 {att}/{target}"
-        report += f"• <@{uid}> : {status}\n"
-        if comp: count_success += 1
-    
-    report += f"\n👥 ทั้งหมด: {len(players)} | 🎉 สำเร็จ: {count_success}"
-    await interaction.response.send_message(report, ephemeral=True)
+    await reply(interaction, view.render(), view=view, ephemeral=True)
 
 @iceberg_group.command(name="reset", description="[Admin] รีเซ็ต Iceberg ผู้เล่น")
 @app_commands.describe(member="เลือกคนที่จะรีเซ็ต")
 async def reset_user(interaction: discord.Interaction, member: discord.Member):
-    if interaction.user.id != ADMIN_ID:
-        await interaction.response.send_message("❌ เฉพาะ Admin", ephemeral=True)
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
         return
     
-    player = get_player(member.id)
+    player = await db.get_player(interaction.guild_id, member.id)
     if player:
-        delete_player(member.id)
-        await interaction.response.send_message(f"♻️ **Iceberg:** ลบข้อมูล {member.mention} แล้ว ให้เริ่มใหม่ได้เลย", ephemeral=True)
+        await db.delete_player(interaction.guild_id, member.id)
+        await reply(interaction, catalog.text("iceberg.reset_done", member=member.mention), ephemeral=True)
+    else:
+        await reply(interaction, catalog.text("iceberg.reset_missing"), ephemeral=True)
+
+@iceberg_group.command(name="history", description="[Admin] ดูประวัติการส่งลิงก์ล่าสุดของผู้เล่น (ทุกเกม)")
+async def show_history(interaction: discord.Interaction, member: discord.Member):
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
+        return
+
+    events = await db.get_history(interaction.guild_id, member.id)
+    if not events:
+        await reply(interaction, catalog.text("history.empty", member=member.mention), ephemeral=True)
+        return
+    lines = [catalog.text("history.title", member=member.mention)]
+    for event_id, game, kind, tid, data, created_at in events:
+        lines.append(catalog.text("history.line", id=event_id, created_at=created_at, game=game, kind=kind,
+                                  tid=tid if tid is not None else "-", data=data or ""))
+    await reply(interaction, "\n".join(lines), ephemeral=True)
+
+@iceberg_group.command(name="export", description="[Admin] ส่งออกความคืบหน้าทุกเกมของเซิร์ฟเวอร์นี้เป็นไฟล์ (บีบอัด gzip)")
+@app_commands.describe(fmt="รูปแบบไฟล์")
+@app_commands.rename(fmt="format")
+@app_commands.choices(fmt=[
+    app_commands.Choice(name="CSV", value="csv"),
+    app_commands.Choice(name="JSON Lines", value="jsonl"),
+])
+async def export_all(interaction: discord.Interaction, fmt: str = "csv"):
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
+        return
+
+    # ตารางใหญ่อาจใช้เวลาเกิน 3 วินาที ตอบรับไว้ก่อน
+    await defer(interaction, ephemeral=True)
+    out, count = await export_progress(db, interaction.guild_id, fmt)
+    with out:
+        size = out.seek(0, os.SEEK_END)
+        out.seek(0)
+        limit = interaction.guild.filesize_limit if interaction.guild else discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES
+        if size > limit:
+            await reply(interaction, catalog.text("export.too_large", size_mb=size / 2**20, limit_mb=limit / 2**20), ephemeral=True)
+            return
+        filename = f"iceberg_{interaction.guild_id}.{fmt}.gz"
+        await reply(interaction, catalog.text("export.done", count=count), file=discord.File(out, filename=filename), ephemeral=True)
+
+@iceberg_group.command(name="dashboard", description="[Admin] สรุปยอดทุกเกมแบบอัปเดตสด (15 นาที)")
+async def show_dashboard(interaction: discord.Interaction):
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
+        return
+
+    body = render_dashboard(await db.get_dashboard(interaction.guild_id))
+    await reply(interaction, embed=catalog.embed("dashboard", body=body, updated=int(time.time())))
+    previous = dashboards.get(interaction.guild_id)
+    if previous is not None:
+        previous.cancel()
+    dashboards[interaction.guild_id] = asyncio.create_task(run_dashboard(interaction, body))
+
+@iceberg_group.command(name="reload", description="[Owner] โหลดข้อความตอบกลับ (responses.json) ใหม่")
+async def reload_responses(interaction: discord.Interaction):
+    # ข้อความชุดเดียวใช้ทุก guild ให้เจ้าของบอทเป็นคนโหลดใหม่
+    if interaction.user.id != ADMIN_ID:
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
+        return
+
+    try:
+        count = catalog.reload()
+    except (OSError, ValueError, KeyError) as e:
+        await reply(interaction, catalog.text("common.reload_failed", error=e), ephemeral=True)
+        return
+    await reply(interaction, catalog.text("common.reloaded", count=count), ephemeral=True)
+
+@iceberg_group.command(name="stats", description="[Owner] ดูสถิติความเร็วของบอท (คำสั่ง / ฐานข้อมูล / event loop)")
+async def show_stats(interaction: discord.Interaction):
+    if interaction.user.id != ADMIN_ID:
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
+        return
+
+    table = metrics.summary()
+    text = catalog.text("common.stats", loop_lag_ms=metrics.loop_lag.quantile(0.99) * 1000,
+                        gateway_ms=interaction.client.latency * 1000, table=table)
+    if len(text) > MESSAGE_LIMIT:
+        # ตัดอันดับไว้แล้วแต่ยังยาวเกิน (ชื่อยาวผิดปกติ) ส่งตารางเป็นไฟล์แทน
+        text = catalog.text("common.stats", loop_lag_ms=metrics.loop_lag.quantile(0.99) * 1000,
+                            gateway_ms=interaction.client.latency * 1000, table="(stats.txt)")
+        await reply(interaction, text, file=discord.File(io.BytesIO(table.encode()), filename="stats.txt"), ephemeral=True)
+        return
+    await reply(interaction, text, ephemeral=True)
+
+# --- /iceberg admin: ตั้ง Admin ของ guild ---
+admin_group = app_commands.Group(name="admin", description="[Admin] จัดการ Admin ของเซิร์ฟเวอร์นี้", parent=iceberg_group)
+
+def can_manage_admins(interaction):
+    return interaction.user.id == ADMIN_ID or interaction.permissions.manage_guild
+
+@admin_group.command(name="add", description="เพิ่ม Admin ของเซิร์ฟเวอร์นี้")
+async def admin_add(interaction: discord.Interaction, member: discord.Member):
+    if not can_manage_admins(interaction):
+        await reply(interaction, catalog.text("admin.manage_only"), ephemeral=True)
+        return
+    if await db.add_admin(interaction.guild_id, member.id):
+        await reply(interaction, catalog.text("admin.added", member=member.mention), ephemeral=True)
+    else:
+        await reply(interaction, catalog.text("admin.already", member=member.mention), ephemeral=True)
+
+@admin_group.command(name="remove", description="ถอด Admin ของเซิร์ฟเวอร์นี้")
+async def admin_remove(interaction: discord.Interaction, member: discord.Member):
+    if not can_manage_admins(interaction):
+        await reply(interaction, catalog.text("admin.manage_only"), ephemeral=True)
+        return
+    if await db.remove_admin(interaction.guild_id, member.id):
+        await reply(interaction, catalog.text("admin.removed", member=member.mention), ephemeral=True)
     else:
-        await interaction.response.send_message(f"⚠️ หาไม่เจอ", ephemeral=True)
+        await reply(interaction, catalog.text("admin.not_admin", member=member.mention), ephemeral=True)
+
+@admin_group.command(name="list", description="ดูรายชื่อ Admin ของเซิร์ฟเวอร์นี้")
+async def admin_list(interaction: discord.Interaction):
+    admins = await db.get_admins(interaction.guild_id)
+    if not admins:
+        await reply(interaction, catalog.text("admin.list_empty", owner_id=ADMIN_ID), ephemeral=True)
+        return
+    mentions = " ".join(f"<@{user_id}>" for user_id in sorted(admins))
+    await reply(interaction, catalog.text("admin.list", admins=mentions), ephemeral=True)
+
+# --- /iceberg season: งานทีละทั้งเกม ---
+# แต่ละคำสั่งเป็น transaction เดียวใน DB (set-based) ตอบเป็นรายงานจำนวนแถวต่อเกมตอนจบ
+season_group = app_commands.Group(name="season", description="[Admin] ปิดซีซั่น / ปรับเป้าทีละทั้งเกม", parent=iceberg_group)
+
+SEASON_GAMES = {"all": DASHBOARD_GAMES, GAME_ICEBERG: (GAME_ICEBERG,), GAME_SNOWFLAKE: (GAME_SNOWFLAKE,), GAME_VAULT: (GAME_VAULT,)}
+TARGET_GAMES = {"all": (GAME_ICEBERG, GAME_VAULT), GAME_ICEBERG: (GAME_ICEBERG,), GAME_VAULT: (GAME_VAULT,)}
+
+def season_scope(role):
+    """คืน (user id ทั้งหมดใน role หรือ None = ทั้ง guild, ข้อความบอกขอบเขต, key ข้อความ error)"""
+    if role is None:
+        return None, catalog.text("season.scope_all"), None
+    if not MEMBERS_INTENT:
+        return None, None, "season.role_needs_intent"
+    if not role.members:
+        return None, None, "season.role_empty"
+    user_ids = [member.id for member in role.members]
+    return user_ids, catalog.text("season.scope_role", role=role.mention, members=len(user_ids)), None
+
+@season_group.command(name="reset", description="เก็บความคืบหน้าเข้าคลังแล้วรีเซ็ตทั้งเกม (หรือเฉพาะคนใน role)")
+@app_commands.describe(game="เกมที่จะรีเซ็ต", season="ชื่อซีซั่นที่จะเก็บเข้าคลัง", role="เฉพาะสมาชิก role นี้ (ไม่ใส่ = ทุกคน)")
+@app_commands.choices(game=[
+    app_commands.Choice(name="ทุกเกม", value="all"),
+    app_commands.Choice(name="Iceberg", value=GAME_ICEBERG),
+    app_commands.Choice(name="Snowflake", value=GAME_SNOWFLAKE),
+    app_commands.Choice(name="Vault", value=GAME_VAULT),
+])
+async def season_reset(interaction: discord.Interaction, game: str, season: app_commands.Range[str, 1, 64],
+                       role: discord.Role = None):
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
+        return
+    user_ids, scope, error = season_scope(role)
+    if error:
+        await reply(interaction, catalog.text(error, role=role.mention if role else ""), ephemeral=True)
+        return
+
+    await defer(interaction, ephemeral=True)
+    started = time.perf_counter()
+    report = await db.reset_season(interaction.guild_id, SEASON_GAMES[game], season, user_ids)
+    lines = "\n".join(catalog.text("season.reset_line", game=name, **counts) for name, counts in report.items())
+    await reply(interaction, catalog.text("season.reset_done", season=season, scope=scope, lines=lines,
+                                          elapsed_ms=(time.perf_counter() - started) * 1000), ephemeral=True)
+
+@season_group.command(name="target", description="ตั้งเป้าใหม่หรือบวก/ลบเป้าของคนที่ยังไม่สำเร็จทั้งเกม")
+@app_commands.describe(game="เกมที่จะปรับเป้า", value="เป้าใหม่", delta="บวก/ลบจากเป้าเดิม (เช่น -2)",
+                       role="เฉพาะสมาชิก role นี้ (ไม่ใส่ = ทุกคน)")
+@app_commands.choices(game=[
+    app_commands.Choice(name="Iceberg + Vault", value="all"),
+    app_commands.Choice(name="Iceberg", value=GAME_ICEBERG),
+    app_commands.Choice(name="Vault", value=GAME_VAULT),
+])
+async def season_target(interaction: discord.Interaction, game: str, value: app_commands.Range[int, 1] = None,
+                        delta: int = None, role: discord.Role = None):
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
+        return
+    if (value is None) == (delta is None):
+        await reply(interaction, catalog.text("season.bad_target"), ephemeral=True)
+        return
+    user_ids, scope, error = season_scope(role)
+    if error:
+        await reply(interaction, catalog.text(error, role=role.mention if role else ""), ephemeral=True)
+        return
+
+    await defer(interaction, ephemeral=True)
+    started = time.perf_counter()
+    report = await db.adjust_targets(interaction.guild_id, TARGET_GAMES[game], value, delta, user_ids)
+    lines = "\n".join(catalog.text("season.target_line", game=name, rows=rows) for name, rows in report.items())
+    await reply(interaction, catalog.text("season.target_done", scope=scope, lines=lines,
+                                          elapsed_ms=(time.perf_counter() - started) * 1000), ephemeral=True)
 
 # ==================================================================
 # ❄️ GROUP 2: SNOWFLAKE SNATCHER (เกมคว้าเกล็ดหิมะ)
 # ==================================================================
-snow_group = app_commands.Group(name="snowflake", description="ภารกิจคว้าเกล็ดหิมะ (ต้องเก็บให้ครบ 5 ชิ้น)")
-
-class SnatchView(discord.ui.View):
-    def __init__(self, user_id, time_limit):
-        super().__init__(timeout=time_limit)
-        self.user_id = user_id
-        self.clicked = False
-
-    @discord.ui.button(label="❄️ คว้าเลย!", style=discord.ButtonStyle.success)
-    async def grab_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if interaction.user.id != self.user_id:
-            await interaction.response.send_message("ยุ่งน่า! ไม่ใช่ของเอ็ง อย่ามาแย่ง!", ephemeral=True)
+snow_group = app_commands.Group(name="snowflake", description="ภารกิจคว้าเกล็ดหิมะ (ต้องเก็บให้ครบ 5 ชิ้น)", guild_only=True)
+
+# เวลาที่ชดเชยให้ตามความหน่วงของ gateway สูงสุดกี่วินาที (กันค่า latency แปลกๆ ตอนเน็ตสะดุด)
+MAX_LATENCY_BONUS = 1.0
+
+def shard_latency(interaction):
+    """latency ของ shard ที่ดูแล guild นี้ (แต่ละ shard มี websocket ของตัวเอง)"""
+    client = interaction.client
+    shard = client.get_shard((interaction.guild_id >> 22) % (client.shard_count or 1))
+    return shard.latency if shard is not None else client.latency
+# ช่วงเวลาสุ่มก่อนปุ่มโผล่ (วินาที)
+SNATCH_DELAY = (2, 5)
+
+# รอบคว้าหิมะที่ยังไม่จบ: handler ตอบ "รอก่อน" แล้วจบเลย ที่เหลือ (ปุ่มโผล่ / หมดเวลา) อยู่ใน timers
+# ส่วนการกดปุ่มวิ่งเข้า SnatchButton ตาม custom_id ไม่มี View ค้างต่อข้อความ
+pending_snatches = {}  # round_id -> SnatchRound
+snatching = set()      # (guild_id, user_id) ที่มีรอบค้างอยู่ (ทีละรอบต่อคน ไม่งั้นสองรอบจะนับทับกัน)
+
+class SnatchRound:
+    __slots__ = ("id", "interaction", "guild_id", "user_id", "count", "link",
+                 "time_limit", "shown_at", "latency", "clicked_at", "expiry")
+
+    def __init__(self, interaction, count, link):
+        self.id = interaction.id  # snowflake ของ interaction ไม่ซ้ำกันแม้บอทรีสตาร์ท (ปุ่มของรอบเก่าจะไม่ไปโดนรอบใหม่)
+        self.interaction = interaction
+        self.guild_id = interaction.guild_id
+        self.user_id = interaction.user.id
+        self.count = count
+        self.link = link
+        self.time_limit = max(3.0 - count * 0.5, 0.8)
+        self.shown_at = None
+        self.latency = 0.0
+        self.clicked_at = None
+        self.expiry = None
+
+class SnatchButton(discord.ui.DynamicItem[discord.ui.Button], template=r"snatch:(?P<round_id>[0-9]+)"):
+    """ปุ่มคว้าหิมะ ลงทะเบียนครั้งเดียวตอนบอทเริ่ม (add_dynamic_items) หารอบจาก round_id ใน custom_id"""
+
+    def __init__(self, round_id, grabbed=False):
+        super().__init__(discord.ui.Button(
+            label=catalog.text("snowflake.grabbed_label" if grabbed else "snowflake.grab_label"),
+            style=discord.ButtonStyle.success,
+            disabled=grabbed,
+            custom_id=f"snatch:{round_id}",
+        ))
+        self.round_id = round_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item, match):
+        return cls(int(match["round_id"]))
+
+    async def callback(self, interaction: discord.Interaction):
+        snatch = pending_snatches.get(self.round_id)
+        if snatch is None or snatch.shown_at is None:
+            await interaction.response.send_message(catalog.text("snowflake.expired"), ephemeral=True)
+            return
+        if interaction.user.id != snatch.user_id:
+            await interaction.response.send_message(catalog.text("snowflake.not_yours"), ephemeral=True)
             return
+
+        # จองผลก่อน await อะไรทั้งนั้น timer หมดเวลาจะได้ไม่แทรกกลางทาง
+        snatch.clicked_at = time.monotonic()
+        timers.cancel(snatch.expiry)
+        end_round(snatch)
+        await interaction.response.edit_message(view=snatch_view(snatch.id, grabbed=True))
+        await finish_snatch(snatch)
+
+def end_round(snatch):
+    """เอารอบออกจากรายการที่รออยู่ คืน False ถ้ารอบนี้จบไปก่อนแล้ว"""
+    if pending_snatches.pop(snatch.id, None) is None:
+        return False
+    snatching.discard((snatch.guild_id, snatch.user_id))
+    return True
+
+def snatch_view(round_id, grabbed=False):
+    # View ใช้แค่ประกอบ component ตอนส่ง stop() ไว้ก่อนจะได้ไม่ถูกเก็บใน view store ของ discord.py
+    view = discord.ui.View(timeout=None)
+    view.add_item(SnatchButton(round_id, grabbed))
+    view.stop()
+    return view
+
+async def reveal_snatch(snatch):
+    """ถึงเวลาปุ่มโผล่ (เรียกจาก timers)"""
+    try:
+        await snatch.interaction.edit_original_response(
+            embed=catalog.embed("snowflake.now", time_limit=snatch.time_limit), view=snatch_view(snatch.id))
+    except discord.HTTPException:
+        end_round(snatch)
+        raise
+    # เริ่มนับเวลาหลัง Discord ยืนยันว่าข้อความถึงแล้ว + ชดเชยเวลาที่การกดปุ่มต้องวิ่งกลับมาหาบอท
+    snatch.shown_at = time.monotonic()
+    latency = shard_latency(snatch.interaction)
+    snatch.latency = min(latency, MAX_LATENCY_BONUS) if math.isfinite(latency) else 0.0
+    snatch.expiry = timers.call_later(snatch.time_limit + snatch.latency, expire_snatch, snatch)
+
+async def expire_snatch(snatch):
+    if end_round(snatch):
+        await finish_snatch(snatch)
+
+async def finish_snatch(snatch):
+    """บันทึกผลรอบนี้แล้วแจ้งผลทาง followup ของคำสั่ง snatch (ผ่าน outbox ไม่รอส่ง)"""
+    interaction, guild_id, user_id = snatch.interaction, snatch.guild_id, snatch.user_id
+    bucket = interaction.id  # followup ใช้ webhook ของ interaction นี้
+    clicked = snatch.clicked_at is not None
+    reaction = max(snatch.clicked_at - snatch.shown_at - snatch.latency, 0.0) if clicked else None
+    record = (snatch.time_limit, snatch.latency, reaction)
+
+    if clicked:
+        new_count = snatch.count + 1
+        is_finished = (new_count >= 5)
         
-        self.clicked = True
-        button.disabled = True
-        button.label = "คว้าทัน!"
-        await interaction.response.edit_message(view=self)
-        self.stop()
+        await db.update_snow_progress(guild_id, user_id, new_count, is_finished, snatch.link, record)
+
+        if is_finished:
+            outbox.send(bucket, interaction.followup.send, content=f"<@{user_id}>", embed=catalog.embed("snowflake.win"))
+            notify_admins(interaction, catalog.text("digest.snowflake", user_id=user_id))
+        else:
+            outbox.send(bucket, interaction.followup.send, catalog.text("snowflake.caught", count=new_count))
+    else:
+        await db.update_snow_progress(guild_id, user_id, snatch.count, False, snatch.link, record)
+        outbox.send(bucket, interaction.followup.send, catalog.text("snowflake.missed", time_limit=snatch.time_limit))
 
 @snow_group.command(name="start", description="รับภารกิจสะสมเกล็ดหิมะ")
 @app_commands.describe(link="วางลิงก์โพสต์แรกเพื่อเริ่มงาน")
 async def snow_start(interaction: discord.Interaction, link: str):
     user_id = interaction.user.id
-    player = get_snow_player(user_id)
+    player = await db.get_snow_player(interaction.guild_id, user_id)
 
     if player:
-        await interaction.response.send_message("❄️ **แมทธิว:** คุณรับภารกิจนี้ไปแล้วครับ เริ่มสะสมด้วยคำสั่ง `/snowflake snatch` ได้เลย", ephemeral=True)
+        await reply(interaction, catalog.text("snowflake.already_started"), ephemeral=True)
         return
-    if not link.startswith(TARGET_URL):
-        await interaction.response.send_message(f"❌ ลิงก์ไม่ถูกต้องครับ", ephemeral=True)
+    if not is_valid_link(link):
+        await reply(interaction, catalog.text("snowflake.bad_start_link"), ephemeral=True)
+        return
+    if not await link_exists(link):
+        await reply(interaction, catalog.text("common.link_not_found", tid=parse_tid(link)), ephemeral=True)
         return
 
-    create_snow_player(user_id, link)
+    await db.create_snow_player(interaction.guild_id, user_id, link)
     
-    embed = discord.Embed(
-        title="❄️ พายุหิมะโหมกระหน่ำ?",
-        description=(
-            f"สวัสดีครับ ผมต้องการเกล็ดหิมะที่สมบูรณ์ทั้งหมด 5 ชิ้น\n"
-            "มันจะตกลงมาเร็วมาก คุณต้องตาไวหน่อยนะ\n\n"
-            "**วิธีเล่น:**\n"
-            "1. โรลเพลย์เดินตามหาจุดที่หิมะตกเพื่อเก็บหิมะที่สมบูรณ์แบบ\n"
-            "2. มาพิมพ์ `/snowflake snatch`\n พร้อมแนบลิงก์โรลเพลย์"
-            "3. รอจังหวะ... พอปุ่มสีเขียวเด้งขึ้นมา ให้รีบกด **'คว้าเลย!'** ให้ทัน\n"
-            "4. ยิ่งเก็บเยอะ... เวลาจะยิ่งน้อยลง ระวังให้ดีล่ะ"
-        ),
-        color=0xffffff
-    )
-    await interaction.response.send_message(embed=embed)
+    await reply(interaction, embed=catalog.embed("snowflake.start"))
 
 @snow_group.command(name="snatch", description="ส่งลิงก์แล้วรอกดปุ่มคว้าหิมะ!")
 @app_commands.describe(link="วางลิงก์โรลเพลย์ล่าสุด")
 async def snow_snatch(interaction: discord.Interaction, link: str):
     user_id = interaction.user.id
-    player = get_snow_player(user_id)
+    player = await db.get_snow_player(interaction.guild_id, user_id)
 
     if not player:
-        await interaction.response.send_message("⚠️ รับภารกิจก่อนครับ พิมพ์ `/snowflake start`", ephemeral=True)
+        await reply(interaction, catalog.text("snowflake.not_started"), ephemeral=True)
         return
     
-    count, completed, links_str = player
-    links_list = json.loads(links_str)
-
-    if completed:
-        await interaction.response.send_message("🎉 คุณเก็บครบ 5 ชิ้นไปแล้วครับ! พักผ่อนเถอะ", ephemeral=True)
+    if player[1]:
+        await reply(interaction, catalog.text("snowflake.already_done"), ephemeral=True)
         return
-    if not link.startswith(TARGET_URL):
-        await interaction.response.send_message("❌ ลิงก์ผิดครับ", ephemeral=True)
+    if not is_valid_link(link):
+        await reply(interaction, catalog.text("snowflake.bad_link"), ephemeral=True)
         return
-    if link in links_list:
-        await interaction.response.send_message("⚠️ ลิงก์ซ้ำ! ต้องเป็นโรลเพลย์ใหม่นะครับ", ephemeral=True)
+    if await db.has_submission(interaction.guild_id, GAME_SNOWFLAKE, user_id, parse_tid(link)):
+        await reply(interaction, catalog.text("snowflake.duplicate"), ephemeral=True)
+        return
+    if not await link_exists(link):
+        await reply(interaction, catalog.text("common.link_not_found", tid=parse_tid(link)), ephemeral=True)
         return
 
-    await interaction.response.defer() 
-
-    embed_wait = discord.Embed(title="👀 กำลังเพ่งมองท้องฟ้า...", description="รอก่อนนะ... อย่าเพิ่งกะพริบตา...", color=0x95a5a6)
-    original_msg = await interaction.followup.send(embed=embed_wait)
-
-    await asyncio.sleep(random.uniform(2, 5))
-
-    time_limit = 3.0 - (count * 0.5) 
-    if time_limit < 0.8: time_limit = 0.8 
-
-    view = SnatchView(user_id, time_limit)
-    embed_now = discord.Embed(title="❄️ หิมะร่วงลงมาแล้ว!!", description=f"**กดปุ่มเดี๋ยวนี้!!** (ภายใน {time_limit} วินาที)", color=0x2ecc71)
-    await interaction.edit_original_response(embed=embed_now, view=view)
-
-    await view.wait()
-
-    if view.clicked:
-        links_list.append(link)
-        new_count = count + 1
-        is_finished = (new_count >= 5)
-        
-        update_snow_progress(user_id, new_count, is_finished, links_list)
+    # อ่านยอดใหม่หลัง await ข้างบน (รอบก่อนหน้าอาจจบไปแล้ว) แล้วเช็ครอบซ้อนกับจองรอบติดกันโดยไม่มี await คั่น
+    player = await db.get_snow_player(interaction.guild_id, user_id)
+    if not player:
+        await reply(interaction, catalog.text("snowflake.not_started"), ephemeral=True)
+        return
+    count, completed = player
+    if (interaction.guild_id, user_id) in snatching:
+        await reply(interaction, catalog.text("snowflake.in_progress"), ephemeral=True)
+        return
+    if completed:
+        await reply(interaction, catalog.text("snowflake.already_done"), ephemeral=True)
+        return
+    snatch = pending_snatches[interaction.id] = SnatchRound(interaction, count, link)
+    snatching.add((interaction.guild_id, user_id))
+    try:
+        await defer(interaction)
+        await interaction.followup.send(embed=catalog.embed("snowflake.wait"))
+    except discord.HTTPException:
+        end_round(snatch)
+        raise
 
-        if is_finished:
-            embed_win = discord.Embed(
-                title="💎 รวบรวมเกล็ดหิมะครบแล้ว!",
-                description=f"สุดยอด! คุณคว้าเกล็ดหิมะครบ **5/5 ชิ้น** แล้ว!\nยินดีด้วยครับ อย่าลืมไปทำภารกิจหาชิ้นส่วนอื่นให้ครบด้วยล่ะ!",
-                color=0x87a5da
-            )
-            embed_win.set_image(url="https://iili.io/fxKERr7.png")
-            await interaction.followup.send(content=f"<@{user_id}> <@{ADMIN_ID}>", embed=embed_win)
-        else:
-            await interaction.followup.send(f"✅ **คว้าทัน!** (สะสม: {new_count}/5)\nเก่งมาก! ไปโรลเพลย์หาชิ้นต่อไปมา!")
-    else:
-        links_list.append(link)
-        update_snow_progress(user_id, count, False, links_list)
-        await interaction.followup.send(f"💨 **ว้า... พลาด!**\nเกล็ดหิมะละลายไปแล้ว (เวลา {time_limit} วิ)\n(ลิงก์นี้ถือว่าใช้ไปแล้วนะ ต้องไปโรลใหม่!)")
+    timers.call_later(random.uniform(*SNATCH_DELAY), reveal_snatch, snatch)
 
 @snow_group.command(name="check", description="[Admin] เช็คยอดเกล็ดหิมะ")
 async def snow_check(interaction: discord.Interaction):
-    if interaction.user.id != ADMIN_ID:
-        await interaction.response.send_message("เฉพาะคุณแมทธิวครับ", ephemeral=True)
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("snowflake.admin_only"), ephemeral=True)
         return
     
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, count, completed FROM snowflakes")
-        players = cursor.fetchall()
-        
-    if not players:
-        await interaction.response.send_message("ยังไม่มีใครเล่นเลยครับ", ephemeral=True)
+    view = ReportView(interaction.guild_id, GAME_SNOWFLAKE, catalog.text("snowflake.report_title"), format_snow_row)
+    if not await view.open():
+        await reply(interaction, catalog.text("snowflake.report_empty"), ephemeral=True)
         return
-
-    report = "**📊 รายงาน Snowflake**\n"
-    for row in players:
-        uid, cnt, comp = row
-        status = "✅ ครบ" if comp else f"❄️ {cnt}/5"
-        report += f"• <@{uid}> : {status}\n"
-    await interaction.response.send_message(report, ephemeral=True)
+    await reply(interaction, view.render(), view=view, ephemeral=True)
 
 @snow_group.command(name="reset", description="[Admin] รีเซ็ต Snowflake ผู้เล่น")
 @app_commands.describe(member="เลือกคนที่จะรีเซ็ต")
 async def snow_reset(interaction: discord.Interaction, member: discord.Member):
-    if interaction.user.id != ADMIN_ID:
-        await interaction.response.send_message("❌ เฉพาะ Admin", ephemeral=True)
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
         return
     
-    player = get_snow_player(member.id)
+    player = await db.get_snow_player(interaction.guild_id, member.id)
     if player:
-        delete_snow_player(member.id)
-        await interaction.response.send_message(f"♻️ **Snowflake:** รีเซ็ตข้อมูล {member.mention} เรียบร้อย", ephemeral=True)
+        await db.delete_snow_player(interaction.guild_id, member.id)
+        await reply(interaction, catalog.text("snowflake.reset_done", member=member.mention), ephemeral=True)
     else:
-        await interaction.response.send_message(f"⚠️ ไม่พบข้อมูล", ephemeral=True)
+        await reply(interaction, catalog.text("snowflake.reset_missing"), ephemeral=True)
 
 
 # ==================================================================
 # 🗝️ GROUP 3: VAULT (ภารกิจคู่หู - ทนความหนาว 4-19 ครั้ง)
 # ==================================================================
-vault_group = app_commands.Group(name="vault", description="ภารกิจคู่หู: เปิดตู้นิรภัยน้ำแข็ง")
+vault_group = app_commands.Group(name="vault", description="ภารกิจคู่หู: เปิดตู้นิรภัยน้ำแข็ง", guild_only=True)
 
 @vault_group.command(name="create", description="จับคู่สร้างทีมเพื่อเริ่มภารกิจ")
 @app_commands.describe(partner="แท็กคู่หูของคุณ")
@@ -478,199 +919,170 @@ async def vault_create(interaction: discord.Interaction, partner: discord.Member
     user2 = partner
 
     if user1.id == user2.id:
-        await interaction.response.send_message("❌ จับคู่กับตัวเองไม่ได้ครับ! ต้องหาเพื่อน", ephemeral=True)
+        await reply(interaction, catalog.text("vault.self_pair"), ephemeral=True)
         return
     if user2.bot:
-        await interaction.response.send_message("❌ จับคู่กับบอทไม่ได้ครับ", ephemeral=True)
+        await reply(interaction, catalog.text("vault.bot_pair"), ephemeral=True)
         return
 
     # เช็คว่าใครคนใดคนหนึ่งมีทีมอยู่แล้วรึเปล่า
-    team1 = get_vault_team(user1.id)
-    team2 = get_vault_team(user2.id)
+    team1 = await db.get_vault_team(interaction.guild_id, user1.id)
+    team2 = await db.get_vault_team(interaction.guild_id, user2.id)
 
     if team1 or team2:
-        await interaction.response.send_message("⚠️ คุณหรือคู่หูของคุณมีทีมอยู่แล้ว! ต้อง `/vault reset` ของเก่าก่อน", ephemeral=True)
+        await reply(interaction, catalog.text("vault.has_team"), ephemeral=True)
         return
 
     # VAULT TARGET: 4-19 ครั้ง
     target_attempts = random.randint(4, 19)
-    warmer_id, turner_id = create_vault_team(user1.id, user2.id, target_attempts)
+    roles = await db.create_vault_team(interaction.guild_id, user1.id, user2.id, target_attempts)
+    if roles is None:
+        # อีกคนชิงสร้างทีมตัดหน้าไประหว่างที่เช็คอยู่
+        await reply(interaction, catalog.text("vault.has_team"), ephemeral=True)
+        return
+    warmer_id, turner_id = roles
     
     # กำหนด Role text
-    role_msg = ""
     if warmer_id == user1.id:
-        role_msg = f"🔥 **Warmer (คนละลาย):** {user1.mention}\n🔑 **Turner (คนไข):** {user2.mention}"
+        role_msg = catalog.text("vault.roles", warmer=user1.mention, turner=user2.mention)
     else:
-        role_msg = f"🔥 **Warmer (คนละลาย):** {user2.mention}\n🔑 **Turner (คนไข):** {user1.mention}"
-
-    embed = discord.Embed(
-        title="❄️ Vault Team Created: ภารกิจทนความหนาว",
-        description=(
-            f"จับคู่สำเร็จ! ระหว่าง {user1.mention} และ {user2.mention}\n\n"
-            f"**บทบาทของคุณ:**\n{role_msg}\n\n"
-            "**กติกา:**\n"
-            "1. **Warmer:** โรลเพลย์ใช้ไออุ่นร่างกาย/ลมหายใจทำให้รูน้ำแข็งละลาย ห้ามใช้ไฟเด็ดขาด!\n"
-            "2. **Turner:** โรลเพลย์ออกแรงบิดกุญแจ\n"
-            "3. **ทั้งคู่ต้องโรลเพลย์** แล้วนำลิงก์มาส่งด้วย `/vault submit` (ต้องส่งทั้ง 2 คนถึงจะจบรอบ)\n"
-            "4. ระบบจะสุ่มความสำเร็จ... ต้องทำให้ถึง 100% ถึงจะเปิดออก\n"
-            "5. ยิ่งใช้เวลานาน... ยิ่งหนาว!!!"
-        ),
-        color=0x9b59b6 # สีม่วง
-    )
-    await interaction.response.send_message(content=f"{user1.mention} {user2.mention}", embed=embed)
+        role_msg = catalog.text("vault.roles", warmer=user2.mention, turner=user1.mention)
+
+    embed = catalog.embed("vault.created", user1=user1.mention, user2=user2.mention, roles=role_msg)
+    await reply(interaction, content=f"{user1.mention} {user2.mention}", embed=embed)
 
 @vault_group.command(name="submit", description="ส่งลิงก์ภารกิจคู่หู (ต้องส่งทั้ง 2 คน)")
 @app_commands.describe(link="วางลิงก์โพสต์ของคุณ")
 async def vault_submit(interaction: discord.Interaction, link: str):
     user_id = interaction.user.id
-    team_data = get_vault_team(user_id)
-
-    if not team_data:
-        await interaction.response.send_message("⚠️ คุณยังไม่มีทีม! ใช้ `/vault create` ก่อน", ephemeral=True)
+    if not is_valid_link(link):
+        await reply(interaction, catalog.text("vault.bad_link"), ephemeral=True)
+        return
+    # ไม่มีทีมไม่ต้องเช็คลิงก์ submit_vault_link จะตอบ VAULT_NO_TEAM เอง
+    if await db.get_vault_team(interaction.guild_id, user_id) is not None and not await link_exists(link):
+        await reply(interaction, catalog.text("common.link_not_found", tid=parse_tid(link)), ephemeral=True)
         return
-    
-    # Unpack Data
-    team_id, u1, u2, r_warm, r_turn, attempts, target, completed, links_str, r_link1, r_link2 = team_data
-    links_list = json.loads(links_str)
 
-    if completed:
-        await interaction.response.send_message("✅ ทีมนี้เปิดตู้สำเร็จไปแล้วครับ!", ephemeral=True)
+    # เขียนลิงก์และปิดรอบเป็น transaction เดียว (ถ้าคู่หูกดส่งพร้อมกันก็ไม่หาย/ไม่นับซ้ำ)
+    status, team_data = await db.submit_vault_link(interaction.guild_id, user_id, link)
+
+    if status == VAULT_NO_TEAM:
+        await reply(interaction, catalog.text("vault.no_team"), ephemeral=True)
         return
-    if not link.startswith(TARGET_URL):
-        await interaction.response.send_message("❌ ลิงก์ไม่ถูกต้อง", ephemeral=True)
+    if status == VAULT_COMPLETED:
+        await reply(interaction, catalog.text("vault.completed"), ephemeral=True)
         return
-    if link in links_list:
-        await interaction.response.send_message("⚠️ ลิงก์นี้เคยใช้ในรอบก่อนๆ แล้ว! ต้องใช้ลิงก์ใหม่", ephemeral=True)
+    if status == VAULT_DUPLICATE:
+        await reply(interaction, catalog.text("vault.duplicate"), ephemeral=True)
+        return
+    if status == VAULT_PARTNER_DUPLICATE:
+        await reply(interaction, catalog.text("vault.partner_duplicate"), ephemeral=True)
+        return
+    if status == VAULT_ALREADY_SENT:
+        await reply(interaction, catalog.text("vault.already_sent"), ephemeral=True)
         return
 
-    # Identify User & Check Duplicate
+    # Unpack Data
+    team_id, u1, u2, r_warm, r_turn, attempts, target, completed, r_link1, r_link2 = team_data
     is_user1 = (user_id == u1)
-    
-    if (is_user1 and r_link1) or (not is_user1 and r_link2):
-        await interaction.response.send_message("⏳ **ใจเย็นครับ!** คุณส่งลิงก์ของรอบนี้ไปแล้ว **รอคู่หูของคุณส่งก่อน** ถึงจะเริ่มรอบใหม่ได้", ephemeral=True)
-        return
 
-    update_vault_round_link(team_id, is_user1, link)
-    
-    if is_user1: r_link1 = link
-    else: r_link2 = link
-
-    if r_link1 and r_link2:
-        # --- ครบ 2 คนแล้ว! ประมวลผลรอบได้ ---
-        links_list.append(r_link1)
-        links_list.append(r_link2)
-        new_attempts = attempts + 1
-        
-        is_success = new_attempts >= target
-        
-        if is_success:
-            complete_vault_round(team_id, new_attempts, True, links_list)
-            
-            success_embed = discord.Embed(
-                title="🔓 ตู้นิรภัยเปิดออกแล้ว! (100%)",
-                description=(
-                    f"หลังจากร่วมมือกันมา {new_attempts} รอบ (รวม {new_attempts*2} โพสต์)\n"
-                    f"ความอบอุ่นและความสามัคคีของพวกคุณเอาชนะน้ำแข็งได้!\n\n"
-                    f"🎉 ยินดีด้วย: <@{u1}> และ <@{u2}>\n"
-                    f"อย่าลืมไปทำภารกิจหาชิ้นส่วนอื่นให้ครบด้วยล่ะ!"
-                ),
-                color=0x87a5da
-            )
-            success_embed.set_image(url="https://iili.io/fxKEzX4.png")
-            
-            await interaction.response.send_message(content=f"<@{u1}> <@{u2}> <@{ADMIN_ID}>", embed=success_embed)
+    if status == VAULT_ROUND:
+        # --- ครบ 2 คนแล้ว! รอบถูกปิดไปพร้อมกับการบันทึกลิงก์ ---
+        new_attempts = attempts
+
+        if completed:
+            success_embed = catalog.embed("vault.success", attempts=new_attempts, posts=new_attempts * 2, user1_id=u1, user2_id=u2)
+            await reply(interaction, content=f"<@{u1}> <@{u2}>", embed=success_embed)
+            notify_admins(interaction, catalog.text("digest.vault", user1_id=u1, user2_id=u2, attempts=new_attempts))
         
         else:
             raw_percent = int((new_attempts / target) * 100)
             display_percent = min(raw_percent + random.randint(-5, 5), 95) 
             if display_percent < 5: display_percent = 5
-            
-            complete_vault_round(team_id, new_attempts, False, links_list)
-            
+
             # --- PROGRESSIVE COLD DESCRIPTION ---
-            # รายการข้อความบรรยายความหนาวตามลำดับรอบ (รอบที่ 1 -> รอบสุดท้าย)
-            cold_desc_list = [
-                "", # index 0 (ไม่ใช้)
-                "*อากาศเริ่มเย็นแบบเปิดแอร์เบอร์ 18... ขนลุกซู่เหมือนโดนผีหลอก*",
-                "*ลมหายใจกลายเป็นไอ... นึกว่าตัวเองเป็นมังกรพ่นควันเท่ๆ แต่จริงๆ คือหนาว*",
-                "*มือเริ่มเย็นเจี๊ยบเหมือนจับแก้วกาแฟดำนานเกินไป... ใครก็ได้ขอถุงมือที!*",
-                "*ลมพัดแรงจนทรงผมเสียทรงหมดแล้ว! น้ำแข็งเริ่มเกาะคิ้วจนดูแก่ขึ้น 10 ปี*",
-                "*ฟันเริ่มกระทบกันกึกๆๆ... เป็นจังหวะสามช่าโดยไม่ได้ตั้งใจ*",
-                "*นิ้วแข็งจนขยับยาก... จะแคะจมูกยังลำบากเลยตอนนี้*",
-                "*น้ำมูกเริ่มไหลย้อยลงมา... หวังว่าจะไม่มีใครเห็นนะ สู๊ดดด!*",
-                "*หนาวจนอยากจะขดตัวเป็นก้อนกลมๆ เหมือนแมว... แต่ติดที่ต้องไขกุญแจเนี่ยสิ*",
-                "*เริ่มเห็นภาพหลอนว่ากุญแจกลายเป็นไอติมแท่ง... อยากจะเลียชะมัด*",
-                "*หน้าตึงไปหมดแล้ว... ยิ้มไม่ได้เลย กลัวหน้าแตก (แตกจริงๆ นะ)*",
-                "*ตัวสั่นพั่บๆๆ เป็นเจ้าเข้า... ใครเปิดเพลง EDM แถวนี้รึเปล่า?*",
-                "*ปากสั่นจนพูดไม่รู้เรื่องแล้ว... ยะ...ยะ...อยาก...กะ...กะ...กลับ...บะ...บ้าน!*",
-                "*น้ำตาไหลออกมาแล้วแข็งเป็นเม็ดไข่มุก... เก็บไปขายได้ไหมเนี่ย?*",
-                "*เริ่มรู้สึกว่าการเป็นก้อนน้ำแข็งประดับสวนก็ไม่เลวนะ... ไม่ต้องขยับ สบายดี*",
-                "*สติเริ่มลอย... เห็นเพนกวินเดินสวนสนามผ่านหน้าไป... โบกมือทักทายมันดีไหม?*",
-                "*(วิกฤต) วิญญาณพยายามจะหลุดออกจากร่าง... แต่ติดที่น้ำแข็งเกาะขาไว้ ไปไม่ได้!*",
-                "*(ขั้นสุด) ตอนนี้สภาพเหมือนไก่แช่แข็งในช่องฟรีซ... ใครก็ได้เอาไดร์เป่าผมมาเป่าที!!!*"
-            ]
-            
-            # เลือกว่าจะเอาข้อความไหน (ถ้ารอบเกิน 17 ให้ใช้ข้อความสุดท้าย)
-            idx = min(new_attempts, 17)
-            situation_text = cold_desc_list[idx]
-
-            fail_embed = discord.Embed(
-                title=f"❄️ Status: FROZEN ({display_percent}%)",
-                description=(
-                    f"**จบรอบที่ {new_attempts}** (ได้รับลิงก์จากทั้งคู่แล้ว)\n"
-                    f"น้ำแข็งละลายไปบ้าง... แต่ยังเปิดไม่ออก!\n\n"
-                    f"### {situation_text}"
-                ),
-                color=0x3498db
-            )
-            await interaction.response.send_message(content=f"<@{u1}> <@{u2}>", embed=fail_embed)
+            # ข้อความบรรยายความหนาวตามลำดับรอบ (ถ้ารอบเกินรายการให้ใช้ข้อความสุดท้าย)
+            situation_text = catalog.pick("vault.cold", new_attempts - 1)
+            fail_embed = catalog.embed("vault.frozen", percent=display_percent, attempts=new_attempts, situation=situation_text)
+            await reply(interaction, content=f"<@{u1}> <@{u2}>", embed=fail_embed)
 
     else:
         partner_id = u2 if is_user1 else u1
-        await interaction.response.send_message(
-            f"📥 **รับลิงก์แล้ว!** (รอคู่หู <@{partner_id}> มาส่งงาน...)\n"
-            f"*เมื่อเพื่อนส่งครบแล้ว ระบบจะประมวลผลทันที*",
-            ephemeral=True
-        )
+        await reply(interaction, catalog.text("vault.waiting", partner_id=partner_id), ephemeral=True)
 
 @vault_group.command(name="check", description="[Admin] เช็คทีม Vault ทั้งหมด")
 async def vault_check(interaction: discord.Interaction):
-    if interaction.user.id != ADMIN_ID:
-        await interaction.response.send_message("❌ เฉพาะ Admin", ephemeral=True)
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
         return
 
-    vaults = get_all_vaults()
-    if not vaults:
-        await interaction.response.send_message("📂 ยังไม่มีทีม Vault", ephemeral=True)
+    view = ReportView(interaction.guild_id, GAME_VAULT, catalog.text("vault.report_title"), format_vault_row)
+    if not await view.open():
+        await reply(interaction, catalog.text("vault.report_empty"), ephemeral=True)
         return
-
-    report = "**📊 รายงาน Vault Teams (Target 4-19)**\n"
-    for row in vaults:
-        u1, u2, att, target, comp = row
-        status = "✅ Unlock" if comp else f"🔒 {att}/{target}"
-        report += f"• Team <@{u1}>+<@{u2}> : {status}\n"
-    
-    await interaction.response.send_message(report, ephemeral=True)
+    await reply(interaction, view.render(), view=view, ephemeral=True)
 
 @vault_group.command(name="reset", description="[Admin] ลบทีม Vault")
 @app_commands.describe(member="เลือกสมาชิกในทีมที่จะลบ (ใครก็ได้ในคู่)")
 async def vault_reset(interaction: discord.Interaction, member: discord.Member):
-    if interaction.user.id != ADMIN_ID:
-        await interaction.response.send_message("❌ เฉพาะ Admin", ephemeral=True)
+    if not await is_admin(interaction):
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
         return
     
-    team_data = get_vault_team(member.id)
+    team_data = await db.get_vault_team(interaction.guild_id, member.id)
     if team_data:
         team_id = team_data[0] # index 0 is team_id
-        delete_vault_team(team_id)
-        await interaction.response.send_message(f"♻️ **Vault:** ลบทีมของ {member.mention} เรียบร้อย (คู่หูก็โดนลบด้วย)", ephemeral=True)
+        await db.delete_vault_team(interaction.guild_id, team_id)
+        await reply(interaction, catalog.text("vault.reset_done", member=member.mention), ephemeral=True)
+    else:
+        await reply(interaction, catalog.text("vault.reset_missing"), ephemeral=True)
+
+# ==================================================================
+# 📋 PROFILE (ความคืบหน้าทุกเกมในคำสั่งเดียว)
+# ==================================================================
+def profile_status(done):
+    return catalog.text("profile.done" if done else "profile.in_progress")
+
+def profile_lines(profile, detailed):
+    """detailed = มุมมอง Admin (เห็นเป้าจริง ซึ่งผู้เล่นไม่ได้เห็นในเกม)"""
+    player, snow, team = profile
+    suffix = "_admin" if detailed else ""
+    lines = []
+    if player:
+        lines.append(catalog.text("profile.iceberg" + suffix, attempts=player[0], target=player[1], status=profile_status(player[2])))
     else:
-        await interaction.response.send_message(f"⚠️ สมาชิกคนนี้ไม่มีทีม", ephemeral=True)
+        lines.append(catalog.text("profile.iceberg_none"))
+    if snow:
+        lines.append(catalog.text("profile.snowflake", count=snow[0], status=profile_status(snow[1])))
+    else:
+        lines.append(catalog.text("profile.snowflake_none"))
+    if team:
+        lines.append(catalog.text("profile.vault" + suffix, user1_id=team[1], user2_id=team[2], attempts=team[5],
+                                  target=team[6], sent=(team[8] is not None) + (team[9] is not None), status=profile_status(team[7])))
+    else:
+        lines.append(catalog.text("profile.vault_none"))
+    return "\n".join(lines)
+
+@app_commands.command(name="profile", description="ดูความคืบหน้าทุกเกมของตัวเอง (Admin ดูของคนอื่นได้)")
+@app_commands.describe(member="[Admin] คนที่จะดู (ไม่ใส่ = ตัวเอง)")
+@app_commands.guild_only()
+async def profile(interaction: discord.Interaction, member: discord.Member = None):
+    member = member or interaction.user
+    admin = await is_admin(interaction)
+    if member.id != interaction.user.id and not admin:
+        await reply(interaction, catalog.text("common.admin_only"), ephemeral=True)
+        return
+
+    data = await db.get_profile(interaction.guild_id, member.id)
+    embed = catalog.embed("profile", name=member.display_name, lines=profile_lines(data, admin))
+    await reply(interaction, embed=embed, ephemeral=True)
 
 # Add Groups to Tree (ตรวจสอบแล้ว: ไม่มี Duplicate!)
 client.tree.add_command(iceberg_group)
 client.tree.add_command(snow_group)
 client.tree.add_command(vault_group)
+client.tree.add_command(profile)
 
 # Run Bot
-client.run(TOKEN)
+if __name__ == "__main__":
+    client.run(TOKEN)
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+
+# งานดูแลไฟล์ฐานข้อมูลเบื้องหลัง: backup ตามรอบ (ระหว่างบอททำงาน) และคืนพื้นที่ว่างตอนไม่มีใครเขียน
+BACKUP_INTERVAL = 6 * 3600   # วินาที ระหว่าง backup
+BACKUP_KEEP = 8              # เก็บไฟล์ backup ล่าสุดไว้กี่ไฟล์
+BACKUP_PREFIX = "iceberg-"
+MAINTENANCE_INTERVAL = 60    # วินาที ระหว่างการเช็คว่าถึงเวลาทำอะไรหรือยัง
+QUIET_PERIOD = 30            # ไม่มีงานเขียนนานเท่านี้ = ช่วงเงียบ ทำ compaction ได้
+COMPACT_MIN_PAGES = 256      # หน้าว่างน้อยกว่านี้ไม่คุ้มทำ
+COMPACT_PAGES = 128          # หน้าที่คืนต่อรอบ (หนึ่งรอบ = หนึ่งงานสั้นๆ บน DB thread)
+
+
+class Maintenance:
+    def __init__(self, db, backup_dir=None, interval=BACKUP_INTERVAL, keep=BACKUP_KEEP):
+        self.db = db
+        self.backup_dir = backup_dir  # None = ไม่ backup ทำแค่ compaction
+        self.interval = interval
+        self.keep = keep
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+            try:
+                if self.backup_due():
+                    await self.run_backup()
+                if self.db.is_quiet(QUIET_PERIOD):
+                    await self.compact()
+            except Exception as e:
+                print(f"maintenance ไม่สำเร็จ: {e}")
+
+    # --- BACKUP ---
+    def backups(self):
+        """ไฟล์ backup ที่มีอยู่ เก่าสุดก่อน (ชื่อไฟล์มีเวลาอยู่แล้ว เรียงตามชื่อได้เลย)"""
+        if not self.backup_dir or not os.path.isdir(self.backup_dir):
+            return []
+        names = sorted(name for name in os.listdir(self.backup_dir)
+                       if name.startswith(BACKUP_PREFIX) and name.endswith(".db"))
+        return [os.path.join(self.backup_dir, name) for name in names]
+
+    def backup_due(self):
+        # นับจากไฟล์ล่าสุดบนดิสก์ รีสตาร์ทบอทบ่อยๆ จะได้ไม่ backup ซ้ำทุกครั้ง
+        if not self.backup_dir:
+            return False
+        existing = self.backups()
+        return not existing or time.time() - os.path.getmtime(existing[-1]) >= self.interval
+
+    async def run_backup(self):
+        """backup ทันที แล้วลบไฟล์เก่าที่เกินจำนวนที่เก็บ คืน path ของไฟล์ใหม่"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        path = os.path.join(self.backup_dir, time.strftime(f"{BACKUP_PREFIX}%Y%m%d-%H%M%S.db"))
+        started = time.perf_counter()
+        size = await self.db.backup(path)
+        for old in self.backups()[:-self.keep]:
+            os.remove(old)
+        print(f"Backup {path} ({size / 2**20:.1f} MB, {time.perf_counter() - started:.1f}s)")
+        return path
+
+    # --- COMPACTION ---
+    async def compact(self):
+        """คืนหน้าว่างทีละรอบสั้นๆ หยุดทันทีที่มีงานเขียนเข้ามา แล้วตัด WAL ให้สั้น คืนจำนวนหน้าที่คืนไป"""
+        free = await self.db.freelist_pages()
+        if free < COMPACT_MIN_PAGES:
+            return 0
+        remaining = free
+        while remaining and self.db.is_quiet(QUIET_PERIOD):
+            remaining = await self.db.compact_step(COMPACT_PAGES)
+        if self.db.is_quiet(QUIET_PERIOD):
+            await self.db.checkpoint()
+        return free - remaining
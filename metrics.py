@@ -0,0 +1,227 @@
+import asyncio
+import math
+import time
+from bisect import bisect_left
+
+# ขอบบนของแต่ละช่อง histogram (วินาที) snowflake snatch รอคนกดปุ่มได้หลายวินาทีเลยมีช่องยาวๆ ด้วย
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+LOOP_LAG_INTERVAL = 0.5  # วินาที
+
+# /iceberg stats ต้องพอดีข้อความเดียวของ Discord (2000 ตัวอักษร) แสดงเฉพาะอันดับต้นๆ (ครบทุกตัวดูได้ที่ /metrics)
+SUMMARY_NAME_WIDTH = 24
+SUMMARY_TOP_COMMANDS = 12
+SUMMARY_TOP_DB = 8
+SUMMARY_TOP_COUNTERS = 5
+
+
+def _name(name):
+    width = SUMMARY_NAME_WIDTH - 1
+    return name if len(name) <= width else name[:width - 1] + "…"
+
+
+def _top_counts(counts):
+    """ "ชื่อ=n" เรียงจากมากไปน้อย ตัดเหลือ SUMMARY_TOP_COUNTERS อัน"""
+    ranked = sorted(counts.items(), key=lambda item: -item[1])
+    text = ", ".join(f"{name}={n}" for name, n in ranked[:SUMMARY_TOP_COUNTERS])
+    if len(ranked) > SUMMARY_TOP_COUNTERS:
+        text += f" (+{len(ranked) - SUMMARY_TOP_COUNTERS} more)"
+    return text
+
+
+class Histogram:
+    """นับจำนวนค่าในแต่ละช่องเวลา (ช่องสะสมแบบ Prometheus ตอน export)"""
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """ประมาณค่า quantile จากขอบบนของช่องที่ตกอยู่ (หยาบ แต่พอดูว่าช้าตรงไหน)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound if bound != math.inf else BUCKETS[-2]
+        return BUCKETS[-2]
+
+
+class CommandStats:
+    __slots__ = ("latency", "errors")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+
+
+class Metrics:
+    """ที่เก็บตัวเลขทั้งหมดของบอท ฝั่ง DB ถูกเขียนจาก worker thread เดียว ที่เหลือเขียนจาก event loop"""
+
+    def __init__(self):
+        self.commands = {}   # ชื่อคำสั่ง -> CommandStats
+        self.db = {}         # ชื่อ helper -> Histogram (เวลาที่รันจริงบน worker)
+        self.db_wait = {}    # ชื่อ helper -> Histogram (เวลารอคิว worker)
+        self.loop_lag = Histogram()
+        self.link_check = Histogram()  # เวลาที่ใช้เช็คลิงก์กับฟอรัม (เฉพาะที่ไม่โดน cache)
+        self.gateway_latency = math.nan
+        self.inflight = 0              # handler ที่ผ่านประตูและยังทำงานอยู่
+        self.queue_peak = 0            # คิวรอประตูยาวสุดตั้งแต่บอทเริ่ม
+        self.queue_wait = Histogram()  # เวลาที่รอคิวประตู (เฉพาะคนที่ต้องรอ)
+        self.rejected = {}             # (ชื่อคำสั่ง, เหตุผล) -> จำนวนที่ถูกตีกลับ
+        self.deferred = {}             # ชื่อคำสั่ง -> จำนวนครั้งที่ต้อง defer ให้อัตโนมัติ (ตอบไม่ทัน 3 วินาที)
+        self.gate = None               # ConcurrencyGate ที่ใช้อยู่ (อ่านความยาวคิวตอน export)
+        self.outbox = None             # Outbox ที่ใช้อยู่ (คิวข้อความขาออก)
+        self.caches = {}               # ชื่อ -> LRUCache ที่ลงทะเบียนไว้ (อ่าน hit/miss ตอน export)
+
+    def observe_command(self, name, seconds, failed=False):
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        stats.latency.observe(seconds)
+        if failed:
+            stats.errors += 1
+
+    def observe_db(self, name, seconds, waited):
+        for table, value in ((self.db, seconds), (self.db_wait, waited)):
+            hist = table.get(name)
+            if hist is None:
+                hist = table[name] = Histogram()
+            hist.observe(value)
+
+    def observe_queue(self, depth):
+        self.queue_peak = max(self.queue_peak, depth)
+
+    def observe_rejected(self, name, reason):
+        key = (name, reason)
+        self.rejected[key] = self.rejected.get(key, 0) + 1
+
+    def observe_deferred(self, name):
+        self.deferred[name] = self.deferred.get(name, 0) + 1
+
+    @property
+    def queued(self):
+        return self.gate.waiting if self.gate is not None else 0
+
+    async def watch_loop(self, client=None, interval=LOOP_LAG_INTERVAL):
+        """วัดว่า event loop ตื่นช้ากว่าที่ควรเท่าไหร่ (= มีโค้ดบล็อก loop อยู่) และเก็บ latency ของ gateway"""
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(time.perf_counter() - started - interval, 0.0))
+            if client is not None:
+                self.gateway_latency = client.latency
+
+    # --- EXPORT ---
+    def summary(self):
+        """ตารางสรุปสำหรับ /iceberg stats (ใส่ใน code block)"""
+        width = SUMMARY_NAME_WIDTH
+        lines = [f"{'command':<{width}}{'n':>7}{'err':>5}{'p50':>8}{'p99':>8}"]
+        ranked = sorted(self.commands.items(), key=lambda item: -item[1].latency.count)
+        for name, stats in ranked[:SUMMARY_TOP_COMMANDS]:
+            hist = stats.latency
+            lines.append(f"{_name(name):<{width}}{hist.count:>7}{stats.errors:>5}"
+                         f"{hist.quantile(0.5) * 1000:>6.0f}ms{hist.quantile(0.99) * 1000:>6.0f}ms")
+        if len(ranked) > SUMMARY_TOP_COMMANDS:
+            lines.append(f"(+{len(ranked) - SUMMARY_TOP_COMMANDS} more commands)")
+        if self.link_check.count:
+            hist = self.link_check
+            lines.append(f"{'link check':<{width}}{hist.count:>7}{'':>5}"
+                         f"{hist.quantile(0.5) * 1000:>6.0f}ms{hist.quantile(0.99) * 1000:>6.0f}ms")
+        rejected = _top_counts({f"{name} {reason}": n for (name, reason), n in self.rejected.items()})
+        lines.append(f"in flight {self.inflight}, queued {self.queued} (peak {self.queue_peak}), rejected: {rejected or '-'}")
+        if self.deferred:
+            lines.append("auto-deferred: " + _top_counts(self.deferred))
+        if self.outbox is not None:
+            lines.append(f"outbox queued {len(self.outbox)}, sent {self.outbox.sent}, dropped {self.outbox.dropped}")
+        hits = [f"{name} {c.hits / (c.hits + c.misses):.0%}" for name, c in self.caches.items() if c.hits + c.misses]
+        if hits:
+            lines.append("cache hit rate: " + ", ".join(hits))
+        lines.append("")
+        lines.append(f"{'db helper':<{width}}{'n':>7}{'avg':>8}{'p99':>8}{'wait':>8}")
+        for name, hist in sorted(self.db.items(), key=lambda item: -item[1].sum)[:SUMMARY_TOP_DB]:
+            wait = self.db_wait[name]
+            lines.append(f"{_name(name):<{width}}{hist.count:>7}{hist.sum / hist.count * 1000:>6.1f}ms"
+                         f"{hist.quantile(0.99) * 1000:>6.0f}ms{wait.sum / wait.count * 1000:>6.1f}ms")
+        return "\n".join(lines)
+
+    def prometheus(self):
+        """ตัวเลขทั้งหมดในรูปแบบ Prometheus text exposition"""
+        out = []
+        _histogram(out, "iceberg_command_seconds", "command", {n: s.latency for n, s in self.commands.items()})
+        out.append("# TYPE iceberg_command_errors_total counter")
+        for name, stats in sorted(self.commands.items()):
+            out.append(f'iceberg_command_errors_total{{command="{name}"}} {stats.errors}')
+        _histogram(out, "iceberg_db_seconds", "helper", self.db)
+        _histogram(out, "iceberg_db_wait_seconds", "helper", self.db_wait)
+        _histogram(out, "iceberg_loop_lag_seconds", None, {None: self.loop_lag})
+        _histogram(out, "iceberg_link_check_seconds", None, {None: self.link_check})
+        _histogram(out, "iceberg_queue_wait_seconds", None, {None: self.queue_wait})
+        out.append("# TYPE iceberg_inflight_commands gauge")
+        out.append(f"iceberg_inflight_commands {self.inflight}")
+        out.append("# TYPE iceberg_queued_commands gauge")
+        out.append(f"iceberg_queued_commands {self.queued}")
+        out.append("# TYPE iceberg_queue_peak gauge")
+        out.append(f"iceberg_queue_peak {self.queue_peak}")
+        out.append("# TYPE iceberg_rejected_total counter")
+        for (name, reason), n in sorted(self.rejected.items()):
+            out.append(f'iceberg_rejected_total{{command="{name}",reason="{reason}"}} {n}')
+        out.append("# TYPE iceberg_auto_deferred_total counter")
+        for name, n in sorted(self.deferred.items()):
+            out.append(f'iceberg_auto_deferred_total{{command="{name}"}} {n}')
+        if self.outbox is not None:
+            out.append("# TYPE iceberg_outbox_queued gauge")
+            out.append(f"iceberg_outbox_queued {len(self.outbox)}")
+            out.append("# TYPE iceberg_outbox_sent_total counter")
+            out.append(f"iceberg_outbox_sent_total {self.outbox.sent}")
+            out.append("# TYPE iceberg_outbox_dropped_total counter")
+            out.append(f"iceberg_outbox_dropped_total {self.outbox.dropped}")
+        for metric, kind, field in (("iceberg_cache_hits_total", "counter", "hits"),
+                                    ("iceberg_cache_misses_total", "counter", "misses"),
+                                    ("iceberg_cache_size", "gauge", "size")):
+            out.append(f"# TYPE {metric} {kind}")
+            for name, cache in sorted(self.caches.items()):
+                out.append(f'{metric}{{cache="{name}"}} {cache.stats()[field]}')
+        out.append("# TYPE iceberg_gateway_latency_seconds gauge")
+        out.append(f"iceberg_gateway_latency_seconds {self.gateway_latency}")
+        return "\n".join(out) + "\n"
+
+    async def serve(self, host, port):
+        """เปิด HTTP endpoint /metrics สำหรับให้ Prometheus มาดึง (ใช้ aiohttp ที่มากับ discord.py)"""
+        from aiohttp import web
+
+        async def handle(request):
+            return web.Response(text=self.prometheus(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def _histogram(out, metric, label, hists):
+    out.append(f"# TYPE {metric} histogram")
+    for name, hist in sorted(hists.items(), key=lambda item: item[0] or ""):
+        labels = f'{label}="{name}",' if label else ""
+        seen = 0
+        for bound, n in zip(BUCKETS, hist.counts):
+            seen += n
+            le = "+Inf" if bound == math.inf else repr(bound)
+            out.append(f'{metric}_bucket{{{labels}le="{le}"}} {seen}')
+        tags = f"{{{labels.rstrip(',')}}}" if label else ""
+        out.append(f"{metric}_sum{tags} {hist.sum}")
+        out.append(f"{metric}_count{tags} {hist.count}")
+
+
+metrics = Metrics()
@@ -0,0 +1,217 @@
+import time
+
+# การเปลี่ยนโครงสร้างฐานข้อมูลแบบมีเลข version: รันตามลำดับตอนเปิดฐานข้อมูล ครั้งละ version
+# แต่ละขั้นลงตาราง schema_version ใน transaction เดียวกับขั้นนั้น ล้มกลางทาง = ไม่นับ รอบหน้ารันใหม่
+# ห้ามแก้ขั้นที่ปล่อยไปแล้ว มีอะไรเปลี่ยนให้เพิ่มขั้นใหม่ท้าย MIGRATIONS
+
+MIGRATION_BATCH = 5000  # แถวต่อ transaction ตอนก๊อปตารางใหญ่ (lock สั้นๆ หลายครั้งแทนครั้งเดียวยาวๆ)
+
+
+class TableRebuild:
+    """เปลี่ยนโครงสร้างตาราง: สร้างตาราง <table>__new ก๊อปข้อมูลทีละ batch แล้วสลับชื่อใน transaction สุดท้าย
+
+    columns ต้องขึ้นต้นด้วยคอลัมน์ INTEGER PRIMARY KEY (rowid เดิมติดไปด้วย) ก๊อปค้างไว้ครึ่งทาง
+    รอบหน้าก็ทำต่อจาก rowid สุดท้ายที่ก๊อปแล้ว
+    """
+
+    def __init__(self, table, create, columns, select, indexes=()):
+        self.table = table
+        self.create = create      # CREATE TABLE ... โดยมี {table} แทนชื่อตาราง
+        self.columns = columns    # คอลัมน์ของตารางใหม่
+        self.select = select      # expression ที่อ่านจากตารางเดิมตามลำดับ columns
+        self.indexes = indexes    # CREATE INDEX/TRIGGER ที่ต้องสร้างใหม่หลังสลับชื่อ (DROP TABLE ลบทิ้งไปด้วย)
+
+    @property
+    def staging(self):
+        return f"{self.table}__new"
+
+    def _copy(self, conn, after, limit=-1):
+        return conn.execute(f"""
+            INSERT INTO {self.staging} ({self.columns})
+            SELECT {self.select} FROM {self.table} WHERE rowid > ? ORDER BY rowid LIMIT ?
+        """, (after, limit)).rowcount
+
+    def _copied(self, conn):
+        return conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {self.staging}").fetchone()[0]
+
+    def prepare(self, conn, batch):
+        """ก๊อปนอก transaction ของขั้น migration: แต่ละ batch commit เอง คนอื่นเขียนแทรกได้ระหว่าง batch"""
+        with conn:
+            conn.execute(self.create.format(table=f"IF NOT EXISTS {self.staging}"))
+        while True:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if self._copy(conn, self._copied(conn), batch) < batch:
+                    return
+
+    def __call__(self, conn):
+        # แถวที่เขียนเพิ่มหลัง batch สุดท้าย ก๊อปตามใน transaction เดียวกับการสลับชื่อ
+        self._copy(conn, self._copied(conn))
+        conn.execute(f"DROP TABLE {self.table}")
+        conn.execute(f"ALTER TABLE {self.staging} RENAME TO {self.table}")
+        for index in self.indexes:
+            conn.execute(index)
+
+
+class IncrementalAutoVacuum:
+    """เปิด auto_vacuum แบบ incremental ให้คืนหน้าว่างทีละนิดได้ทีหลัง
+    ต้อง VACUUM ทั้งไฟล์ครั้งเดียวนอก transaction (ทำตอนเปิดบอท ก่อนรับคำสั่ง)"""
+
+    def prepare(self, conn, batch):
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+
+    def __call__(self, conn):
+        pass
+
+
+def snatch_attempts_unix_time():
+    # created_at เดิมเป็นข้อความ CURRENT_TIMESTAMP ให้เป็น unix time แบบ events/snapshots จะได้เทียบกันตรงๆ
+    return TableRebuild(
+        "snatch_attempts",
+        """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            time_limit REAL NOT NULL,
+            latency REAL NOT NULL,
+            reaction REAL,
+            success INTEGER NOT NULL,
+            created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+        """,
+        "id, guild_id, user_id, count, time_limit, latency, reaction, success, created_at",
+        "id, guild_id, user_id, count, time_limit, latency, reaction, success, CAST(strftime('%s', created_at) AS INTEGER)",
+        indexes=("CREATE INDEX idx_snatch_attempts_user ON snatch_attempts (guild_id, user_id)",),
+    )
+
+
+# ตารางสถานะที่มียอดสรุป: (ตาราง, เกม, คอลัมน์จำนวนครั้ง, expression ของเป้า)
+COUNTER_SOURCES = (
+    ("players", "iceberg", "attempts", "{row}.target_attempts"),
+    ("snowflakes", "snowflake", "count", "5"),
+    ("vaults", "vault", "attempts", "{row}.target_attempts"),
+)
+
+
+def _counter_delta(game, attempts, target, row, sign):
+    """SQL ที่บวก (sign="") หรือลบ (sign="-") แถว row (NEW/OLD) ออกจากยอดสรุปและ histogram"""
+    target = target.format(row=row)
+    sql = f"""
+        INSERT INTO game_counters (guild_id, game, players, completed, attempts_sum)
+        VALUES ({row}.guild_id, '{game}', {sign}1, {sign}{row}.completed, {sign}{row}.{attempts})
+        ON CONFLICT (guild_id, game) DO UPDATE SET
+            players = players + excluded.players,
+            completed = completed + excluded.completed,
+            attempts_sum = attempts_sum + excluded.attempts_sum;
+        INSERT INTO attempt_buckets (guild_id, game, target, attempts, players)
+        VALUES ({row}.guild_id, '{game}', {target}, {row}.{attempts}, {sign}1)
+        ON CONFLICT (guild_id, game, target, attempts) DO UPDATE SET players = players + excluded.players;
+    """
+    if sign:
+        sql += f"""
+        DELETE FROM attempt_buckets
+        WHERE guild_id = {row}.guild_id AND game = '{game}' AND target = {target} AND attempts = {row}.{attempts}
+          AND players = 0;
+        """
+    return sql
+
+
+def game_counters(conn):
+    # ยอดผู้เล่น/สำเร็จ/ผลรวมจำนวนครั้ง ต่อ (guild, เกม) และ histogram จำนวนครั้งแยกตามเป้า
+    # trigger อัปเดตใน transaction เดียวกับคำสั่งที่แก้แถว dashboard กับรายงานเลยอ่านได้โดยไม่ต้องไล่ทั้งตาราง
+    conn.execute("""
+        CREATE TABLE game_counters (
+            guild_id INTEGER NOT NULL,
+            game TEXT NOT NULL,
+            players INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            attempts_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, game)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE attempt_buckets (
+            guild_id INTEGER NOT NULL,
+            game TEXT NOT NULL,
+            target INTEGER NOT NULL,
+            attempts INTEGER NOT NULL,
+            players INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, game, target, attempts)
+        ) WITHOUT ROWID
+    """)
+    for table, game, attempts, target in COUNTER_SOURCES:
+        conn.execute(f"""
+            INSERT INTO game_counters (guild_id, game, players, completed, attempts_sum)
+            SELECT guild_id, '{game}', COUNT(*), COALESCE(SUM(completed), 0), COALESCE(SUM({attempts}), 0)
+            FROM {table} GROUP BY guild_id
+        """)
+        bucket = target.format(row=table)
+        conn.execute(f"""
+            INSERT INTO attempt_buckets (guild_id, game, target, attempts, players)
+            SELECT guild_id, '{game}', {bucket}, {attempts}, COUNT(*) FROM {table}
+            GROUP BY 1, 3, 4
+        """)
+        added = _counter_delta(game, attempts, target, "NEW", "")
+        removed = _counter_delta(game, attempts, target, "OLD", "-")
+        conn.execute(f"CREATE TRIGGER counters_{table}_insert AFTER INSERT ON {table} BEGIN {added} END")
+        conn.execute(f"CREATE TRIGGER counters_{table}_delete AFTER DELETE ON {table} BEGIN {removed} END")
+        columns = f"{attempts}, completed" + (", target_attempts" if "target_attempts" in target else "")
+        conn.execute(f"CREATE TRIGGER counters_{table}_update AFTER UPDATE OF {columns} ON {table} "
+                     f"BEGIN {removed} {added} END")
+
+
+def season_archive(conn):
+    # แถวที่ถูกปิดซีซั่น (รีเซ็ตทีละทั้งเกม) เก็บไว้เป็น JSON ทั้งแถว + ลิงก์ที่เคยส่ง ดูย้อนหลังหรือกู้คืนเองได้
+    conn.execute("""
+        CREATE TABLE season_archive (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            season TEXT NOT NULL,
+            game TEXT NOT NULL,
+            owner TEXT NOT NULL,
+            data TEXT NOT NULL,
+            archived_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    """)
+    conn.execute("CREATE INDEX idx_season_archive ON season_archive (guild_id, season, game)")
+
+
+# (version, ชื่อ, ขั้นตอน) version 1 คือโครงสร้างตั้งต้นที่ Storage สร้างเอง
+MIGRATIONS = (
+    (2, "snatch_attempts_unix_time", snatch_attempts_unix_time()),
+    (3, "game_counters", game_counters),
+    (4, "incremental_auto_vacuum", IncrementalAutoVacuum()),
+    (5, "season_archive", season_archive),
+)
+
+
+def migrate(conn, migrations=MIGRATIONS, batch=MIGRATION_BATCH):
+    """รันขั้นที่ยังไม่เคยรันตามลำดับ version คืนรายชื่อขั้นที่เพิ่งรัน"""
+    with conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+            )
+        """)
+    applied = {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+    done = []
+    for version, name, step in sorted(migrations, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        started = time.perf_counter()
+        prepare = getattr(step, "prepare", None)
+        if prepare is not None:
+            prepare(conn, batch)
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            step(conn)
+            conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+        print(f"Migrated schema to v{version} ({name}) in {time.perf_counter() - started:.2f}s")
+        done.append(name)
+    return done
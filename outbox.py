@@ -0,0 +1,182 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+import discord
+
+from admission import RateLimiter
+from metrics import metrics
+
+# คิวข้อความขาออกที่ handler ไม่ต้องรอ: โยนเข้าคิวแล้วจบคำสั่งได้เลย worker ส่งให้ทีหลังตามลำดับความสำคัญ
+# โควตาแยกตาม bucket ของ Discord (followup = webhook ของ interaction นั้น) + โควตารวมของทั้งบอท
+# bucket ที่เต็มโควตาถูกข้ามไปก่อน งานของ bucket อื่นส่งต่อได้ไม่ต้องต่อแถวรอ
+PRIORITY_RESULT = 0   # ข้อความถึงผู้เล่นโดยตรง (ส่งก่อน)
+PRIORITY_DIGEST = 1   # สรุปแจ้ง Admin
+
+BUCKET_RATE = (2.0, 5)       # ต่อ bucket: ส่งติดกันได้ 5 ข้อความ แล้วเฉลี่ย 2 ข้อความ/วินาที
+GLOBAL_RATE = (40.0, 40)     # ทั้งบอท (ต่ำกว่า global limit 50 request/วินาที ของ Discord เผื่อคำตอบของคำสั่ง)
+RATE_LIMITED_PAUSE = 5.0     # วินาที พัก bucket ที่โดน 429 กลับมา
+OUTBOX_WORKERS = 4           # ส่งพร้อมกันได้กี่ข้อความ
+OUTBOX_MAX = 2048            # คิวเต็มแล้วทิ้งงานที่สำคัญน้อยสุด (ใหม่สุด) ก่อน
+OUTBOX_RETRIES = 3
+OUTBOX_DRAIN_TIMEOUT = 5.0   # วินาที รอส่งที่ค้างให้หมดตอนปิดบอท
+
+# digest แจ้ง Admin
+DIGEST_INTERVAL = 60         # วินาที (ต้องสั้นกว่าอายุ token ของ interaction 15 นาที เพราะส่งทาง followup)
+DIGEST_MAX_LINES = 20
+
+
+class Outbox:
+    def __init__(self, rate=BUCKET_RATE, global_rate=GLOBAL_RATE, workers=OUTBOX_WORKERS, maxsize=OUTBOX_MAX):
+        self._queue = []               # [priority, ลำดับ, bucket, send, args, kwargs, ครั้งที่ลองไปแล้ว]
+        self._seq = itertools.count()
+        self._limiter = RateLimiter(rates={}, default=rate)
+        self._global = RateLimiter(rates={}, default=global_rate)
+        self._blocked = {}             # bucket -> เวลา (monotonic) ที่ส่งได้อีกครั้งหลังโดน 429
+        self._wake = asyncio.Event()
+        self.workers = workers
+        self.maxsize = maxsize
+        self.active = 0
+        self.sent = 0
+        self.dropped = 0
+        self._tasks = []
+        metrics.outbox = self
+
+    def __len__(self):
+        return len(self._queue)
+
+    @property
+    def idle(self):
+        return not self._queue and not self.active
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self, timeout=OUTBOX_DRAIN_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while self._tasks and not self.idle and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def send(self, bucket, send, *args, priority=PRIORITY_RESULT, **kwargs):
+        """เข้าคิว send(*args, **kwargs) (coroutine function เช่น interaction.followup.send) ไม่ต้อง await
+        bucket คือ key ของโควตาที่ข้อความนี้ใช้ (เช่น id ของ interaction ที่ส่ง followup)"""
+        if len(self._queue) >= self.maxsize:
+            worst = max(self._queue)
+            if worst[0] <= priority:
+                self._drop(send)
+                return
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            self._drop(worst[3])
+        heapq.heappush(self._queue, [priority, next(self._seq), bucket, send, args, kwargs, 0])
+        self._wake.set()
+
+    def _drop(self, send):
+        self.dropped += 1
+        print(f"outbox: คิวเต็ม ทิ้งข้อความ ({getattr(send, '__qualname__', send)})")
+
+    def _take(self, now):
+        """หยิบงานที่สำคัญสุดที่ bucket ยังมีโควตา คืน (งาน, None) หรือ (None, วินาทีที่ควรรอ)"""
+        skipped, wait, job = [], None, None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            retry = self._blocked.get(entry[2], 0) - now
+            if retry <= 0:
+                retry = self._limiter.take(entry[2], None)
+            if not retry:
+                job = entry
+                break
+            skipped.append(entry)
+            wait = retry if wait is None else min(wait, retry)
+        if job is not None:
+            retry = self._global.take(None, None)
+            if retry:
+                # ติดโควตารวม: คืน token ของ bucket งานนี้จะได้ไม่โดนหักซ้ำตอนหยิบรอบหน้า
+                self._limiter.refund(job[2], None)
+                skipped.append(job)
+                job, wait = None, retry
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+        return job, wait
+
+    async def _worker(self):
+        while True:
+            # clear ก่อนหยิบ งานที่เข้ามาระหว่างนี้จะ set ให้ตื่นทันที ไม่หลุด
+            self._wake.clear()
+            job, wait = self._take(time.monotonic())
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.active += 1
+            try:
+                await self._deliver(job)
+            finally:
+                self.active -= 1
+
+    async def _deliver(self, job):
+        bucket, send, args, kwargs = job[2:6]
+        try:
+            await send(*args, **kwargs)
+            self.sent += 1
+        except discord.HTTPException as e:
+            if e.status == 429 and job[6] < OUTBOX_RETRIES:
+                self._blocked[bucket] = time.monotonic() + RATE_LIMITED_PAUSE
+                job[6] += 1
+                heapq.heappush(self._queue, job)
+                self._wake.set()
+                return
+            self.dropped += 1
+            print(f"outbox: ส่งไม่สำเร็จ ({e.status}): {e}")
+        except Exception as e:
+            self.dropped += 1
+            print(f"outbox: ส่งไม่สำเร็จ: {e!r}")
+
+
+class Digest:
+    """รวมแจ้งเตือนถึง Admin ต่อห้องไว้ แล้วส่งเป็นข้อความเดียวทุก interval แทนการแท็กทุกครั้งที่มีคนสำเร็จ
+    deliver(key, target, lines) เป็น async ที่จัดการส่งจริง (target คือ interaction ล่าสุดของห้องนั้น)"""
+
+    def __init__(self, deliver, interval=DIGEST_INTERVAL):
+        self.deliver = deliver
+        self.interval = interval
+        self._entries = {}  # key -> [target, lines]
+        self._task = None
+
+    def add(self, key, target, line):
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = [target, [line]]
+        else:
+            entry[0] = target  # ใช้ token ของ interaction ล่าสุด จะได้อยู่ได้นานสุด
+            entry[1].append(line)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        entries, self._entries = self._entries, {}
+        for key, (target, lines) in entries.items():
+            try:
+                await self.deliver(key, target, lines)
+            except Exception as e:
+                print(f"digest {key} ไม่สำเร็จ: {e!r}")
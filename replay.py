@@ -0,0 +1,40 @@
+"""เครื่องมือ event log ของฐานข้อมูล (รันตอนบอทปิดอยู่)
+
+    python replay.py verify   [iceberg_data.db]   replay แล้วเทียบกับตารางปัจจุบัน
+    python replay.py rebuild  [iceberg_data.db]   สร้างตารางสถานะใหม่จาก snapshot + event log
+    python replay.py snapshot [iceberg_data.db]   ถ่าย snapshot ใหม่ทันที
+"""
+import argparse
+import asyncio
+
+from storage import Storage
+
+
+async def run(command, path):
+    db = Storage(path)
+    await db.open()
+    try:
+        if command == "verify":
+            diff = await db.verify_state()
+            if not diff:
+                print("ok: ตารางสถานะตรงกับ event log")
+                return 0
+            for table, (missing, extra) in diff.items():
+                print(f"{table}: ขาด {missing} แถว, เกิน {extra} แถว")
+            return 1
+        if command == "rebuild":
+            count = await db.rebuild_state()
+            print(f"rebuilt from snapshot + {count} events")
+        elif command == "snapshot":
+            print(f"snapshot at event {await db.take_snapshot()}")
+        return 0
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ตรวจ/สร้างตารางสถานะใหม่จาก event log")
+    parser.add_argument("command", choices=("verify", "rebuild", "snapshot"))
+    parser.add_argument("path", nargs="?", default="iceberg_data.db")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(run(args.command, args.path)))
@@ -0,0 +1,88 @@
+import json
+import os
+import random
+import string
+
+import discord
+
+# ข้อความตอบกลับทั้งหมดของบอทอยู่ใน responses.json ที่เดียว
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "responses.json")
+
+_formatter = string.Formatter()
+
+
+class TextTemplate:
+    """ข้อความที่ compile ไว้แล้ว ถ้าไม่มีช่องให้เติมจะคืน string เดิมเลยไม่ต้อง format"""
+    __slots__ = ("source", "has_fields")
+
+    def __init__(self, source):
+        self.source = source
+        self.has_fields = any(name is not None for _, name, _, _ in _formatter.parse(source))
+
+    def render(self, fields):
+        return self.source.format_map(fields) if self.has_fields else self.source
+
+
+class EmbedTemplate:
+    """โครง embed ที่ compile ไว้แล้ว ตอน render สร้าง Embed ใหม่แล้วเติมแค่ช่องที่เปลี่ยน"""
+    __slots__ = ("title", "description", "color", "thumbnail", "image")
+
+    def __init__(self, spec):
+        self.title = TextTemplate(spec["title"]) if "title" in spec else None
+        self.description = TextTemplate(spec["description"]) if "description" in spec else None
+        self.color = int(spec["color"], 16) if "color" in spec else None
+        self.thumbnail = spec.get("thumbnail")
+        self.image = spec.get("image")
+
+    def render(self, fields):
+        embed = discord.Embed(
+            title=self.title.render(fields) if self.title else None,
+            description=self.description.render(fields) if self.description else None,
+            color=self.color,
+        )
+        if self.thumbnail:
+            embed.set_thumbnail(url=self.thumbnail)
+        if self.image:
+            embed.set_image(url=self.image)
+        return embed
+
+
+class Catalog:
+    def __init__(self, path):
+        self.path = path
+        self._texts = {}
+        self._embeds = {}
+        self.reload()
+
+    def reload(self):
+        """โหลด responses.json ใหม่ ถ้าไฟล์พังจะ raise และยังใช้ชุดเดิมต่อ คืนจำนวนข้อความที่โหลด"""
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        texts = {}
+        for key, value in data["texts"].items():
+            if isinstance(value, list):
+                texts[key] = [TextTemplate(item) for item in value]
+            else:
+                texts[key] = TextTemplate(value)
+        embeds = {key: EmbedTemplate(spec) for key, spec in data["embeds"].items()}
+        # สลับทั้งชุดทีเดียว handler ที่กำลังทำงานอยู่จะไม่เห็นข้อมูลครึ่งๆ กลางๆ
+        self._texts, self._embeds = texts, embeds
+        return len(texts) + len(embeds)
+
+    def text(self, key, **fields):
+        return self._texts[key].render(fields)
+
+    def choice(self, key, **fields):
+        """สุ่มหนึ่งข้อความจากรายการ"""
+        return random.choice(self._texts[key]).render(fields)
+
+    def pick(self, key, index, **fields):
+        """เลือกข้อความตามลำดับในรายการ (เกินท้ายรายการจะใช้อันสุดท้าย)"""
+        items = self._texts[key]
+        return items[min(index, len(items) - 1)].render(fields)
+
+    def embed(self, key, **fields):
+        return self._embeds[key].render(fields)
+
+
+catalog = Catalog(CATALOG_PATH)
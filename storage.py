@@ -0,0 +1,1372 @@
+import asyncio
+import functools
+import json
+import os
+import random
+import sqlite3
+import time
+import weakref
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from cache import LRUCache, TTLCache, MISSING
+from metrics import metrics
+from migrations import COUNTER_SOURCES, MIGRATIONS, migrate
+
+# --- CONNECTION SETTINGS ---
+# ใช้ connection เดียวตลอดอายุบอท รันอยู่บน thread ของมันเอง event loop จะได้ไม่ค้าง
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA busy_timeout = 5000",
+)
+STATEMENT_CACHE = 128  # sqlite3 เก็บ prepared statement ไว้ตาม SQL string ที่ใช้ซ้ำ
+CACHE_SIZE = int(os.getenv('ICEBERG_CACHE_SIZE', 4096))  # จำนวนแถวสูงสุดต่อ cache
+PROFILE_TTL = 10.0  # วินาที ที่โปรไฟล์รวมทุกเกมอยู่ใน cache (งานเขียนของเจ้าตัวล้างให้ทันทีอยู่แล้ว)
+
+# โหมด write-behind: เก็บงานอัปเดตความคืบหน้าไว้ในคิวแล้วเขียนรวมเป็น transaction เดียว
+WRITE_FLUSH_INTERVAL = 0.1  # วินาที
+WRITE_BATCH_SIZE = 64       # ครบเท่านี้เขียนทันทีไม่ต้องรอ
+
+# backup / compaction
+BACKUP_PAGES = 256          # หน้าต่อ step ของ backup API
+BACKUP_STEP_SLEEP = 0.005   # วินาทีพักระหว่าง step (ให้ดิสก์ว่างให้งานของบอทบ้าง)
+
+# ชื่อเกมที่ใช้เป็น key ในตาราง submissions
+GAME_ICEBERG = "iceberg"
+GAME_SNOWFLAKE = "snowflake"
+GAME_VAULT = "vault"
+
+# ผลลัพธ์ของ submit_vault_link
+VAULT_NO_TEAM = "no_team"
+VAULT_COMPLETED = "completed"
+VAULT_DUPLICATE = "duplicate"
+VAULT_PARTNER_DUPLICATE = "partner_duplicate"
+VAULT_ALREADY_SENT = "already_sent"
+VAULT_WAITING = "waiting"
+VAULT_ROUND = "round"
+
+# ตารางที่ใช้ทำรายงาน Admin: (ตาราง, key ที่ใช้แบ่งหน้า, คอลัมน์)
+REPORT_PAGE_SIZE = 20
+EXPORT_CHUNK = 500  # แถวต่อก้อนตอน export
+REPORT_SOURCES = {
+    GAME_ICEBERG: ("players", "user_id", "user_id, attempts, target_attempts, completed"),
+    GAME_SNOWFLAKE: ("snowflakes", "user_id", "user_id, count, completed"),
+    GAME_VAULT: ("vaults", "team_id", "team_id, user1_id, user2_id, attempts, target_attempts, completed"),
+}
+
+VAULT_COLUMNS = """team_id, user1_id, user2_id, role_warmer, role_turner,
+                   attempts, target_attempts, completed,
+                   round_link_u1, round_link_u2"""
+
+
+# ตารางจากไฟล์ฐานข้อมูลก่อนมี guild_id กับคอลัมน์ที่ยกไปตารางใหม่ได้ตรงๆ
+LEGACY_COLUMNS = {
+    "players": "user_id, attempts, target_attempts, completed",
+    "snowflakes": "user_id, count, completed",
+    "vaults": VAULT_COLUMNS,
+    "vault_members": "user_id, team_id",
+    "snatch_attempts": "id, user_id, count, time_limit, latency, reaction, success, created_at",
+    "submissions": "game, owner, tid, link",
+}
+LEGACY_INDEXES = ("idx_vault_members_team", "idx_snatch_attempts_user", "idx_submissions_owner_tid")
+
+# --- EVENT LOG ---
+# ทุกการเปลี่ยนสถานะถูกต่อท้ายตาราง events ใน transaction เดียวกับที่แก้แถว
+# ตาราง players/snowflakes/vaults/submissions เป็นแค่ผลลัพธ์ที่ประกอบจาก snapshot ล่าสุด + event หลังจากนั้น
+EVENT_START = "start"
+EVENT_SUBMIT = "submit"
+EVENT_SNATCH = "snatch"
+EVENT_CREATE = "create"
+EVENT_LINK = "link"
+EVENT_ROUND = "round"
+EVENT_RESET = "reset"
+EVENT_SEASON = "season"  # รีเซ็ตทีละทั้งเกม (หรือเฉพาะ owners) เป็น event เดียว
+EVENT_TARGET = "target"  # ปรับเป้าทีละทั้งเกม (หรือเฉพาะ owners) เป็น event เดียว
+
+SNAPSHOT_INTERVAL = 600     # วินาที ระหว่างการเช็คว่าควรทำ snapshot ใหม่ไหม
+SNAPSHOT_MIN_EVENTS = 1000  # ทำ snapshot ใหม่เมื่อมี event ใหม่อย่างน้อยเท่านี้
+SNAPSHOT_KEEP = 3           # เก็บ snapshot ล่าสุดไว้กี่อัน (event เก็บไว้ทั้งหมดเป็นประวัติ)
+HISTORY_LIMIT = 15
+
+# ตารางสถานะที่ snapshot เก็บ (ตามลำดับคอลัมน์ที่ใช้ insert กลับ)
+STATE_TABLES = {
+    "players": "guild_id, user_id, attempts, target_attempts, completed",
+    "snowflakes": "guild_id, user_id, count, completed",
+    "vaults": f"guild_id, {VAULT_COLUMNS}",
+    "submissions": "guild_id, game, owner, tid, link",
+}
+EVENT_COLUMNS = "id, guild_id, game, owner, kind, user_id, tid, link, data"
+
+# โปรไฟล์รวมทุกเกม: (attempts, target, completed) + (count, completed) + คอลัมน์ของทีม vault
+# แถวของตัวเองเป็นจุดตั้งต้น ทุกเกมที่ยังไม่ได้เริ่มได้ NULL ทั้งก้อน
+PROFILE_QUERY = f"""
+    SELECT p.attempts, p.target_attempts, p.completed, s.count, s.completed,
+           {", ".join(f"v.{column.strip()}" for column in VAULT_COLUMNS.split(","))}
+    FROM (SELECT ? AS guild_id, ? AS user_id) AS me
+    LEFT JOIN players p ON p.guild_id = me.guild_id AND p.user_id = me.user_id
+    LEFT JOIN snowflakes s ON s.guild_id = me.guild_id AND s.user_id = me.user_id
+    LEFT JOIN vault_members m ON m.guild_id = me.guild_id AND m.user_id = me.user_id
+    LEFT JOIN vaults v ON v.guild_id = m.guild_id AND v.team_id = m.team_id
+"""
+
+
+def parse_tid(link):
+    """ดึงเลข tid ออกจากลิงก์กระทู้ คืน None ถ้าไม่มีหรือไม่ใช่ตัวเลข"""
+    values = parse_qs(urlsplit(link).query).get("tid")
+    if not values:
+        return None
+    try:
+        tid = int(values[0])
+    except ValueError:
+        return None
+    return tid if tid > 0 else None
+
+
+def classify_vault_submit(row, user_id, tid, used):
+    """เช็คว่าส่งลิงก์ vault นี้ได้ไหม คืนสถานะที่ทำให้ส่งไม่ได้ หรือ None ถ้าส่งได้"""
+    if row is None:
+        return VAULT_NO_TEAM
+    if row[7]:
+        return VAULT_COMPLETED
+    if used:
+        return VAULT_DUPLICATE
+    is_user1 = (user_id == row[1])
+    own_link, partner_link = (row[8], row[9]) if is_user1 else (row[9], row[8])
+    if partner_link and parse_tid(partner_link) == tid:
+        return VAULT_PARTNER_DUPLICATE
+    if own_link:
+        return VAULT_ALREADY_SENT
+    return None
+
+
+def plan_vault_link(row, user_id, link):
+    """คำนวณแถวทีมหลังส่งลิงก์โดยไม่แตะ DB (ใช้ในโหมด write-behind) คืน (สถานะ, แถวใหม่, ลิงก์ของรอบที่ปิด)"""
+    row = list(row)
+    row[8 if user_id == row[1] else 9] = link
+    if not (row[8] and row[9]):
+        return VAULT_WAITING, tuple(row), ()
+    round_links = (row[8], row[9])
+    row[5] += 1
+    row[7] = 1 if row[5] >= row[6] else 0
+    row[8] = row[9] = None
+    return VAULT_ROUND, tuple(row), round_links
+
+
+def state_from_rows(tables):
+    """แปลงแถวของตารางสถานะเป็น dict ที่ key คือ primary key (ใช้เล่น event ทับ)"""
+    return {
+        "players": {tuple(row[:2]): list(row[2:]) for row in tables["players"]},
+        "snowflakes": {tuple(row[:2]): list(row[2:]) for row in tables["snowflakes"]},
+        "vaults": {(row[0], row[1]): list(row[1:]) for row in tables["vaults"]},
+        "submissions": {tuple(row[:4]): row[4] for row in tables["submissions"]},
+    }
+
+
+def rows_from_state(state):
+    return {
+        "players": [key + tuple(value) for key, value in state["players"].items()],
+        "snowflakes": [key + tuple(value) for key, value in state["snowflakes"].items()],
+        "vaults": [(key[0],) + tuple(value) for key, value in state["vaults"].items()],
+        "submissions": [key + (link,) for key, link in state["submissions"].items()],
+    }
+
+
+def apply_event(state, event):
+    """เล่น event หนึ่งรายการทับ state (ต้องให้ผลเหมือนที่ _apply_* ทำกับตารางทุกอย่าง)"""
+    _, guild_id, game, owner, kind, user_id, tid, link, data = event
+    data = json.loads(data) if data else {}
+    submissions = state["submissions"]
+    if game == GAME_VAULT:
+        table, key = state["vaults"], (guild_id, owner)
+    else:
+        table, key = state["players" if game == GAME_ICEBERG else "snowflakes"], (guild_id, user_id)
+
+    if kind in (EVENT_SEASON, EVENT_TARGET):
+        owners = None if data.get("owners") is None else set(data["owners"])
+        keys = [k for k in table if k[0] == guild_id and (owners is None or k[1] in owners)]
+        if kind == EVENT_TARGET:
+            target, completed = (1, 2) if game == GAME_ICEBERG else (6, 7)
+            for k in keys:
+                row = table[k]
+                if not row[completed]:
+                    row[target] = max(1, data["value"] if data.get("value") is not None else row[target] + data["delta"])
+            return
+        for k in keys:
+            del table[k]
+        names = None if owners is None else {str(o) for o in owners}
+        for sub_key in [sub_key for sub_key in submissions
+                        if sub_key[:2] == (guild_id, game) and (names is None or sub_key[2] in names)]:
+            del submissions[sub_key]
+        return
+    if kind == EVENT_RESET:
+        table.pop(key, None)
+        prefix = (guild_id, game, owner)
+        for sub_key in [sub_key for sub_key in submissions if sub_key[:3] == prefix]:
+            del submissions[sub_key]
+        return
+    if kind in (EVENT_SUBMIT, EVENT_SNATCH) and key not in table:
+        # event จากฐานข้อมูลรุ่นก่อนที่ยังบันทึกความคืบหน้าของคนที่ถูกรีเซ็ตไประหว่างทาง: แถวไม่มีแล้ว ข้าม
+        return
+    if kind == EVENT_START:
+        table[key] = [0, data["target"], 0] if game == GAME_ICEBERG else [0, 0]
+    elif kind == EVENT_SUBMIT:
+        table[key][0], table[key][2] = data["attempts"], data["completed"]
+    elif kind == EVENT_SNATCH:
+        table[key] = [data["count"], data["completed"]]
+    elif kind == EVENT_CREATE:
+        table[key] = [owner, user_id, data["user2"], data["warmer"], data["turner"], 0, data["target"], 0, None, None]
+    elif kind == EVENT_LINK:
+        row = table[key]
+        row[8 if user_id == row[1] else 9] = link
+        return
+    elif kind == EVENT_ROUND:
+        row = table[key]
+        for round_tid, round_link in zip(data["tids"], (row[8], row[9])):
+            if round_tid is not None:
+                submissions.setdefault((guild_id, game, owner, round_tid), round_link)
+        row[5], row[7], row[8], row[9] = data["attempts"], data["completed"], None, None
+        return
+    if tid is not None:
+        submissions.setdefault((guild_id, game, owner, tid), link)
+
+
+def on_worker(fn):
+    """ห่อเมธอดแบบ sync ให้เรียกด้วย await ได้ โดยไปรันบน DB thread"""
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        # _write(fn, ...) นับเวลาแยกตามงานเขียนที่ส่งเข้าไป ไม่รวมกันเป็นก้อนเดียว
+        name = args[0].__name__ if args and callable(args[0]) else fn.__name__
+        queued = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                metrics.observe_db(name, time.perf_counter() - started, started - queued)
+        return await self._run(call)
+    return wrapper
+
+
+class Storage:
+    def __init__(self, path, write_behind=False, legacy_guild_id=None):
+        self.path = path
+        self.legacy_guild_id = legacy_guild_id  # guild ที่จะรับข้อมูลจากไฟล์ฐานข้อมูลก่อนมี guild_id (ต้องตั้งถ้ามีข้อมูลเก่า)
+        self.conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="iceberg-db")
+
+        self.write_behind = write_behind
+        self._pending = []       # งานเขียนที่ยังไม่ได้ลง DB: [(fn, args)]
+        self._dirty = {}         # (cache, key) -> แถวล่าสุดที่ยังค้างในคิว (กันโดน LRU ไล่ออกแล้วอ่านค่าเก่า)
+        self._dirty_links = {}   # (guild_id, game, owner) -> tid ที่ยังค้างในคิว
+        self._flush_lock = asyncio.Lock()
+        self._flush_wanted = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._flush_task = None
+        self._snapshot_task = None
+        self.last_write = 0.0    # time.monotonic() ของงานเขียนล่าสุด (ใช้หาช่วงเงียบสำหรับ compaction)
+
+        # บอทเป็นคนเขียนฐานข้อมูลคนเดียว เลยเก็บแถวที่ใช้บ่อยไว้ในหน่วยความจำได้ (key ขึ้นต้นด้วย guild_id เสมอ)
+        # ทุก cache อัปเดตหลัง DB thread ทำงานเสร็จ ตามลำดับเดียวกับคิวของ DB thread
+        self.players_cache = LRUCache(CACHE_SIZE)
+        self.snow_cache = LRUCache(CACHE_SIZE)
+        self.members_cache = LRUCache(CACHE_SIZE)
+        self.vaults_cache = LRUCache(CACHE_SIZE)
+        self.links_cache = LRUCache(CACHE_SIZE)
+        self.admins_cache = LRUCache(CACHE_SIZE)
+        self.profiles_cache = TTLCache(CACHE_SIZE, PROFILE_TTL)
+        self._team_locks = weakref.WeakValueDictionary()
+        self.caches = {
+            "players": self.players_cache,
+            "snowflakes": self.snow_cache,
+            "vault_members": self.members_cache,
+            "vaults": self.vaults_cache,
+            "links": self.links_cache,
+            "guild_admins": self.admins_cache,
+            "profiles": self.profiles_cache,
+        }
+        metrics.caches.update(self.caches)
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    @on_worker
+    def _open_conn(self):
+        if self.conn is not None:
+            return
+        self.conn = sqlite3.connect(self.path, cached_statements=STATEMENT_CACHE)
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+        self._init_schema()
+
+    async def open(self):
+        """เปิด connection และสร้างตารางถ้ายังไม่มี (เรียกซ้ำได้)"""
+        await self._open_conn()
+        if self.write_behind and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if self._snapshot_task is None:
+            self._snapshot_task = asyncio.create_task(self._snapshot_loop())
+
+    @on_worker
+    def _close_conn(self):
+        if self.conn is not None:
+            # checkpoint WAL ให้ทุกอย่างลงไฟล์หลักก่อนปิด
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+            self.conn = None
+
+    async def close(self):
+        for task in (self._flush_task, self._snapshot_task):
+            if task is not None:
+                task.cancel()
+        self._flush_task = self._snapshot_task = None
+        await self.flush()
+        await self._close_conn()
+        self._executor.shutdown(wait=True)
+
+    def _init_schema(self):
+        # version 1 = โครงสร้างตั้งต้นด้านล่าง (ไฟล์ที่สร้างก่อนมี schema_version ก็ผ่านขั้นนี้ได้ เพราะสร้างแบบ IF NOT EXISTS)
+        migrate(self.conn, ((1, "baseline", self._create_baseline), *MIGRATIONS))
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            if self.conn.execute("SELECT 1 FROM snapshots LIMIT 1").fetchone() is None:
+                # ไฟล์ใหม่หรือไฟล์จากก่อนมี event log: ถ่ายสถานะปัจจุบันไว้เป็นจุดเริ่มของการ replay
+                self._snapshot()
+
+    def _create_baseline(self, conn):
+        """โครงสร้างตอนเริ่มใช้ migration ห้ามแก้ตรงนี้ เปลี่ยนอะไรให้เพิ่มขั้นใน migrations.py"""
+        legacy = self._detach_legacy_tables()
+
+        # ทุกตารางมี guild_id นำหน้า key: แต่ละ guild เป็น partition ของตัวเอง lookup ไม่ข้ามกัน
+        # 1. ตาราง Iceberg
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS players (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                attempts INTEGER DEFAULT 0,
+                target_attempts INTEGER DEFAULT 10,
+                completed INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        ''')
+
+        # 2. ตาราง Snowflakes
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS snowflakes (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                count INTEGER DEFAULT 0,
+                completed INTEGER DEFAULT 0,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        ''')
+
+        # 2.1 ประวัติการกดคว้าหิมะแต่ละครั้ง (เวลาเป็นวินาทีจาก monotonic clock)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS snatch_attempts (
+                id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                time_limit REAL NOT NULL,
+                latency REAL NOT NULL,
+                reaction REAL,
+                success INTEGER NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_snatch_attempts_user ON snatch_attempts (guild_id, user_id)")
+
+        # 3. ตาราง Vault
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS vaults (
+                guild_id INTEGER NOT NULL,
+                team_id TEXT NOT NULL,
+                user1_id INTEGER,
+                user2_id INTEGER,
+                role_warmer INTEGER,
+                role_turner INTEGER,
+                attempts INTEGER DEFAULT 0,
+                target_attempts INTEGER DEFAULT 10,
+                completed INTEGER DEFAULT 0,
+                round_link_u1 TEXT,
+                round_link_u2 TEXT,
+                PRIMARY KEY (guild_id, team_id)
+            )
+        ''')
+
+        # 3.1 สมาชิกทีม Vault (user_id -> team_id) ใช้หาทีมจากสมาชิกแบบ point lookup
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS vault_members (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                team_id TEXT NOT NULL,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_vault_members_team ON vault_members (guild_id, team_id)")
+
+        # 4. ลิงก์ที่ส่งแล้วของทุกเกม (owner = user_id หรือ team_id)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS submissions (
+                guild_id INTEGER NOT NULL,
+                game TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                tid INTEGER NOT NULL,
+                link TEXT NOT NULL
+            )
+        ''')
+        self.conn.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_submissions_owner_tid
+            ON submissions (guild_id, game, owner, tid)
+        ''')
+
+        # 5. Admin ของแต่ละ guild
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS guild_admins (
+                guild_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (guild_id, user_id)
+            )
+        ''')
+
+        # 6. Event log (ต่อท้ายอย่างเดียว) กับ snapshot ของตารางสถานะ
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY,
+                guild_id INTEGER NOT NULL,
+                game TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                user_id INTEGER,
+                tid INTEGER,
+                link TEXT,
+                data TEXT,
+                created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+            )
+        ''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_events_user ON events (guild_id, user_id)")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY,
+                event_id INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+            )
+        ''')
+
+        # 7. ค่าตั้งค่าภายในของบอท (เช่น hash ของ command tree ที่ sync ล่าสุด)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+
+        if legacy:
+            self._import_legacy_tables(legacy)
+
+    def _detach_legacy_tables(self):
+        """ไฟล์ฐานข้อมูลจากก่อนมี guild_id: เปลี่ยนชื่อตารางเดิมเป็น legacy_* ไว้ย้ายข้อมูล คืนชื่อตารางที่เจอ"""
+        legacy = []
+        for table in LEGACY_COLUMNS:
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+            if columns and "guild_id" not in columns:
+                self.conn.execute(f"ALTER TABLE {table} RENAME TO legacy_{table}")
+                legacy.append(table)
+        for index in LEGACY_INDEXES:
+            # index เดิมติดไปกับตาราง legacy_* ชื่อซ้ำกับของใหม่ ต้องลบก่อน
+            self.conn.execute(f"DROP INDEX IF EXISTS {index}")
+        return legacy
+
+    def _import_legacy_tables(self, legacy):
+        """ย้ายทุกแถวจากตาราง legacy_* เข้า guild เดิม (legacy_guild_id) แล้วลบตารางเก่าทิ้ง"""
+        guild_id = self.legacy_guild_id
+        if not guild_id:
+            # ย้ายเข้า guild ที่ไม่มีอยู่จริงเท่ากับข้อมูลหายเงียบๆ หยุดก่อน (อยู่ใน transaction ของ migration ตารางเดิมไม่ถูกแตะ)
+            raise RuntimeError(f"{self.path} เป็นฐานข้อมูลรุ่นก่อนมีหลาย guild (ตาราง {', '.join(legacy)}) "
+                               "ตั้ง LEGACY_GUILD_ID เป็น id ของ guild ที่ข้อมูลนี้เป็นของก่อนเปิดบอท")
+        for table in legacy:
+            columns = LEGACY_COLUMNS[table]
+            self.conn.execute(f"INSERT OR IGNORE INTO {table} (guild_id, {columns}) SELECT ?, {columns} FROM legacy_{table}",
+                              (guild_id,))
+
+        if "vaults" in legacy and "vault_members" not in legacy:
+            # ไฟล์ที่เก่ากว่านั้นอีก: ยังไม่มีตารางสมาชิก เติมจากทีมที่มีอยู่
+            self.conn.execute("""
+                INSERT OR IGNORE INTO vault_members (guild_id, user_id, team_id)
+                SELECT ?, user1_id, team_id FROM legacy_vaults
+                UNION ALL
+                SELECT ?, user2_id, team_id FROM legacy_vaults
+            """, (guild_id, guild_id))
+
+        # ไฟล์ที่ยังเก็บลิงก์เป็น JSON ในคอลัมน์ links
+        sources = (
+            ("players", "user_id", GAME_ICEBERG),
+            ("snowflakes", "user_id", GAME_SNOWFLAKE),
+            ("vaults", "team_id", GAME_VAULT),
+        )
+        for table, key, game in sources:
+            if table not in legacy:
+                continue
+            columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info(legacy_{table})")]
+            if "links" not in columns:
+                continue
+            for owner, links_str in self.conn.execute(f"SELECT {key}, links FROM legacy_{table}").fetchall():
+                for link in json.loads(links_str or "[]"):
+                    self._add_submission(guild_id, game, owner, link)
+
+        for table in legacy:
+            self.conn.execute(f"DROP TABLE legacy_{table}")
+        print(f"Migrated {', '.join(legacy)} into guild {guild_id}")
+
+    def _add_submission(self, guild_id, game, owner, link):
+        # ลิงก์ที่ไม่มี tid ตรวจซ้ำไม่ได้อยู่แล้ว ข้ามไป
+        tid = parse_tid(link)
+        if tid is None:
+            return
+        self.conn.execute("INSERT OR IGNORE INTO submissions (guild_id, game, owner, tid, link) VALUES (?, ?, ?, ?, ?)",
+                          (guild_id, game, str(owner), tid, link))
+
+    def _delete_submissions(self, guild_id, game, owner):
+        self.conn.execute("DELETE FROM submissions WHERE guild_id = ? AND game = ? AND owner = ?", (guild_id, game, str(owner)))
+
+    def _log_event(self, guild_id, game, owner, kind, user_id=None, link=None, **data):
+        self.conn.execute("""
+            INSERT INTO events (guild_id, game, owner, kind, user_id, tid, link, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (guild_id, game, str(owner), kind, user_id, parse_tid(link) if link else None, link,
+              json.dumps(data, separators=(",", ":")) if data else None))
+
+    @on_worker
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @on_worker
+    def set_meta(self, key, value):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @on_worker
+    def _load_links(self, guild_id, game, owner):
+        cursor = self.conn.execute("SELECT tid FROM submissions WHERE guild_id = ? AND game = ? AND owner = ?",
+                                   (guild_id, game, str(owner)))
+        return {row[0] for row in cursor}
+
+    async def has_submission(self, guild_id, game, owner, tid):
+        """เช็คว่าลิงก์ (tid) นี้เคยส่งในเกมนี้ของ guild นี้แล้วหรือยัง"""
+        key = (guild_id, game, str(owner))
+        if tid in self._dirty_links.get(key, ()):
+            return True
+        tids = self.links_cache.get(key)
+        if tids is MISSING:
+            tids = await self._load_links(guild_id, game, owner)
+            self.links_cache.put(key, tids)
+        return tid in tids
+
+    def _remember_link(self, guild_id, game, owner, link):
+        tids = self.links_cache.get((guild_id, game, str(owner)))
+        if tids is not MISSING:
+            tids.add(parse_tid(link))
+
+    def _forget_links(self, guild_id, game, owner):
+        self.links_cache.put((guild_id, game, str(owner)), set())
+
+    async def _read_through(self, cache, key, loader, *args):
+        row = cache.get(key)
+        if row is MISSING:
+            # แถวที่ยังค้างอยู่ในคิว write-behind ต้องอ่านจากคิว ไม่ใช่จาก DB
+            row = self._dirty.get((cache, key), MISSING)
+            if row is MISSING:
+                row = await loader(*args)
+            cache.put(key, row)
+        return row
+
+    # --- WRITES ---
+    # งานเขียนแต่ละแบบเขียนเป็น _apply_* ที่ไม่จัดการ transaction เอง
+    # จะรันทีละงาน (_write) หรือรวมหลายงานเป็น transaction เดียว (_write_batch) ก็ได้
+    @on_worker
+    def _write(self, fn, *args):
+        self.last_write = time.monotonic()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            return fn(*args)
+
+    @on_worker
+    def _write_batch(self, ops):
+        self.last_write = time.monotonic()
+        try:
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                for fn, args in ops:
+                    fn(*args)
+        except sqlite3.Error:
+            # batch พังทั้งก้อน: เขียนทีละงานแทน งานที่ถูกต้องจะได้ไม่หายไปด้วย
+            for fn, args in ops:
+                try:
+                    with self.conn:
+                        self.conn.execute("BEGIN IMMEDIATE")
+                        fn(*args)
+                except sqlite3.Error as e:
+                    print(f"write-behind: ทิ้งงาน {fn.__name__}{args}: {e}")
+
+    async def _write_now(self, fn, *args):
+        # เขียนคิว write-behind ให้หมดก่อน ลำดับการเขียนใน DB จะได้ตรงกับลำดับที่เกิดขึ้นจริง
+        await self.flush()
+        return await self._write(fn, *args)
+
+    def _enqueue(self, fn, *args):
+        self._pending.append((fn, args))
+        self._flush_wanted.set()
+        if len(self._pending) >= WRITE_BATCH_SIZE:
+            self._batch_full.set()
+
+    def _stage(self, cache, key, row):
+        self._dirty[(cache, key)] = row
+        cache.put(key, row)
+
+    def _stage_link(self, guild_id, game, owner, link):
+        self._dirty_links.setdefault((guild_id, game, str(owner)), set()).add(parse_tid(link))
+        self._remember_link(guild_id, game, owner, link)
+
+    async def flush(self):
+        """เขียนงานที่ค้างในคิว write-behind ลงฐานข้อมูลเป็น transaction เดียว"""
+        if not self._pending:
+            return
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            ops, self._pending = self._pending, []
+            rows = dict(self._dirty)
+            links = {key: set(tids) for key, tids in self._dirty_links.items()}
+            await self._write_batch(ops)
+
+            # ปลดเฉพาะค่าที่ไม่ได้ถูกแก้ซ้ำระหว่างที่กำลังเขียน
+            for key, row in rows.items():
+                if self._dirty.get(key) is row:
+                    del self._dirty[key]
+            for key, tids in links.items():
+                remaining = self._dirty_links.get(key, set()) - tids
+                if remaining:
+                    self._dirty_links[key] = remaining
+                else:
+                    self._dirty_links.pop(key, None)
+
+    async def _flush_loop(self):
+        while True:
+            await self._flush_wanted.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), timeout=WRITE_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wanted.clear()
+            self._batch_full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"write-behind: flush ไม่สำเร็จ: {e}")
+
+    # --- GUILD ADMINS ---
+    @on_worker
+    def _load_admins(self, guild_id):
+        cursor = self.conn.execute("SELECT user_id FROM guild_admins WHERE guild_id = ?", (guild_id,))
+        return frozenset(row[0] for row in cursor)
+
+    async def get_admins(self, guild_id):
+        """คืน user_id ของ Admin ทุกคนใน guild นี้"""
+        return await self._read_through(self.admins_cache, guild_id, self._load_admins, guild_id)
+
+    def _apply_admin_insert(self, guild_id, user_id):
+        return self.conn.execute("INSERT OR IGNORE INTO guild_admins (guild_id, user_id) VALUES (?, ?)",
+                                 (guild_id, user_id)).rowcount > 0
+
+    def _apply_admin_delete(self, guild_id, user_id):
+        return self.conn.execute("DELETE FROM guild_admins WHERE guild_id = ? AND user_id = ?",
+                                 (guild_id, user_id)).rowcount > 0
+
+    async def add_admin(self, guild_id, user_id):
+        """เพิ่ม Admin ของ guild คืน False ถ้าเป็นอยู่แล้ว"""
+        added = await self._write_now(self._apply_admin_insert, guild_id, user_id)
+        self.admins_cache.pop(guild_id)
+        return added
+
+    async def remove_admin(self, guild_id, user_id):
+        """ถอด Admin ของ guild คืน False ถ้าไม่ได้เป็นอยู่แล้ว"""
+        removed = await self._write_now(self._apply_admin_delete, guild_id, user_id)
+        self.admins_cache.pop(guild_id)
+        return removed
+
+    # --- ICEBERG DB FUNCTIONS ---
+    @on_worker
+    def _load_player(self, guild_id, user_id):
+        cursor = self.conn.execute("SELECT attempts, target_attempts, completed FROM players WHERE guild_id = ? AND user_id = ?",
+                                   (guild_id, user_id))
+        return cursor.fetchone()
+
+    async def get_player(self, guild_id, user_id):
+        return await self._read_through(self.players_cache, (guild_id, user_id), self._load_player, guild_id, user_id)
+
+    def _apply_player_insert(self, guild_id, user_id, link, target):
+        row = self.conn.execute("""
+            INSERT INTO players (guild_id, user_id, attempts, target_attempts, completed) VALUES (?, ?, 0, ?, 0)
+            RETURNING attempts, target_attempts, completed
+        """, (guild_id, user_id, target)).fetchone()
+        self._add_submission(guild_id, GAME_ICEBERG, user_id, link)
+        self._log_event(guild_id, GAME_ICEBERG, user_id, EVENT_START, user_id, link, target=target)
+        return row
+
+    async def create_player(self, guild_id, user_id, link, target):
+        row = await self._write_now(self._apply_player_insert, guild_id, user_id, link, target)
+        self.players_cache.put((guild_id, user_id), row)
+        self._remember_link(guild_id, GAME_ICEBERG, user_id, link)
+        self._forget_profiles(guild_id, user_id)
+
+    def _apply_player_update(self, guild_id, user_id, attempts, completed, link):
+        row = self.conn.execute("""
+            UPDATE players SET attempts = ?, completed = ? WHERE guild_id = ? AND user_id = ?
+            RETURNING attempts, target_attempts, completed
+        """, (attempts, 1 if completed else 0, guild_id, user_id)).fetchone()
+        if row is None:
+            # ถูกรีเซ็ตไประหว่างที่ handler อ่านกับเขียน: ไม่มีแถวให้แก้ ก็ไม่บันทึกลิงก์/event
+            return None
+        self._add_submission(guild_id, GAME_ICEBERG, user_id, link)
+        self._log_event(guild_id, GAME_ICEBERG, user_id, EVENT_SUBMIT, user_id, link,
+                        attempts=attempts, completed=1 if completed else 0)
+        return row
+
+    async def update_player_progress(self, guild_id, user_id, attempts, completed, link):
+        key = (guild_id, user_id)
+        self._forget_profiles(guild_id, user_id)
+        if self.write_behind:
+            player = await self.get_player(guild_id, user_id)
+            if player is None:
+                return
+            self._enqueue(self._apply_player_update, guild_id, user_id, attempts, completed, link)
+            self._stage(self.players_cache, key, (attempts, player[1], 1 if completed else 0))
+            self._stage_link(guild_id, GAME_ICEBERG, user_id, link)
+            return
+        row = await self._write(self._apply_player_update, guild_id, user_id, attempts, completed, link)
+        self.players_cache.put(key, row)
+        if row is not None:
+            self._remember_link(guild_id, GAME_ICEBERG, user_id, link)
+
+    def _apply_player_delete(self, guild_id, user_id):
+        self.conn.execute("DELETE FROM players WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        self._delete_submissions(guild_id, GAME_ICEBERG, user_id)
+        self._log_event(guild_id, GAME_ICEBERG, user_id, EVENT_RESET, user_id)
+
+    async def delete_player(self, guild_id, user_id):
+        await self._write_now(self._apply_player_delete, guild_id, user_id)
+        self.players_cache.put((guild_id, user_id), None)
+        self._forget_links(guild_id, GAME_ICEBERG, user_id)
+        self._forget_profiles(guild_id, user_id)
+
+    # --- SNOWFLAKE DB FUNCTIONS ---
+    @on_worker
+    def _load_snow_player(self, guild_id, user_id):
+        cursor = self.conn.execute("SELECT count, completed FROM snowflakes WHERE guild_id = ? AND user_id = ?",
+                                   (guild_id, user_id))
+        return cursor.fetchone()
+
+    async def get_snow_player(self, guild_id, user_id):
+        return await self._read_through(self.snow_cache, (guild_id, user_id), self._load_snow_player, guild_id, user_id)
+
+    def _apply_snow_insert(self, guild_id, user_id, link):
+        row = self.conn.execute("""
+            INSERT INTO snowflakes (guild_id, user_id, count, completed) VALUES (?, ?, 0, 0)
+            RETURNING count, completed
+        """, (guild_id, user_id)).fetchone()
+        self._add_submission(guild_id, GAME_SNOWFLAKE, user_id, link)
+        self._log_event(guild_id, GAME_SNOWFLAKE, user_id, EVENT_START, user_id, link)
+        return row
+
+    async def create_snow_player(self, guild_id, user_id, link):
+        row = await self._write_now(self._apply_snow_insert, guild_id, user_id, link)
+        self.snow_cache.put((guild_id, user_id), row)
+        self._remember_link(guild_id, GAME_SNOWFLAKE, user_id, link)
+        self._forget_profiles(guild_id, user_id)
+
+    def _apply_snow_update(self, guild_id, user_id, count, completed, link, snatch):
+        row = self.conn.execute("""
+            UPDATE snowflakes SET count = ?, completed = ? WHERE guild_id = ? AND user_id = ?
+            RETURNING count, completed
+        """, (count, 1 if completed else 0, guild_id, user_id)).fetchone()
+        if row is None:
+            return None
+        self._add_submission(guild_id, GAME_SNOWFLAKE, user_id, link)
+        self._log_event(guild_id, GAME_SNOWFLAKE, user_id, EVENT_SNATCH, user_id, link,
+                        count=count, completed=1 if completed else 0)
+        if snatch is not None:
+            time_limit, latency, reaction = snatch
+            self.conn.execute("""
+                INSERT INTO snatch_attempts (guild_id, user_id, count, time_limit, latency, reaction, success)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (guild_id, user_id, count, time_limit, latency, reaction, 0 if reaction is None else 1))
+        return row
+
+    async def update_snow_progress(self, guild_id, user_id, count, completed, link, snatch=None):
+        """snatch = (time_limit, latency, reaction) ของรอบนี้ จะถูกบันทึกลง snatch_attempts ใน transaction เดียวกัน"""
+        key = (guild_id, user_id)
+        self._forget_profiles(guild_id, user_id)
+        if self.write_behind:
+            if await self.get_snow_player(guild_id, user_id) is None:
+                return
+            self._enqueue(self._apply_snow_update, guild_id, user_id, count, completed, link, snatch)
+            self._stage(self.snow_cache, key, (count, 1 if completed else 0))
+            self._stage_link(guild_id, GAME_SNOWFLAKE, user_id, link)
+            return
+        row = await self._write(self._apply_snow_update, guild_id, user_id, count, completed, link, snatch)
+        self.snow_cache.put(key, row)
+        if row is not None:
+            self._remember_link(guild_id, GAME_SNOWFLAKE, user_id, link)
+
+    def _apply_snow_delete(self, guild_id, user_id):
+        self.conn.execute("DELETE FROM snowflakes WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        self._delete_submissions(guild_id, GAME_SNOWFLAKE, user_id)
+        self._log_event(guild_id, GAME_SNOWFLAKE, user_id, EVENT_RESET, user_id)
+
+    async def delete_snow_player(self, guild_id, user_id):
+        await self._write_now(self._apply_snow_delete, guild_id, user_id)
+        self.snow_cache.put((guild_id, user_id), None)
+        self._forget_links(guild_id, GAME_SNOWFLAKE, user_id)
+        self._forget_profiles(guild_id, user_id)
+
+    # --- VAULT DB FUNCTIONS ---
+    @on_worker
+    def _load_vault_member(self, guild_id, user_id):
+        row = self.conn.execute("SELECT team_id FROM vault_members WHERE guild_id = ? AND user_id = ?",
+                                (guild_id, user_id)).fetchone()
+        return row[0] if row else None
+
+    @on_worker
+    def _load_vault_team(self, guild_id, team_id):
+        cursor = self.conn.execute(f"SELECT {VAULT_COLUMNS} FROM vaults WHERE guild_id = ? AND team_id = ?",
+                                   (guild_id, team_id))
+        return cursor.fetchone()
+
+    async def get_vault_team(self, guild_id, user_id):
+        team_id = await self._read_through(self.members_cache, (guild_id, user_id), self._load_vault_member, guild_id, user_id)
+        if team_id is None:
+            return None
+        return await self._read_through(self.vaults_cache, (guild_id, team_id), self._load_vault_team, guild_id, team_id)
+
+    def _apply_vault_insert(self, guild_id, team_id, user1_id, user2_id, warmer_id, turner_id, target):
+        # (guild_id, user_id) เป็น PRIMARY KEY ถ้าใครมีทีมอยู่แล้ว insert จะพังและ rollback ทั้งก้อน
+        self.conn.execute("INSERT INTO vault_members (guild_id, user_id, team_id) VALUES (?, ?, ?), (?, ?, ?)",
+                          (guild_id, user1_id, team_id, guild_id, user2_id, team_id))
+        row = self.conn.execute(f"""
+            INSERT INTO vaults (guild_id, team_id, user1_id, user2_id, role_warmer, role_turner,
+                                attempts, target_attempts, completed, round_link_u1, round_link_u2)
+            VALUES (?, ?, ?, ?, ?, ?, 0, ?, 0, NULL, NULL)
+            RETURNING {VAULT_COLUMNS}
+        """, (guild_id, team_id, user1_id, user2_id, warmer_id, turner_id, target)).fetchone()
+        self._log_event(guild_id, GAME_VAULT, team_id, EVENT_CREATE, user1_id,
+                        user2=user2_id, warmer=warmer_id, turner=turner_id, target=target)
+        return row
+
+    async def create_vault_team(self, guild_id, user1_id, user2_id, target):
+        team_id = f"{user1_id}_{user2_id}"
+        roles_config = random.choice([0, 1])
+        warmer_id = user1_id if roles_config == 0 else user2_id
+        turner_id = user2_id if roles_config == 0 else user1_id
+
+        try:
+            row = await self._write_now(self._apply_vault_insert, guild_id, team_id, user1_id, user2_id,
+                                        warmer_id, turner_id, target)
+        except sqlite3.IntegrityError:
+            # ไม่รู้ว่าใครมีทีมอยู่ ให้ไปโหลดใหม่จากฐานข้อมูลรอบหน้า
+            self.members_cache.pop((guild_id, user1_id))
+            self.members_cache.pop((guild_id, user2_id))
+            return None
+        self.members_cache.put((guild_id, user1_id), team_id)
+        self.members_cache.put((guild_id, user2_id), team_id)
+        self.vaults_cache.put((guild_id, team_id), row)
+        self._forget_links(guild_id, GAME_VAULT, team_id)
+        self._forget_profiles(guild_id, user1_id, user2_id)
+        return warmer_id, turner_id
+
+    def _team_lock(self, key):
+        # lock ต่อทีม ถูกเก็บไว้เท่าที่ยังมีคนถือหรือรออยู่เท่านั้น
+        lock = self._team_locks.get(key)
+        if lock is None:
+            lock = self._team_locks[key] = asyncio.Lock()
+        return lock
+
+    def _apply_vault_link(self, guild_id, team_id, user_id, link):
+        tid = parse_tid(link)
+        row = self.conn.execute(f"SELECT {VAULT_COLUMNS} FROM vaults WHERE guild_id = ? AND team_id = ?",
+                                (guild_id, team_id)).fetchone()
+        used = row is not None and self.conn.execute(
+            "SELECT 1 FROM submissions WHERE guild_id = ? AND game = ? AND owner = ? AND tid = ?",
+            (guild_id, GAME_VAULT, team_id, tid)
+        ).fetchone() is not None
+        status = classify_vault_submit(row, user_id, tid, used)
+        if status is not None:
+            return status, row, ()
+
+        # compare-and-set: เขียนช่องของตัวเองได้เฉพาะตอนที่ยังว่างอยู่
+        column = "round_link_u1" if user_id == row[1] else "round_link_u2"
+        row = self.conn.execute(f"""
+            UPDATE vaults SET {column} = ?
+            WHERE guild_id = ? AND team_id = ? AND completed = 0 AND {column} IS NULL
+            RETURNING {VAULT_COLUMNS}
+        """, (link, guild_id, team_id)).fetchone()
+        self._log_event(guild_id, GAME_VAULT, team_id, EVENT_LINK, user_id, link)
+        r_link1, r_link2 = row[8], row[9]
+        if not (r_link1 and r_link2):
+            return VAULT_WAITING, row, ()
+
+        # --- ครบ 2 คนแล้ว! ปิดรอบใน transaction เดียวกัน ---
+        attempts = row[5]
+        row = self.conn.execute(f"""
+            UPDATE vaults SET attempts = attempts + 1,
+                              completed = (attempts + 1 >= target_attempts),
+                              round_link_u1 = NULL, round_link_u2 = NULL
+            WHERE guild_id = ? AND team_id = ? AND attempts = ?
+              AND round_link_u1 IS NOT NULL AND round_link_u2 IS NOT NULL
+            RETURNING {VAULT_COLUMNS}
+        """, (guild_id, team_id, attempts)).fetchone()
+        for round_link in (r_link1, r_link2):
+            self._add_submission(guild_id, GAME_VAULT, team_id, round_link)
+        self._log_event(guild_id, GAME_VAULT, team_id, EVENT_ROUND, user_id,
+                        tids=[parse_tid(r_link1), parse_tid(r_link2)], attempts=row[5], completed=row[7])
+        return VAULT_ROUND, row, (r_link1, r_link2)
+
+    async def submit_vault_link(self, guild_id, user_id, link):
+        """ส่งลิงก์รอบนี้ของสมาชิก ถ้าคู่หูส่งแล้วจะปิดรอบให้ทันที คืน (สถานะ, แถวทีมล่าสุด)"""
+        team = await self.get_vault_team(guild_id, user_id)
+        if team is None:
+            return VAULT_NO_TEAM, None
+        team_id = team[0]
+        key = (guild_id, team_id)
+
+        async with self._team_lock(key):
+            # ได้ lock แล้ว cache ของทีมนี้เป็นค่าล่าสุด เช็คกรณีที่ตอบได้เลยโดยไม่ต้องเข้า DB
+            team = await self.get_vault_team(guild_id, user_id)
+            if team is None:
+                return VAULT_NO_TEAM, None
+            tid = parse_tid(link)
+            used = await self.has_submission(guild_id, GAME_VAULT, team_id, tid)
+            status = classify_vault_submit(team, user_id, tid, used)
+            if status is not None:
+                return status, team
+
+            self._forget_profiles(guild_id, team[1], team[2])
+            if self.write_behind:
+                # สถานะใน cache เป็นค่าล่าสุดเสมอ (ถือ lock ทีมอยู่) คำนวณผลเองแล้วค่อยเขียนตามทีหลัง
+                status, row, round_links = plan_vault_link(team, user_id, link)
+                self._enqueue(self._apply_vault_link, guild_id, team_id, user_id, link)
+                self._stage(self.vaults_cache, key, row)
+                for round_link in round_links:
+                    self._stage_link(guild_id, GAME_VAULT, team_id, round_link)
+                return status, row
+
+            status, row, round_links = await self._write(self._apply_vault_link, guild_id, team_id, user_id, link)
+            self.vaults_cache.put(key, row)
+            for round_link in round_links:
+                self._remember_link(guild_id, GAME_VAULT, team_id, round_link)
+        return status, row
+
+    def _apply_vault_delete(self, guild_id, team_id):
+        members = self.conn.execute("DELETE FROM vault_members WHERE guild_id = ? AND team_id = ? RETURNING user_id",
+                                    (guild_id, team_id)).fetchall()
+        self.conn.execute("DELETE FROM vaults WHERE guild_id = ? AND team_id = ?", (guild_id, team_id))
+        self._delete_submissions(guild_id, GAME_VAULT, team_id)
+        self._log_event(guild_id, GAME_VAULT, team_id, EVENT_RESET)
+        return [row[0] for row in members]
+
+    async def delete_vault_team(self, guild_id, team_id):
+        for user_id in await self._write_now(self._apply_vault_delete, guild_id, team_id):
+            self.members_cache.put((guild_id, user_id), None)
+            self._forget_profiles(guild_id, user_id)
+        self.vaults_cache.put((guild_id, team_id), None)
+        self._forget_links(guild_id, GAME_VAULT, team_id)
+
+    # --- PROFILE ---
+    # สถานะทุกเกมของผู้เล่นหนึ่งคนใน query เดียว (ทุก join เป็นการหาตาม primary key) แล้วเก็บใน TTL cache
+    @on_worker
+    def _load_profile(self, guild_id, user_id):
+        return self.conn.execute(PROFILE_QUERY, (guild_id, user_id)).fetchone()
+
+    async def get_profile(self, guild_id, user_id):
+        """คืน (แถว iceberg, แถว snowflake, แถวทีม vault) รูปเดียวกับ get_player/get_snow_player/get_vault_team
+        เกมที่ยังไม่ได้เริ่มเป็น None"""
+        key = (guild_id, user_id)
+        profile = self.profiles_cache.get(key)
+        if profile is MISSING:
+            # อ่านจาก DB ตรงๆ งานที่ค้างในคิว write-behind ต้องลงก่อน
+            await self.flush()
+            row = await self._load_profile(guild_id, user_id)
+            profile = (row[0:3] if row[2] is not None else None,
+                       row[3:5] if row[4] is not None else None,
+                       row[5:] if row[5] is not None else None)
+            self.profiles_cache.put(key, profile)
+        return profile
+
+    def _forget_profiles(self, guild_id, *user_ids):
+        for user_id in user_ids:
+            self.profiles_cache.pop((guild_id, user_id))
+
+    # --- SEASON / BULK ADMIN ---
+    # งานทีละทั้งเกม (หรือทั้ง role) เป็น SQL แบบ set-based ใน transaction เดียว แทนการวนลบ/แก้ทีละคน
+    # log เป็น event เดียวต่อเกม (owners = None คือทั้งเกม) replay ผ่าน apply_event ได้เหมือน event อื่น
+    # ยอดใน game_counters/attempt_buckets ตามเองผ่าน trigger
+    def _bulk_scope(self, guild_id, game, user_ids):
+        """เติม temp.bulk_scope ด้วย key ของแถวที่งานนี้ครอบคลุม (user_id หรือ team_id ที่มีสมาชิกใน user_ids)"""
+        table, key, _ = REPORT_SOURCES[game]
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_scope (owner PRIMARY KEY)")
+        self.conn.execute("DELETE FROM temp.bulk_scope")
+        where, args = "", ()
+        if user_ids is not None and game == GAME_VAULT:
+            where = """AND team_id IN (SELECT team_id FROM vault_members
+                                       WHERE guild_id = ? AND user_id IN (SELECT value FROM json_each(?)))"""
+            args = (guild_id, json.dumps(list(user_ids)))
+        elif user_ids is not None:
+            where, args = "AND user_id IN (SELECT value FROM json_each(?))", (json.dumps(list(user_ids)),)
+        return self.conn.execute(f"INSERT INTO temp.bulk_scope SELECT {key} FROM {table} WHERE guild_id = ? {where}",
+                                 (guild_id, *args)).rowcount
+
+    def _scope_owners(self, user_ids):
+        if user_ids is None:
+            return None
+        return [row[0] for row in self.conn.execute("SELECT owner FROM temp.bulk_scope ORDER BY owner")]
+
+    def _apply_season_reset(self, guild_id, games, season, user_ids):
+        report = {}
+        for game in games:
+            table, key, _ = REPORT_SOURCES[game]
+            counts = report[game] = {"rows": 0, "archived": 0, "submissions": 0}
+            if not self._bulk_scope(guild_id, game, user_ids):
+                continue
+            fields = ", ".join(f"'{column.strip()}', t.{column.strip()}" for column in STATE_TABLES[table].split(",")[1:])
+            counts["archived"] = self.conn.execute(f"""
+                INSERT INTO season_archive (guild_id, season, game, owner, data)
+                SELECT t.guild_id, ?, ?, CAST(t.{key} AS TEXT), json_object({fields}, 'links', json((
+                    SELECT json_group_array(s.link) FROM submissions s
+                    WHERE s.guild_id = t.guild_id AND s.game = ? AND s.owner = CAST(t.{key} AS TEXT))))
+                FROM {table} t WHERE t.guild_id = ? AND t.{key} IN (SELECT owner FROM temp.bulk_scope)
+            """, (season, game, game, guild_id)).rowcount
+            counts["submissions"] = self.conn.execute("""
+                DELETE FROM submissions WHERE guild_id = ? AND game = ?
+                AND owner IN (SELECT CAST(owner AS TEXT) FROM temp.bulk_scope)
+            """, (guild_id, game)).rowcount
+            if game == GAME_VAULT:
+                self.conn.execute("DELETE FROM vault_members WHERE guild_id = ? AND team_id IN (SELECT owner FROM temp.bulk_scope)",
+                                  (guild_id,))
+            counts["rows"] = self.conn.execute(f"DELETE FROM {table} WHERE guild_id = ? AND {key} IN (SELECT owner FROM temp.bulk_scope)",
+                                               (guild_id,)).rowcount
+            self._log_event(guild_id, game, "*", EVENT_SEASON, season=season, owners=self._scope_owners(user_ids))
+        return report
+
+    async def reset_season(self, guild_id, games, season, user_ids=None):
+        """เก็บแถวของเกมเหล่านี้ลง season_archive แล้วลบทิ้ง (user_ids = None คือทั้ง guild) คืนจำนวนต่อเกม"""
+        report = await self._write_bulk(games, self._apply_season_reset, guild_id, tuple(games), season, user_ids)
+        self.links_cache.clear()
+        return report
+
+    def _apply_target_adjust(self, guild_id, games, value, delta, user_ids):
+        # แก้เฉพาะคนที่ยังไม่สำเร็จ คนที่ผ่านเป้าใหม่ไปแล้วจะสำเร็จตอนส่งลิงก์ครั้งถัดไปตามปกติ
+        report = {}
+        target = "?" if value is not None else "target_attempts + ?"
+        for game in games:
+            table, key, _ = REPORT_SOURCES[game]
+            report[game] = 0
+            if not self._bulk_scope(guild_id, game, user_ids):
+                continue
+            report[game] = self.conn.execute(f"""
+                UPDATE {table} SET target_attempts = MAX(1, {target})
+                WHERE guild_id = ? AND completed = 0 AND {key} IN (SELECT owner FROM temp.bulk_scope)
+            """, (value if value is not None else delta, guild_id)).rowcount
+            self._log_event(guild_id, game, "*", EVENT_TARGET, value=value, delta=delta, owners=self._scope_owners(user_ids))
+        return report
+
+    async def adjust_targets(self, guild_id, games, value=None, delta=None, user_ids=None):
+        """ตั้งเป้า (value) หรือบวก/ลบเป้า (delta) ของ iceberg/vault ทีละทั้งเกม เป้าต่ำสุดคือ 1 คืนจำนวนแถวต่อเกม"""
+        return await self._write_bulk(games, self._apply_target_adjust, guild_id, tuple(games), value, delta, user_ids)
+
+    async def _write_bulk(self, games, fn, *args):
+        report = await self._write_now(fn, *args)
+        # ระหว่าง flush กับงานทีละชุด handler อาจเข้าคิวงานใหม่ไว้อีก ต้องเขียนตามลงไปให้หมดก่อน
+        # (แถวที่ถูกลบไปแล้วจะถูกข้ามเอง) แล้วค่อยล้าง cache โดยไม่มี await คั่น ไม่งั้นแถวเก่าจะถูกอ่านกลับเข้า cache
+        while self._pending or self._flush_lock.locked():
+            await self.flush()
+            async with self._flush_lock:
+                pass
+        self._clear_game_caches(games)
+        return report
+
+    def _clear_game_caches(self, games):
+        # งานทีละชุดไม่รู้ key ทีละแถว ล้าง cache ของเกมนั้นทั้งก้อน (งาน admin นานๆ ครั้ง)
+        caches = {
+            GAME_ICEBERG: (self.players_cache,),
+            GAME_SNOWFLAKE: (self.snow_cache,),
+            GAME_VAULT: (self.vaults_cache, self.members_cache),
+        }
+        for game in games:
+            for cache in caches[game]:
+                cache.clear()
+                for key in [key for key in self._dirty if key[0] is cache]:
+                    del self._dirty[key]
+            for key in [key for key in self._dirty_links if key[1] == game]:
+                del self._dirty_links[key]
+        self.profiles_cache.clear()
+
+    # --- ADMIN REPORTS ---
+    # รายงานอ่านจาก DB ตรงๆ เลยต้องเขียนคิว write-behind ให้หมดก่อน
+    @on_worker
+    def _report_totals(self, guild_id, game):
+        # game_counters ถูก trigger อัปเดตตามทุกการเขียน อ่านแถวเดียวไม่ต้องนับทั้งตาราง
+        row = self.conn.execute("SELECT players, completed FROM game_counters WHERE guild_id = ? AND game = ?",
+                                (guild_id, game)).fetchone()
+        return row or (0, 0)
+
+    async def get_report_totals(self, guild_id, game):
+        """คืน (จำนวนทั้งหมด, จำนวนที่สำเร็จ) ของเกมนั้นใน guild นี้"""
+        await self.flush()
+        return await self._report_totals(guild_id, game)
+
+    async def get_report_page(self, guild_id, game, after=None, before=None, limit=REPORT_PAGE_SIZE):
+        """ดึงรายงานทีละหน้าแบบ keyset (ต่อจาก key after หรือย้อนจาก key before) คืน (แถว, มีหน้าต่อไหม)"""
+        await self.flush()
+        return await self._report_page(guild_id, game, after, before, limit)
+
+    @on_worker
+    def _report_page(self, guild_id, game, after, before, limit):
+        return self._page(guild_id, game, after, before, limit)
+
+    def _page(self, guild_id, game, after, before, limit):
+        table, key, columns = REPORT_SOURCES[game]
+        if before is not None:
+            rows = self.conn.execute(f"""
+                SELECT {columns} FROM {table} WHERE guild_id = ? AND {key} < ? ORDER BY {key} DESC LIMIT ?
+            """, (guild_id, before, limit + 1)).fetchall()
+            more = len(rows) > limit
+            rows = rows[:limit]
+            rows.reverse()
+            return rows, more
+        if after is not None:
+            rows = self.conn.execute(f"""
+                SELECT {columns} FROM {table} WHERE guild_id = ? AND {key} > ? ORDER BY {key} LIMIT ?
+            """, (guild_id, after, limit + 1)).fetchall()
+        else:
+            rows = self.conn.execute(f"SELECT {columns} FROM {table} WHERE guild_id = ? ORDER BY {key} LIMIT ?",
+                                     (guild_id, limit + 1)).fetchall()
+        return rows[:limit], len(rows) > limit
+
+    # --- EXPORT ---
+    @on_worker
+    def _export_chunk(self, guild_id, game, after, limit):
+        rows, _ = self._page(guild_id, game, after, None, limit)
+        links = {}
+        if rows:
+            owners = [str(row[0]) for row in rows]
+            marks = ", ".join("?" * len(owners))
+            cursor = self.conn.execute(f"""
+                SELECT owner, link FROM submissions WHERE guild_id = ? AND game = ? AND owner IN ({marks}) ORDER BY rowid
+            """, (guild_id, game, *owners))
+            for owner, link in cursor:
+                links.setdefault(owner, []).append(link)
+        return [(row, links.get(str(row[0]), [])) for row in rows]
+
+    async def iter_progress(self, guild_id, game, chunk=EXPORT_CHUNK):
+        """ไล่ทุกแถวของเกมนี้ทีละก้อน (แต่ละก้อนเป็นงานสั้นๆ บน DB thread) yield [(แถว, [ลิงก์ที่ส่งแล้ว]), ...]"""
+        await self.flush()
+        after = None
+        while True:
+            rows = await self._export_chunk(guild_id, game, after, chunk)
+            if rows:
+                yield rows
+            if len(rows) < chunk:
+                return
+            after = rows[-1][0][0]
+
+    @on_worker
+    def _dashboard(self, guild_id):
+        counters = {game: (players, completed, attempts_sum, []) for game, players, completed, attempts_sum
+                    in self.conn.execute("""
+                        SELECT game, players, completed, attempts_sum FROM game_counters WHERE guild_id = ?
+                    """, (guild_id,))}
+        for game, target, attempts, players in self.conn.execute("""
+            SELECT game, target, attempts, players FROM attempt_buckets WHERE guild_id = ? ORDER BY game, target, attempts
+        """, (guild_id,)):
+            if game in counters:
+                counters[game][3].append((target, attempts, players))
+        return counters
+
+    async def get_dashboard(self, guild_id):
+        """{เกม: (ผู้เล่น, สำเร็จ, ผลรวมจำนวนครั้ง, [(เป้า, จำนวนครั้ง, จำนวนคน)])} จากตารางยอดสรุป
+        ไม่ flush ก่อน (เรียกทุกไม่กี่วินาที) โหมด write-behind เลยช้ากว่าของจริงได้ไม่เกินรอบ flush เดียว"""
+        return await self._dashboard(guild_id)
+
+    # --- BACKUP / COMPACTION ---
+    def _backup_file(self, dest, pages, sleep):
+        # connection แยกบน thread แยก DB thread ของบอทยังรับงานตามปกติ
+        # เปิด read transaction ค้างไว้: snapshot นิ่งตลอดการก๊อป (WAL ไม่บล็อกคนเขียน และ backup ไม่ต้องเริ่มใหม่ทุกครั้งที่มีคนเขียนแทรก)
+        partial = dest + ".part"
+        src = sqlite3.connect(self.path, isolation_level=None)
+        dst = sqlite3.connect(partial)
+        try:
+            src.execute("BEGIN")
+            src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone()
+            src.backup(dst, pages=pages, sleep=sleep)
+            src.execute("COMMIT")
+            result = dst.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            dst.close()
+            src.close()
+        if result != "ok":
+            os.remove(partial)
+            raise sqlite3.DatabaseError(f"backup ไม่ผ่าน quick_check: {result}")
+        os.replace(partial, dest)
+        return os.path.getsize(dest)
+
+    async def backup(self, dest, pages=BACKUP_PAGES, sleep=BACKUP_STEP_SLEEP):
+        """สำเนาฐานข้อมูลทั้งไฟล์ (ณ จุดเวลาเดียว) ไปที่ dest ระหว่างบอททำงานอยู่ คืนขนาดไฟล์"""
+        await self.flush()
+        return await asyncio.to_thread(self._backup_file, dest, pages, sleep)
+
+    def is_quiet(self, seconds):
+        return not self._pending and time.monotonic() - self.last_write >= seconds
+
+    @on_worker
+    def freelist_pages(self):
+        return self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    @on_worker
+    def compact_step(self, pages):
+        """คืนหน้าว่างท้ายไฟล์ให้ระบบไม่เกิน pages หน้า (งานสั้นๆ งานอื่นแทรกคิวได้ระหว่างรอบ) คืนหน้าว่างที่เหลือ"""
+        self.conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        return self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    @on_worker
+    def checkpoint(self):
+        """ย้าย WAL ลงไฟล์หลักแล้วตัด WAL ให้สั้น คืน (busy, หน้าใน WAL, หน้าที่ย้ายแล้ว)"""
+        return self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+
+    # --- EVENT LOG: SNAPSHOT / REPLAY ---
+    def _snapshot(self):
+        event_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        tables = {name: self.conn.execute(f"SELECT {columns} FROM {name}").fetchall()
+                  for name, columns in STATE_TABLES.items()}
+        data = zlib.compress(json.dumps(tables, separators=(",", ":")).encode())
+        self.conn.execute("INSERT INTO snapshots (event_id, data) VALUES (?, ?)", (event_id, data))
+        self.conn.execute("DELETE FROM snapshots WHERE id NOT IN (SELECT id FROM snapshots ORDER BY id DESC LIMIT ?)",
+                          (SNAPSHOT_KEEP,))
+        return event_id
+
+    @on_worker
+    def _take_snapshot(self):
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            return self._snapshot()
+
+    async def take_snapshot(self):
+        """ถ่าย snapshot ของตารางสถานะ คืน id ของ event ล่าสุดที่รวมอยู่ใน snapshot"""
+        await self.flush()
+        return await self._take_snapshot()
+
+    @on_worker
+    def _events_since_snapshot(self):
+        return self.conn.execute("""
+            SELECT (SELECT COALESCE(MAX(id), 0) FROM events) - (SELECT COALESCE(MAX(event_id), 0) FROM snapshots)
+        """).fetchone()[0]
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+            try:
+                if await self._events_since_snapshot() >= SNAPSHOT_MIN_EVENTS:
+                    await self.take_snapshot()
+            except Exception as e:
+                print(f"snapshot ไม่สำเร็จ: {e}")
+
+    def _replay(self):
+        # snapshot ล่าสุด + เล่น event ที่เกิดหลังจากนั้นทับ
+        row = self.conn.execute("SELECT event_id, data FROM snapshots ORDER BY id DESC LIMIT 1").fetchone()
+        event_id, data = row if row else (0, None)
+        tables = json.loads(zlib.decompress(data)) if data else {name: [] for name in STATE_TABLES}
+        state = state_from_rows(tables)
+        count = 0
+        for event in self.conn.execute(f"SELECT {EVENT_COLUMNS} FROM events WHERE id > ? ORDER BY id", (event_id,)):
+            apply_event(state, event)
+            count += 1
+        return rows_from_state(state), count
+
+    @on_worker
+    def _verify_state(self):
+        rows, _ = self._replay()
+        diff = {}
+        for name, columns in STATE_TABLES.items():
+            expected = set(rows[name])
+            actual = set(self.conn.execute(f"SELECT {columns} FROM {name}").fetchall())
+            if expected != actual:
+                diff[name] = (len(expected - actual), len(actual - expected))
+        diff.update(self._counter_drift())
+        return diff
+
+    def _counter_drift(self):
+        """นับยอดสรุปใหม่จากตารางสถานะแล้วเทียบกับที่ trigger ดูแลไว้"""
+        counters, buckets = set(), set()
+        for table, game, attempts, target in COUNTER_SOURCES:
+            counters.update(self.conn.execute(f"""
+                SELECT guild_id, ?, COUNT(*), COALESCE(SUM(completed), 0), COALESCE(SUM({attempts}), 0)
+                FROM {table} GROUP BY guild_id
+            """, (game,)))
+            bucket = target.format(row=table)
+            buckets.update(self.conn.execute(f"""
+                SELECT guild_id, ?, {bucket}, {attempts}, COUNT(*) FROM {table} GROUP BY 1, 3, 4
+            """, (game,)))
+        tables = {
+            "game_counters": (counters, set(self.conn.execute("""
+                SELECT guild_id, game, players, completed, attempts_sum FROM game_counters
+                WHERE players != 0 OR completed != 0 OR attempts_sum != 0
+            """))),
+            "attempt_buckets": (buckets, set(self.conn.execute(
+                "SELECT guild_id, game, target, attempts, players FROM attempt_buckets"))),
+        }
+        return {name: (len(expected - rows), len(rows - expected))
+                for name, (expected, rows) in tables.items() if expected != rows}
+
+    async def verify_state(self):
+        """replay แล้วเทียบกับตารางจริง คืน {ตาราง: (จำนวนแถวที่ขาด, จำนวนแถวที่เกิน)} เฉพาะตารางที่ไม่ตรง"""
+        await self.flush()
+        return await self._verify_state()
+
+    @on_worker
+    def _rebuild_state(self):
+        rows, count = self._replay()
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            for name in (*STATE_TABLES, "vault_members"):
+                self.conn.execute(f"DELETE FROM {name}")
+            for name, columns in STATE_TABLES.items():
+                placeholders = ", ".join("?" * len(columns.split(",")))
+                self.conn.executemany(f"INSERT INTO {name} ({columns}) VALUES ({placeholders})", rows[name])
+            self.conn.executemany("INSERT INTO vault_members (guild_id, user_id, team_id) VALUES (?, ?, ?)",
+                                  [(row[0], user_id, row[1]) for row in rows["vaults"] for user_id in (row[2], row[3])])
+        return count
+
+    async def rebuild_state(self):
+        """ประกอบตารางสถานะใหม่ทั้งหมดจาก snapshot ล่าสุด + event log คืนจำนวน event ที่เล่นซ้ำ"""
+        await self.flush()
+        count = await self._rebuild_state()
+        for cache in self.caches.values():
+            cache.clear()
+        return count
+
+    @on_worker
+    def _history(self, guild_id, user_id, limit):
+        return self.conn.execute("""
+            SELECT id, game, kind, tid, data, created_at FROM events
+            WHERE guild_id = ? AND user_id = ? ORDER BY id DESC LIMIT ?
+        """, (guild_id, user_id, limit)).fetchall()
+
+    async def get_history(self, guild_id, user_id, limit=HISTORY_LIMIT):
+        """event ล่าสุดที่ผู้เล่นคนนี้เป็นคนทำ (ใหม่สุดก่อน) ไว้ดูตอนมีปัญหาเรื่องลิงก์ที่ส่ง"""
+        await self.flush()
+        return await self._history(guild_id, user_id, limit)
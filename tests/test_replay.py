@@ -0,0 +1,92 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import (  # noqa: E402
+    Storage, apply_event, GAME_ICEBERG, GAME_SNOWFLAKE, EVENT_SUBMIT, EVENT_SNATCH,
+)
+
+LINK = "https://example.com/viewthread.php?tid={}"
+
+
+def empty_state():
+    return {"players": {}, "snowflakes": {}, "vaults": {}, "submissions": {}}
+
+
+class ResetRaceTest(unittest.TestCase):
+    """ผู้เล่นถูกรีเซ็ตระหว่างที่ handler อ่านกับเขียน: ต้องไม่เหลือลิงก์ค้างและ replay ต้องไม่พัง"""
+
+    def test_apply_event_skips_progress_for_missing_row(self):
+        state = empty_state()
+        submit = (1, 5, GAME_ICEBERG, "1", EVENT_SUBMIT, 1, 7, LINK.format(7), json.dumps({"attempts": 2, "completed": 0}))
+        snatch = (2, 5, GAME_SNOWFLAKE, "1", EVENT_SNATCH, 1, 8, LINK.format(8), json.dumps({"count": 1, "completed": 0}))
+        apply_event(state, submit)
+        apply_event(state, snatch)
+        self.assertEqual(state, empty_state())
+
+    def test_update_after_reset_leaves_no_orphans(self):
+        for write_behind in (False, True):
+            with self.subTest(write_behind=write_behind):
+                asyncio.run(self._update_after_reset(write_behind))
+
+    async def _update_after_reset(self, write_behind):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Storage(os.path.join(tmp, "test.db"), write_behind=write_behind)
+            await db.open()
+            try:
+                await db.create_player(5, 1, LINK.format(1), 5)
+                await db.create_snow_player(5, 1, LINK.format(2))
+                await db.delete_player(5, 1)
+                await db.delete_snow_player(5, 1)
+
+                await db.update_player_progress(5, 1, 1, False, LINK.format(3))
+                await db.update_snow_progress(5, 1, 1, False, LINK.format(4), (3.0, 0.1, 0.5))
+                await db.flush()
+
+                self.assertIsNone(await db.get_player(5, 1))
+                self.assertIsNone(await db.get_snow_player(5, 1))
+                self.assertFalse(await db.has_submission(5, GAME_ICEBERG, 1, 3))
+                self.assertFalse(await db.has_submission(5, GAME_SNOWFLAKE, 1, 4))
+                self.assertEqual(await db.verify_state(), {})
+                await db.rebuild_state()
+                self.assertIsNone(await db.get_player(5, 1))
+            finally:
+                await db.close()
+
+
+class BulkWriteRaceTest(unittest.TestCase):
+    """handler เข้าคิวงานใหม่ระหว่างที่งานทีละชุดของ admin กำลังเขียน: cache ต้องไม่ค้างแถวเก่า"""
+
+    def test_submit_during_season_reset(self):
+        asyncio.run(self._submit_during_bulk(lambda db: db.reset_season(1, (GAME_ICEBERG,), 1), None))
+
+    def test_submit_during_target_adjust(self):
+        asyncio.run(self._submit_during_bulk(lambda db: db.adjust_targets(1, (GAME_ICEBERG,), value=9), (1, 9, 0)))
+
+    async def _submit_during_bulk(self, bulk, expected):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Storage(os.path.join(tmp, "test.db"), write_behind=True)
+            await db.open()
+            try:
+                await db.create_player(1, 7, LINK.format(1), 5)
+                task = asyncio.create_task(bulk(db))
+                await asyncio.sleep(0)
+                await db.update_player_progress(1, 7, 1, False, LINK.format(2))
+                await task
+                self.assertEqual(await db.get_player(1, 7), expected)
+                await db.flush()
+
+                self.assertEqual(await db.get_player(1, 7), expected)
+                self.assertEqual(await db._load_player(1, 7), expected)
+                self.assertEqual(await db.verify_state(), {})
+            finally:
+                await db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+import heapq
+import itertools
+
+# นาฬิกาปลุกตัวเดียวของทั้งบอท: deadline ทั้งหมดอยู่ใน heap เดียว ตั้ง timer ของ event loop ไว้แค่อันเดียวที่หัว heap
+# ผู้เล่นรอคว้าหิมะพร้อมกันกี่ร้อยคนก็ไม่มี coroutine ค้าง sleep หรือ task รอ timeout ต่อคน
+
+
+class TimerHeap:
+    def __init__(self):
+        self._heap = []                  # [เวลา (loop.time()), ลำดับ, callback, args] callback = None คือถูกยกเลิก
+        self._seq = itertools.count()
+        self._handle = None              # TimerHandle ของ deadline ที่ใกล้ที่สุด
+        self._live = 0
+        self.running = set()             # task ของ callback แบบ async ที่ยังทำงานอยู่
+
+    def __len__(self):
+        return self._live
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(asyncio.get_running_loop().time() + delay, callback, *args)
+
+    def call_at(self, when, callback, *args):
+        """เรียก callback(*args) ตอนถึงเวลา (callback เป็น async ก็ได้ จะรันเป็น task) คืน entry ไว้ยกเลิก"""
+        entry = [when, next(self._seq), callback, args]
+        heapq.heappush(self._heap, entry)
+        self._live += 1
+        if self._heap[0] is entry:
+            self._arm()
+        return entry
+
+    def cancel(self, entry):
+        # ไม่ต้องหาออกจาก heap แค่ทำเครื่องหมายไว้ ถึงเวลาก็ถูกทิ้งเอง
+        if entry is not None and entry[2] is not None:
+            entry[2] = None
+            self._live -= 1
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for entry in self._heap:
+            entry[2] = None
+        self._heap.clear()
+        self._live = 0
+        for task in self.running:
+            task.cancel()
+
+    def _arm(self):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = asyncio.get_running_loop().call_at(self._heap[0][0], self._fire) if self._heap else None
+
+    def _fire(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, callback, args = heapq.heappop(self._heap)
+            if callback is None:
+                continue
+            self._live -= 1
+            try:
+                result = callback(*args)
+            except Exception as e:
+                print(f"timer {callback.__name__} ไม่สำเร็จ: {e}")
+                continue
+            if asyncio.iscoroutine(result):
+                task = loop.create_task(result)
+                self.running.add(task)
+                task.add_done_callback(self._done)
+        self._handle = None
+        if self._heap:
+            self._arm()
+
+    def _done(self, task):
+        self.running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"timer task ไม่สำเร็จ: {task.exception()!r}")